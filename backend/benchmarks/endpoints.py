@@ -0,0 +1,289 @@
+"""Endpoint latency and throughput across dataset sizes, checked against a stored baseline.
+
+For each dataset size it builds (once, then reuses) a database with seed_data.py, copies it to
+a scratch directory and drives the app in-process through httpx's ASGI transport, with no
+network or uvicorn in the way. Every scenario reports throughput plus p50/p95/p99 latency:
+
+    login, read_tickets (first page, status filter, search, cursor page 5), read_ticket_detail,
+    similar_tickets, create_comment, and ws_fanout_<N>: a comment broadcast to N simulated ticket
+    subscribers, timed from the POST until the last subscriber has the message.
+
+Run from backend/:
+    python benchmarks/endpoints.py --sizes 10k                  # compare with baselines/endpoints.json
+    python benchmarks/endpoints.py --sizes 10k,100k,1m --update-baseline
+Exits non-zero, listing every regressed metric, when p95 latency or throughput is worse than the
+baseline by more than --tolerance. Every size's baseline records the host it was measured on (CPU,
+cores, memory, Python and SQLite versions) and the dataset (seed_data.py arguments and a hash of
+the generator). A different dataset is not compared at all; on a different host each scenario is
+compared relative to REFERENCE_SCENARIO measured in the same run, not in absolute terms. Needs httpx.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+
+import httpx
+
+from harness import APP_DIR, summarize, login
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baselines", "endpoints.json")
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DB_FILES = ("database.db", "database.db-wal", "database.db-shm")
+SEARCH_TERMS = ["system", "market", "analysis", "policy", "network", "model"]
+# Cached, SQL-free and similar in every build: on another host, its p95 and throughput set the scale
+REFERENCE_SCENARIO = "read_ticket_detail"
+
+# --- DATASETS ---
+def dataset_args(tickets: int, seed: int) -> list:
+    return [
+        "--tickets", str(tickets), "--users", str(max(12, tickets // 50)),
+        "--comments", str(tickets * 3), "--notifications", str(tickets * 2),
+        "--seed", str(seed), "--anchor", "2026-01-01",
+    ]
+
+def dataset_fingerprint(tickets: int, seed: int) -> dict:
+    # The generator is deterministic, so its arguments and its code pin down the data
+    with open(os.path.join(APP_DIR, "seed_data.py"), "rb") as f:
+        generator = hashlib.sha256(f.read()).hexdigest()[:16]
+    return {"args": dataset_args(tickets, seed), "generator": generator}
+
+def host_fingerprint() -> dict:
+    cpu = platform.processor()
+    if os.path.exists("/proc/cpuinfo"):
+        models = [line.split(":", 1)[1].strip() for line in open("/proc/cpuinfo") if line.startswith("model name")]
+        cpu = models[0] if models else cpu
+    try:
+        memory_gb = round(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**30, 1)
+    except (AttributeError, ValueError, OSError):
+        memory_gb = None
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    return {"cpu": cpu, "cpus": cpus, "memory_gb": memory_gb, "os": f"{platform.system()} {platform.machine()}",
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version}
+
+def prepare_dataset(label: str, seed: int) -> tuple:
+    """Seeds data/<label>/seed once per dataset fingerprint, then returns a fresh scratch copy
+    (and the fingerprint), so runs that post comments never drift the dataset the next run measures."""
+    seed_dir, run_dir = os.path.join(DATA_DIR, label, "seed"), os.path.join(DATA_DIR, label, "run")
+    fingerprint = dataset_fingerprint(SIZES[label], seed)
+    marker = os.path.join(seed_dir, "dataset.json")
+    if not os.path.exists(marker) or json.load(open(marker)) != fingerprint:
+        shutil.rmtree(seed_dir, ignore_errors=True)
+        os.makedirs(seed_dir)
+        print(f"🌱 Building {label} dataset (one-off)...")
+        subprocess.run([sys.executable, os.path.join(APP_DIR, "seed_data.py"), *fingerprint["args"]], cwd=seed_dir, check=True)
+        json.dump(fingerprint, open(marker, "w"))
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    for name in DB_FILES:
+        if os.path.exists(os.path.join(seed_dir, name)):
+            shutil.copyfile(os.path.join(seed_dir, name), os.path.join(run_dir, name))
+    return run_dir, fingerprint
+
+# --- SCENARIOS (run inside the dataset's directory, see run_dataset) ---
+async def drive(make_request, requests: int, concurrency: int, warmup: int) -> dict:
+    """Fires `requests` calls of make_request(i) from `concurrency` workers."""
+    for i in range(warmup):
+        await make_request(i)
+    latencies, errors, counter = [], [0], iter(range(requests))
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            ok = await make_request(i)
+            latencies.append(time.perf_counter() - started)
+            if not ok: errors[0] += 1
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"requests": requests, "concurrency": concurrency, "errors": errors[0],
+            "throughput_rps": round(requests / elapsed, 1), **summarize(latencies)}
+
+class SimulatedSubscriber:
+    """Stands in for a browser socket in a ticket room; records when each message lands."""
+
+    def __init__(self):
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload: str):
+        self.received.append(time.perf_counter())
+
+    async def close(self, code: int = 1000):
+        pass
+
+async def ws_fanout(main, client, headers, ticket_id: str, subscribers: int, messages: int) -> dict:
+    subs = [SimulatedSubscriber() for _ in range(subscribers)]
+    for sub in subs:
+        await main.manager.connect_ticket(sub, ticket_id)
+    complete, deliveries, started_at = [], [], time.perf_counter()
+    try:
+        for i in range(messages):
+            started = time.perf_counter()
+            r = await client.post(f"/tickets/{ticket_id}/comments", headers=headers, json={"content": f"fan-out {i}"})
+            r.raise_for_status()
+            while any(len(sub.received) <= i for sub in subs):
+                await asyncio.sleep(0)
+            arrivals = [sub.received[i] - started for sub in subs]
+            deliveries.extend(arrivals)
+            complete.append(max(arrivals))
+    finally:
+        for sub in subs:
+            main.manager.disconnect_ticket(sub, ticket_id)
+    elapsed = time.perf_counter() - started_at
+    return {"requests": messages, "subscribers": subscribers, "errors": 0,
+            "throughput_rps": round(messages / elapsed, 1),
+            "deliveries_per_sec": round(messages * subscribers / elapsed, 1),
+            **summarize(complete), "delivery": summarize(deliveries)}
+
+async def run_scenarios(args) -> dict:
+    sys.path.insert(0, APP_DIR)
+    import main
+    rng = random.Random(args.seed)
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            headers = await login(client)
+            ticket_ids = [t["id"] for t in (await client.get("/tickets", params={"limit": 200}, headers=headers)).json()["items"]]
+            page = (await client.get("/tickets", params={"limit": 50}, headers=headers)).json()
+            for _ in range(3):
+                page = (await client.get("/tickets", params={"limit": 50, "cursor": page["next_cursor"]}, headers=headers)).json()
+            deep_cursor = page["next_cursor"]
+
+            async def ok(request):
+                r = await request
+                return r.status_code == 200
+
+            scenarios = {
+                "login": lambda i: ok(client.post("/login", json={"username": "intern", "password": "123"})),
+                "read_tickets": lambda i: ok(client.get("/tickets", params={"limit": 50}, headers=headers)),
+                "read_tickets_status": lambda i: ok(client.get("/tickets", params={"limit": 50, "status": "open"}, headers=headers)),
+                "read_tickets_search": lambda i: ok(client.get("/tickets", params={"limit": 50, "q": rng.choice(SEARCH_TERMS)}, headers=headers)),
+                "read_tickets_page5": lambda i: ok(client.get("/tickets", params={"limit": 50, "cursor": deep_cursor}, headers=headers)),
+                "read_ticket_detail": lambda i: ok(client.get(f"/tickets/{rng.choice(ticket_ids)}", headers=headers)),
+                "similar_tickets": lambda i: ok(client.post("/tickets/similar", headers=headers, json={
+                    "title": f"{rng.choice(SEARCH_TERMS)} {rng.choice(SEARCH_TERMS)} keeps failing",
+                    "description": "Started after the last deploy, every request times out.", "tags": "deployment"})),
+                "create_comment": lambda i: ok(client.post(f"/tickets/{rng.choice(ticket_ids)}/comments", headers=headers, json={"content": f"benchmark {i}"})),
+            }
+            for name, make_request in scenarios.items():
+                results[name] = await drive(make_request, args.requests, args.concurrency, args.warmup)
+            for subscribers in args.subscribers:
+                name = f"ws_fanout_{subscribers}"
+                results[name] = await ws_fanout(main, client, headers, ticket_ids[0], subscribers, args.messages)
+    return results
+
+# --- BASELINE ---
+# results and baselines: {size label: {"host": ..., "dataset": ..., "scenarios": {name: metrics}}}
+def compare(results: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    regressions = []
+    for label, run in results.items():
+        base_run = baseline.get(label)
+        if not base_run or "scenarios" not in base_run:
+            print(f"⚠️  No baseline for {label}; skipping comparison")
+            continue
+        if base_run["dataset"] != run["dataset"]:
+            regressions.append(f"{label}: the baseline was measured on another dataset ({base_run['dataset']}); "
+                               f"record a new one with --update-baseline")
+            continue
+        scenarios, base_scenarios = run["scenarios"], base_run["scenarios"]
+        # Same host: absolute numbers. Another host: the baseline scaled by how REFERENCE_SCENARIO
+        # compares between the two runs, i.e. each scenario's ratio to it must hold
+        latency_scale = throughput_scale = 1.0
+        other_host = base_run["host"] != run["host"]
+        if other_host:
+            reference, base_reference = scenarios.get(REFERENCE_SCENARIO), base_scenarios.get(REFERENCE_SCENARIO)
+            if not reference or not base_reference:
+                regressions.append(f"{label}: the baseline is from another host ({base_run['host']}) and "
+                                   f"{REFERENCE_SCENARIO} is missing to compare against")
+                continue
+            latency_scale = reference["p95_ms"] / base_reference["p95_ms"]
+            throughput_scale = reference["throughput_rps"] / base_reference["throughput_rps"]
+            print(f"⚠️  {label}: baseline from another host ({base_run['host']}); comparing relative to "
+                  f"{REFERENCE_SCENARIO} (p95 x{latency_scale:.2f}, throughput x{throughput_scale:.2f})")
+        for name, current in scenarios.items():
+            base = base_scenarios.get(name)
+            if not base: continue
+            if not (other_host and name == REFERENCE_SCENARIO):  # it holds its own ratio by definition
+                expected_p95 = base["p95_ms"] * latency_scale
+                if current["p95_ms"] > expected_p95 * (1 + tolerance) + slack_ms:
+                    regressions.append(f"{label}/{name}: p95 {current['p95_ms']} ms vs baseline {expected_p95:.2f} ms")
+                expected_rps = base["throughput_rps"] * throughput_scale
+                if current["throughput_rps"] < expected_rps * (1 - tolerance):
+                    regressions.append(f"{label}/{name}: throughput {current['throughput_rps']} req/s vs baseline {expected_rps:.1f} req/s")
+            if current["errors"] > base.get("errors", 0):
+                regressions.append(f"{label}/{name}: {current['errors']} failed requests vs {base.get('errors', 0)}")
+    return regressions
+
+def run_dataset(label: str, args) -> dict:
+    # main binds its database path at import, so each dataset gets its own process and cwd
+    run_dir, dataset = prepare_dataset(label, args.seed)
+    out = os.path.join(run_dir, "results.json")
+    print(f"⏱️  {label} ({SIZES[label]:,} tickets)")
+    # The app's own logging ([WS] connect lines etc.) goes to run/app.log, not the report
+    with open(os.path.join(run_dir, "app.log"), "w") as log:
+        subprocess.run([
+            sys.executable, os.path.abspath(__file__), "--scenarios-only", out,
+            "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--warmup", str(args.warmup),
+            "--messages", str(args.messages), "--subscribers", ",".join(map(str, args.subscribers)), "--seed", str(args.seed),
+        ], cwd=run_dir, check=True, stdout=log, env={**os.environ, "DEVEX_RATE_LIMITS": "off"})
+    scenarios = json.load(open(out))
+    for name, r in scenarios.items():
+        print(f"   {name:<22} {r['throughput_rps']:>8} req/s  p50 {r['p50_ms']:>8} ms  p95 {r['p95_ms']:>8} ms  p99 {r['p99_ms']:>8} ms")
+    return {"host": host_fingerprint(), "dataset": dataset, "scenarios": scenarios}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k", help=f"Comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--requests", type=int, default=300, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=50, help="Broadcasts per fan-out scenario")
+    parser.add_argument("--subscribers", default="100,500", help="Fan-out room sizes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(DATA_DIR, "endpoints-results.json"))
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.30, help="Allowed relative slowdown before failing")
+    parser.add_argument("--slack-ms", type=float, default=1.0, help="Absolute p95 slack, so sub-ms scenarios don't flap")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--scenarios-only", metavar="RESULT_FILE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.subscribers = [int(n) for n in args.subscribers.split(",") if n]
+
+    if args.scenarios_only:
+        results = asyncio.run(run_scenarios(args))
+        json.dump(results, open(args.scenarios_only, "w"), indent=2)
+        return
+
+    labels = [label.strip().lower() for label in args.sizes.split(",")]
+    unknown = [label for label in labels if label not in SIZES]
+    if unknown: parser.error(f"unknown sizes: {', '.join(unknown)}")
+    results = {label: run_dataset(label, args) for label in labels}
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    json.dump(results, open(args.output, "w"), indent=2)
+    print(f"📄 Results written to {args.output}")
+
+    baseline = json.load(open(args.baseline)) if os.path.exists(args.baseline) else {}
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        json.dump({**baseline, **results}, open(args.baseline, "w"), indent=2)
+        print(f"📌 Baseline updated: {args.baseline}")
+        return
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+    if regressions:
+        raise SystemExit("❌ Performance regression against baseline:\n  " + "\n  ".join(regressions))
+    print("✅ No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
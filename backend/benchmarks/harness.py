@@ -0,0 +1,53 @@
+"""Shared helpers for the benchmark scripts: booting the API under uvicorn and summarizing latencies."""
+import asyncio
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    if not samples: return {"samples": 0}
+    def pct(p): return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+    return {"samples": len(samples), "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": pct(1.0)}
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/leaderboard")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+async def login(client: httpx.AsyncClient, username: str = "boss", password: str = "123") -> dict:
+    r = await client.post("/login", json={"username": username, "password": password})
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+@contextlib.contextmanager
+def uvicorn_server(app_dir: str = APP_DIR, port: int = 0, workers: int = 1, env: dict = None):
+    """Run `uvicorn main:app` from app_dir for the duration of the block; yields the base URL."""
+    port = port or free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        # One benchmark user posts far faster than any person: measure the writer, not the rate limiter
+        cwd=app_dir, stdout=subprocess.DEVNULL, env={**os.environ, "DEVEX_RATE_LIMITS": "off", **(env or {})},
+    )
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,159 @@
+"""Similar-ticket suggestions: index build time, recall against exact TF-IDF cosine, query latency.
+
+Builds a similarity.py index over the tickets of a database without starting the app. Then, for
+--queries random tickets, it drafts a near-duplicate (the title and tags plus a shuffled part of
+the description) and answers it the way POST /tickets/similar does: the --candidates nearest
+signatures, re-scored by cosine, keeping the top k that score at least --min-score. It reports:
+
+    recall_at_k          overlap with brute-force cosine over every ticket (same cut-off)
+    source_ranked_first  how often the ticket the draft came from is the top suggestion
+    duplicates_found     after --duplicates more drafts of each source are indexed, the share of
+                         source + drafts among the top k (k is raised to fit them)
+
+--pad-to then appends random signatures so the scan can be timed at a larger size.
+
+Run from backend/ against a seeded database (python seed_data.py):
+    python benchmarks/similar_tickets.py --db database.db --pad-to 1000000
+Needs NumPy.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from similarity import SimilarityIndex, FEATURE_BUCKETS, ID_DTYPE, WORDS, terms
+from harness import summarize
+
+def ticket_batches(db: str, size: int = 10000):
+    def batches():
+        conn = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+        rows = conn.execute("SELECT id, title, description, tags FROM ticket ORDER BY id")
+        while batch := rows.fetchmany(size):
+            yield batch
+        conn.close()
+    return batches
+
+def draft(rng: random.Random, title: str, description: str, tags: str):
+    # What someone filing the same problem again might write
+    sentences = [s for s in description.split(". ") if s]
+    kept = rng.sample(sentences, max(1, len(sentences) // 2)) if sentences else []
+    return title, ". ".join(kept), tags
+
+def exact_vectors(index: SimilarityIndex, batches):
+    """Every ticket's text, plus all their unit TF-IDF vectors in CSR form for brute-force scoring."""
+    ids, starts, indices, data, docs = [], [], [], [], {}
+    for batch in batches():
+        counts = [terms(*row[1:]) for row in batch]
+        buckets, weights, at = index.flatten(counts)
+        norms = np.sqrt(np.add.reduceat(weights * weights, at))
+        starts.append(at + sum(map(len, indices)))
+        indices.append(buckets)
+        data.append(weights / np.maximum(np.repeat(norms, np.diff(np.append(at, len(buckets)))), 1e-9))
+        ids += [row[0] for row in batch]
+        docs.update((row[0], row[1:]) for row in batch)
+    return ids, np.concatenate(starts), np.concatenate(indices), np.concatenate(data), docs
+
+def top_exact(index: SimilarityIndex, counts: dict, ids, starts, indices, data, k: int, min_score: float) -> list:
+    query = np.zeros(FEATURE_BUCKETS, np.float32)
+    buckets, weights, _ = index.flatten([counts])
+    query[buckets] = weights / np.linalg.norm(weights)
+    scores = np.add.reduceat(data * query[indices], starts)
+    return [ids[i] for i in np.argsort(-scores, kind="stable")[:k] if scores[i] >= min_score]
+
+def pad(index: SimilarityIndex, size: int):
+    extra = size - len(index.ids)
+    if extra <= 0: return
+    rng = np.random.default_rng(0)
+    index.ids = np.concatenate([index.ids, np.array([f"pad-{i}" for i in range(extra)], ID_DTYPE)])
+    index.sigs = np.concatenate([index.sigs, rng.integers(0, 2**63, (WORDS, extra), dtype=np.uint64)], axis=1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="database.db")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=50, help="Signatures re-scored per query (SIMILARITY_CANDIDATES)")
+    parser.add_argument("--min-score", type=float, default=0.3, help="Lowest cosine suggested (SIMILARITY_MIN_SCORE)")
+    parser.add_argument("--duplicates", type=int, default=4, help="Extra drafts of each query's source to index")
+    parser.add_argument("--pad-to", type=int, default=0, help="Pad the index with random signatures up to this many before timing")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    batches = ticket_batches(args.db)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SimilarityIndex(os.path.join(tmp, "similarity.idx"))
+        started = time.perf_counter()
+        index.build(batches)
+        build_seconds = time.perf_counter() - started
+        index_bytes = os.path.getsize(index.path)
+        ids, starts, indices, data, docs = exact_vectors(index, batches)
+
+        rng = random.Random(args.seed)
+        conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+        sources = rng.sample(ids, min(args.queries, len(ids)))
+        queries = []
+        for ticket_id in sources:
+            row = conn.execute("SELECT title, description, tags FROM ticket WHERE id = ?", (ticket_id,)).fetchone()
+            queries.append((ticket_id, terms(*draft(rng, *row))))
+
+        def suggest(counts: dict, k: int) -> list:
+            candidates = index.nearest(counts, args.candidates)
+            # Like the app, which reads the candidates' current text back from the database
+            scored = zip(index.scores(counts, [terms(*docs[c]) for c in candidates]).tolist(), candidates)
+            return [c for score, c in sorted(scored, key=lambda s: (-s[0], s[1])) if score >= args.min_score][:k]
+
+        recall, first, scan, answer = [], 0, [], []
+        for ticket_id, counts in queries:
+            started = time.perf_counter()
+            index.nearest(counts, args.candidates)
+            scan.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            ranked = suggest(counts, args.k)
+            answer.append(time.perf_counter() - started)
+            expected = top_exact(index, counts, ids, starts, indices, data, args.k, args.min_score)
+            if expected: recall.append(len(set(ranked) & set(expected)) / len(expected))
+            first += ranked[:1] == [ticket_id]
+
+        found = []
+        if args.duplicates:
+            planted = {}
+            for ticket_id, _ in queries:
+                row = conn.execute("SELECT title, description, tags FROM ticket WHERE id = ?", (ticket_id,)).fetchone()
+                planted[ticket_id] = {ticket_id}
+                for i in range(args.duplicates):
+                    copy_id, copy = f"{ticket_id[:30]}-dup{i}", draft(rng, *row)
+                    index.add(copy_id, *copy)
+                    docs[copy_id] = copy
+                    planted[ticket_id].add(copy_id)
+            for ticket_id, counts in queries:
+                group = planted[ticket_id]
+                found.append(len(group & set(suggest(counts, max(args.k, len(group))))) / len(group))
+
+        padded = {}
+        if args.pad_to:
+            pad(index, args.pad_to)
+            times = []
+            for _, counts in queries:
+                started = time.perf_counter()
+                index.nearest(counts, args.candidates)
+                times.append(time.perf_counter() - started)
+            padded = {"size": len(index.ids), "scan": summarize(times)}
+
+    print(json.dumps({
+        "tickets": len(ids), "build_seconds": round(build_seconds, 1), "index_mb": round(index_bytes / 2**20, 1),
+        "queries": len(queries), "k": args.k, "candidates": args.candidates,
+        "min_score": args.min_score, f"recall_at_{args.k}": round(sum(recall) / len(recall), 3) if recall else None,
+        "source_ranked_first": round(first / len(queries), 3),
+        "duplicates_found": round(sum(found) / len(found), 3) if found else None,
+        "scan": summarize(scan), "scan_and_rescore": summarize(answer), "padded": padded,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
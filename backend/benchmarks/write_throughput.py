@@ -0,0 +1,64 @@
+"""Write throughput under concurrent writers.
+
+Boots the API under uvicorn and has many clients create tickets, post comments and resolve
+tickets at the same time, which all update reputation too. It reports committed writes/sec,
+latency percentiles and how many requests failed (for example with "database is locked").
+
+Run from backend/ against a seeded database (python seed_data.py):
+    python benchmarks/write_throughput.py --clients 32 --seconds 10
+Needs httpx.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from harness import APP_DIR, summarize, wait_until_up, login, uvicorn_server
+
+async def client_loop(client: httpx.AsyncClient, headers: dict, ticket_ids: list, stop: asyncio.Event, stats: dict):
+    while not stop.is_set():
+        kind = random.choice(["ticket", "comment", "comment", "solve"])
+        started = time.perf_counter()
+        if kind == "ticket":
+            r = await client.post("/tickets", headers=headers, json={
+                "title": "Benchmark ticket", "description": "Created by write_throughput.py",
+                "priority": "low", "tags": "benchmark"})
+        elif kind == "comment":
+            r = await client.post(f"/tickets/{random.choice(ticket_ids)}/comments", headers=headers, json={"content": "benchmark comment"})
+        else:
+            r = await client.patch(f"/tickets/{random.choice(ticket_ids)}", headers=headers, json={"status": "solved"})
+        stats["latencies"].append(time.perf_counter() - started)
+        stats["ok" if r.status_code == 200 else "failed"] += 1
+
+async def run(base_url: str, args) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        await wait_until_up(client)
+        headers = await login(client, args.username, args.password)
+        ticket_ids = [t["id"] for t in (await client.get("/tickets", params={"limit": 200})).json()["items"]]
+        stats, stop = {"ok": 0, "failed": 0, "latencies": []}, asyncio.Event()
+        tasks = [asyncio.create_task(client_loop(client, headers, ticket_ids, stop, stats)) for _ in range(args.clients)]
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+    return {
+        "clients": args.clients, "seconds": args.seconds,
+        "writes_per_sec": round(stats["ok"] / args.seconds, 1), "failed_requests": stats["failed"],
+        "latency": summarize(stats["latencies"]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", default=APP_DIR)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--username", default="boss")
+    parser.add_argument("--password", default="123")
+    args = parser.parse_args()
+    with uvicorn_server(args.app_dir) as base_url:
+        print(json.dumps(asyncio.run(run(base_url, args)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""WebSocket latency while comments are being posted concurrently.
+
+Boots the API under uvicorn on a spare port, holds probe sockets open on one ticket room and
+measures WebSocket ping/pong round trips. The server's event loop answers the pings, so any time
+the loop spends blocked on database or file I/O shows up directly as ping latency. Latency is
+sampled first with the server idle, then while writer clients post comments as fast as they can.
+
+Run from backend/ against a seeded database (python seed_data.py):
+    python benchmarks/ws_latency.py --writers 16 --seconds 10
+Needs httpx and websockets.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+import websockets
+
+from harness import APP_DIR, summarize, wait_until_up, login, uvicorn_server
+
+async def probe(ws_url: str, samples: list, stop: asyncio.Event, interval: float):
+    async with websockets.connect(ws_url) as ws:
+        while not stop.is_set():
+            started = time.perf_counter()
+            await (await ws.ping())
+            samples.append(time.perf_counter() - started)
+            await asyncio.sleep(interval)
+
+async def writer(client: httpx.AsyncClient, headers: dict, ticket_ids: list, stop: asyncio.Event, counter: list):
+    while not stop.is_set():
+        ticket_id = random.choice(ticket_ids)
+        r = await client.post(f"/tickets/{ticket_id}/comments", json={"content": "benchmark comment"}, headers=headers)
+        if r.status_code == 200:
+            counter[0] += 1
+        else:
+            counter[1] += 1
+
+async def phase(base_url: str, ws_url: str, probes: int, seconds: float, writers: int, headers: dict, ticket_ids: list):
+    samples, counter, stop = [], [0, 0], asyncio.Event()
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        tasks = [asyncio.create_task(probe(ws_url, samples, stop, 0.05)) for _ in range(probes)]
+        tasks += [asyncio.create_task(writer(client, headers, ticket_ids, stop, counter)) for _ in range(writers)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+    result = summarize(samples)
+    if writers:
+        result["comments_per_sec"] = round(counter[0] / seconds, 1)
+        result["failed_requests"] = counter[1]
+    return result
+
+async def run(base_url: str, args) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await wait_until_up(client)
+        headers = await login(client, args.username, args.password)
+        tickets = (await client.get("/tickets", params={"limit": 200})).json()["items"]
+    # Probes sit in a room nobody writes to; writers hit every other ticket
+    probe_room, ticket_ids = tickets[0]["id"], [t["id"] for t in tickets[1:]]
+    ws_url = base_url.replace("http", "ws") + f"/ws/ticket/{probe_room}"
+    idle = await phase(base_url, ws_url, args.probes, args.seconds, 0, headers, ticket_ids)
+    load = await phase(base_url, ws_url, args.probes, args.seconds, args.writers, headers, ticket_ids)
+    return {"probes": args.probes, "writers": args.writers, "seconds": args.seconds, "idle": idle, "under_load": load}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", default=APP_DIR)
+    parser.add_argument("--probes", type=int, default=20)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--username", default="boss")
+    parser.add_argument("--password", default="123")
+    args = parser.parse_args()
+    with uvicorn_server(args.app_dir) as base_url:
+        print(json.dumps(asyncio.run(run(base_url, args)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Image derivative rendering. Runs inside ProcessPoolExecutor workers, so it only depends on
+Pillow and the standard library and never imports the app itself. Pillow is imported lazily so
+the app can still import this module (for variant_path) when Pillow isn't installed."""
+import os
+
+# variant name -> (max width/height in px, WebP quality)
+VARIANTS = {
+    "thumb": (480, 75),
+    "preview": (1600, 82),
+}
+
+def variant_path(original_path: str, variant: str) -> str:
+    # Derivatives live next to the original blob: <sha256>.thumb.webp, <sha256>.preview.webp
+    return f"{original_path}.{variant}.webp"
+
+def render_derivatives(original_path: str) -> list:
+    """Write every variant of the image at original_path; returns the variant names written."""
+    from PIL import Image, ImageOps
+    with Image.open(original_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        for variant, (max_size, quality) in VARIANTS.items():
+            derivative = image.copy()
+            derivative.thumbnail((max_size, max_size), Image.LANCZOS)
+            target = variant_path(original_path, variant)
+            tmp_path = f"{target}.tmp"
+            derivative.save(tmp_path, "WEBP", quality=quality, method=4)
+            os.replace(tmp_path, target)
+    return list(VARIANTS)
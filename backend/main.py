@@ -1,102 +1,1372 @@
-from datetime import datetime, timedelta
-from fastapi import FastAPI, HTTPException, Depends, status, Query, WebSocket, WebSocketDisconnect, UploadFile, File
+from datetime import date, datetime, timedelta, timezone
+from fastapi import FastAPI, HTTPException, Depends, status, Query, Request, WebSocket, WebSocketDisconnect, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.staticfiles import StaticFiles
-from sqlmodel import SQLModel, Field, Session, select, create_engine, Relationship, or_
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.routing import Match
+from sqlmodel import SQLModel, Field, Session, select, update, delete, create_engine, Relationship, or_, and_
+from sqlalchemy import text, column, literal_column, bindparam, literal, inspect, tuple_, union_all, Index, Table, Column, func, event, false
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from pydantic import TypeAdapter
+from email.utils import format_datetime, parsedate_to_datetime
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from enum import Enum
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Union
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from imaging import render_derivatives, variant_path, VARIANTS
 from jose import JWTError, jwt
 import uuid
-import shutil
+import base64
+import hashlib
+import hmac
+import copy
+import csv
+import io
+import contextvars
+import multiprocessing
+import importlib.util
 import os
+import re
 import json
+import math
+import time
+import asyncio
+import bisect
+import queue
+import sqlite3
+import threading
 
 # --- CONFIGURATION ---
 SECRET_KEY = "super_secret_key_change_me_in_production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+AUTH_CACHE_SIZE = 4096
+AUTH_CACHE_TTL_SECONDS = 60
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+LEADERBOARD_SIZE = 10
+# Extra entries kept in memory so users leaving the top N can be replaced without a reload
+LEADERBOARD_SLACK = 40
+LEADERBOARD_REFRESH_SECONDS = 30
+LEADERBOARD_WINDOW_CACHE_SECONDS = 60
+# Ledger reason of a user's opening balance (seed_data.py): not activity, so no window counts it
+OPENING_BALANCE_REASON = "seed"
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_COMPACT_BATCH = 5000
+# Serialized ticket detail / comment thread responses kept in memory (LRU), dropped on write
+RESPONSE_CACHE_SIZE = 2048
+# Tickets per server-side cursor batch in admin exports (their comments are fetched per batch)
+EXPORT_CHUNK_SIZE = 500
+# Most ids accepted by one bulk request (each becomes a bound parameter of an IN list)
+BULK_MAX_IDS = 5000
+# A search page first reads SEARCH_GROWTH pages' worth of the best documents of each kind, then
+# SEARCH_GROWTH times more while filters or repeat hits leave it short. Filters that leave at most
+# SEARCH_MAX_CANDIDATES tickets rank just their documents; past that many reads, every match is
+# ranked against the filtered tickets instead
+SEARCH_GROWTH = 4
+SEARCH_MAX_CANDIDATES = 5000
+# Tag facet entries returned by /tickets/facets (most-used first)
+FACET_TAG_LIMIT = 50
+TAG_REBUILD_BATCH = 10000
+# Longest created/solved series /tickets/stats returns
+STATS_MAX_DAYS = 365
+# WebSocket fan-out: every socket gets its own bounded outbound queue and writer task
+WS_QUEUE_SIZE = 256
+WS_SEND_TIMEOUT_SECONDS = 5.0
+# What to do when a socket's queue is full: "disconnect" evicts the slow client,
+# "drop_oldest" discards its oldest pending message and keeps it connected.
+WS_SLOW_CONSUMER_POLICY = "disconnect"
+WS_LATENCY_SAMPLES = 512
+# Resumable ticket streams: each worker keeps the last WS_REPLAY_BUFFER messages of up to
+# WS_REPLAY_ROOMS tickets for clients reconnecting with ?last_seq=; larger gaps are replayed
+# from the comment table, WS_REPLAY_PAGE_SIZE rows per query
+WS_REPLAY_BUFFER = 256
+WS_REPLAY_ROOMS = 1024
+WS_REPLAY_PAGE_SIZE = 100
+# Pub/sub backend under the ConnectionManager. "local" only reaches sockets on this process;
+# "sqlite" fans out across every worker/container that shares BROKER_DB_FILE.
+BROKER_BACKEND = os.getenv("DEVEX_BROKER", "local")
+# Processes serving the app (uvicorn --workers); WEB_CONCURRENCY is uvicorn's own default for it.
+# With several and the local broker, per-process caches can't hear about the others' writes,
+# so cached ticket responses are revalidated and users aren't cached (see AuthCache).
+WORKERS = int(os.getenv("DEVEX_WORKERS", os.getenv("WEB_CONCURRENCY", "1")))
+CACHES_NEED_REVALIDATION = BROKER_BACKEND == "local" and WORKERS > 1
+BROKER_DB_FILE = os.getenv("DEVEX_BROKER_DB", "broker.db")
+BROKER_POLL_SECONDS = 0.05
+BROKER_RETENTION_SECONDS = 300
+# Attachments are stored once per unique content, named by SHA-256
+PUBLIC_BASE_URL = "http://localhost:8000"
+ATTACHMENT_DIR = "attachments"
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# Request body allowance on top of the file for the multipart framing (boundaries, part headers)
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Uploads whose bytes are one of these image types are shown inline; everything else (HTML, SVG,
+# PDF...) is served as an opaque download, so nothing uploaded can run as a page on this origin
+INLINE_IMAGE_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+# Thumbnail/WebP derivatives for image attachments (needs Pillow; skipped without it)
+DERIVATIVES_ENABLED = importlib.util.find_spec("PIL") is not None
+DERIVATIVE_WORKERS = 2
+DERIVATIVE_MAX_ATTEMPTS = 3
+DERIVATIVE_CLAIM_TIMEOUT_SECONDS = 600
+DERIVATIVE_IMAGE_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp", "image/bmp", "image/tiff"}
+# Similar-ticket suggestions (needs NumPy; disabled without it). A SimHash signature of every
+# ticket lives in SIMILARITY_FILE, memory-mapped at startup. The SIMILARITY_CANDIDATES nearest to a
+# draft are re-scored by TF-IDF cosine; those scoring at least SIMILARITY_MIN_SCORE are suggested.
+# New signatures are kept in memory and merged into the file every SIMILARITY_SAVE_EVERY tickets.
+SIMILARITY_ENABLED = importlib.util.find_spec("numpy") is not None
+SIMILARITY_FILE = "similarity.idx"
+SIMILARITY_CANDIDATES = 50
+SIMILARITY_MIN_SCORE = 0.3
+SIMILARITY_SAVE_EVERY = 1000
+SIMILARITY_BUILD_BATCH = 10000
+# created_at is stamped before the write commits, so catching up re-reads this far back
+SIMILARITY_CATCH_UP_SLACK_SECONDS = 60
+# Suggestions look for tickets created by other processes at most this often
+SIMILARITY_CATCH_UP_INTERVAL_SECONDS = 1.0
+SIMILAR_DEFAULT_LIMIT = 5
+SIMILAR_MAX_LIMIT = 20
+# Outbox: side effects of comment writes (notifications, WebSocket messages) are delivered by a
+# background dispatcher, OUTBOX_BATCH_SIZE events per claim. Failed batches are retried with
+# exponential backoff (OUTBOX_RETRY_BASE_SECONDS doubling, capped) up to OUTBOX_MAX_ATTEMPTS.
+OUTBOX_BATCH_SIZE = 200
+OUTBOX_POLL_SECONDS = 1.0
+OUTBOX_CLAIM_TIMEOUT_SECONDS = 60
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BASE_SECONDS = 1.0
+OUTBOX_RETRY_MAX_SECONDS = 300
+# Admission control for the write routes scripts tend to burst. Each caller (user, or client
+# address when anonymous) gets a token bucket per route class: (tokens per second, burst).
+# Admitted requests then share WRITE_MAX_IN_FLIGHT slots; up to WRITE_MAX_WAITING more wait
+# at most WRITE_ADMISSION_WAIT_SECONDS for one. Everything else gets a 429 with Retry-After.
+# DEVEX_RATE_LIMITS=off disables the buckets (benchmarks), never the in-flight cap.
+ADMISSION_ROUTES = {("POST", "/tickets"): "ticket", ("POST", "/tickets/{ticket_id}/comments"): "comment", ("POST", "/upload"): "upload"}
+RATE_LIMITS_ENABLED = os.getenv("DEVEX_RATE_LIMITS", "on") != "off"
+RATE_LIMITS = {"ticket": (0.5, 10), "comment": (2.0, 30), "upload": (1.0, 20)}
+RATE_LIMIT_KEYS = 10000
+WRITE_MAX_IN_FLIGHT = 32
+WRITE_MAX_WAITING = 128
+WRITE_ADMISSION_WAIT_SECONDS = 2.0
+# Request metrics (served on /metrics). A request over either budget is logged with [PERF]; 0 disables.
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+METRICS_ROOM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500, 1000)
+# /metrics is for admins, or for a scraper sending "Authorization: Bearer <DEVEX_METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("DEVEX_METRICS_TOKEN")
+PERF_LATENCY_BUDGET_MS = float(os.getenv("DEVEX_PERF_LATENCY_BUDGET_MS", "500"))
+PERF_QUERY_BUDGET = int(os.getenv("DEVEX_PERF_QUERY_BUDGET", "25"))
 SQLITE_FILE_NAME = "database.db"
 SQLITE_URL = f"sqlite:///{SQLITE_FILE_NAME}"
+ASYNC_SQLITE_URL = f"sqlite+aiosqlite:///{SQLITE_FILE_NAME}"
+# Cold storage: solved tickets older than ARCHIVE_AFTER_DAYS (by solved_at) are moved, with their
+# comments, tag links and read notifications, into ARCHIVE_FILE_NAME, ARCHIVE_BATCH tickets per
+# write transaction. The file is attached to every connection as schema ARCHIVE_SCHEMA.
+ARCHIVE_FILE_NAME = "archive.db"
+ARCHIVE_SCHEMA = "archive"
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_BATCH = 500
+# Production SQLite settings, applied to every pooled connection
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",          # readers never block the writer and vice versa
+    "synchronous": "NORMAL",        # safe with WAL; fsync at checkpoints instead of every commit
+    "busy_timeout": 5000,           # wait up to 5s for a lock instead of failing immediately
+    "cache_size": -64000,           # 64 MB page cache per connection
+    "mmap_size": 268435456,         # 256 MB memory-mapped reads
+    "temp_store": "MEMORY",
+}
+SQLITE_READ_POOL_SIZE = 16
+SQLITE_READ_POOL_OVERFLOW = 16
+# Upper bound on how many queued write jobs share one transaction (group commit)
+WRITE_BATCH_SIZE = 64
 
 # --- DATABASE SETUP ---
-engine = create_engine(SQLITE_URL, echo=False)
+engine = create_engine(SQLITE_URL, echo=False, pool_size=SQLITE_READ_POOL_SIZE, max_overflow=SQLITE_READ_POOL_OVERFLOW)
+# Used by async routes so database round trips never run on the event loop thread
+async_engine = create_async_engine(ASYNC_SQLITE_URL, echo=False, pool_size=SQLITE_READ_POOL_SIZE, max_overflow=SQLITE_READ_POOL_OVERFLOW)
+# Single connection owned by the WriteQueue thread (see below)
+write_engine = create_engine(SQLITE_URL, echo=False, pool_size=1, max_overflow=0)
+
+def apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def attach_archive(dbapi_connection, connection_record):
+    # Unqualified table names still resolve to main; archive tables are always qualified
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"ATTACH DATABASE '{ARCHIVE_FILE_NAME}' AS {ARCHIVE_SCHEMA}")
+    for name in ("journal_mode", "synchronous"):
+        cursor.execute(f"PRAGMA {ARCHIVE_SCHEMA}.{name}={SQLITE_PRAGMAS[name]}")
+    cursor.close()
+
+for pooled_engine in (engine, async_engine.sync_engine, write_engine):
+    event.listen(pooled_engine, "connect", apply_pragmas)
+    event.listen(pooled_engine, "connect", attach_archive)
+
+# pysqlite's implicit transaction handling breaks SAVEPOINT; the writer manages BEGIN itself,
+# and takes the write lock up front (IMMEDIATE) so it can never fail half-way on lock upgrade.
+@event.listens_for(write_engine, "connect")
+def disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+@event.listens_for(write_engine, "begin")
+def begin_immediate(conn):
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+async def get_async_session():
+    # expire_on_commit=False: reading attributes after commit must not trigger implicit (sync) IO
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+# --- SQLITE WRITER ---
+class WriteQueue:
+    """Serializes every write through one thread and one connection, so SQLite never sees
+    competing writers. Jobs are callables taking a Session. Whatever queues up while a
+    transaction commits is run together in the next one (group commit), each job inside
+    its own SAVEPOINT so a failing job (e.g. a 404) never rolls back its neighbours."""
+
+    def __init__(self, engine, max_batch: int):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.jobs: queue.Queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.counters = {"jobs": 0, "transactions": 0, "failed_commits": 0}
+
+    def submit(self, job) -> Future:
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self.thread.start()
+        future = Future()
+        # Carry the caller's context so the job's SQL is counted against the request that queued it
+        self.jobs.put((job, future, contextvars.copy_context()))
+        return future
+
+    def run_sync(self, job):
+        # For sync routes (already off the event loop, in the threadpool)
+        return self.submit(job).result()
+
+    async def run(self, job):
+        return await asyncio.wrap_future(self.submit(job))
+
+    def stop(self):
+        if self.thread and self.thread.is_alive():
+            self.jobs.put(None)
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            batch = [self.jobs.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch = [item for item in batch if item is not None]
+                if batch: self._commit(batch)
+                return
+            self._commit(batch)
+
+    @staticmethod
+    def _run_job(job, session: Session):
+        with session.begin_nested():
+            return job(session)
+
+    def _commit(self, batch: list):
+        outcomes = []
+        with Session(self.engine, expire_on_commit=False) as session:
+            for job, future, context in batch:
+                # Post-commit hooks are queued in session.info; drop those of a job that rolled back
+                info = copy.deepcopy(session.info)
+                try:
+                    outcomes.append((future, context.run(self._run_job, job, session), None))
+                except Exception as e:
+                    session.info.clear()
+                    session.info.update(info)
+                    outcomes.append((future, None, e))
+            try:
+                session.commit()
+            except Exception as e:
+                self.counters["failed_commits"] += 1
+                outcomes = [(future, None, error or e) for future, _, error in outcomes]
+        self.counters["jobs"] += len(batch)
+        self.counters["transactions"] += 1
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+write_queue = WriteQueue(write_engine, WRITE_BATCH_SIZE)
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    create_missing_columns()
+    create_comment_sequences()
+    create_missing_indexes()
+    # Before the hot derived data: their first-run rebuilds fill the archive's share too
+    create_archive()
+    create_search_index()
+    create_counters()
+    create_tag_index()
+    create_ticket_stats()
+
+def create_missing_columns():
+    # Lightweight migration: create_all() doesn't alter existing tables either. Only nullable
+    # or defaulted columns can be added this way, which is all a new field may be.
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {c["name"] for c in inspect(conn).get_columns(table.name, schema=table.schema)}
+            name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+            for col in table.columns:
+                if col.name not in existing:
+                    conn.execute(text(f'ALTER TABLE {name} ADD COLUMN "{col.name}" {col.type.compile(dialect=conn.dialect)}'))
+
+def create_comment_sequences():
+    # Comments from before comment.seq existed (or bulk-loaded by the seed) are numbered per
+    # ticket in thread order. New comments always get a seq, so checking the oldest row is enough.
+    # One pass over the table: per ticket, base is the highest seq already assigned and n counts the
+    # unnumbered rows so far in thread order, both from window aggregates.
+    with engine.connect() as conn:
+        oldest = conn.execute(text("SELECT seq FROM comment ORDER BY rowid LIMIT 1")).first()
+    if oldest is None or oldest.seq is not None: return
+    print("🔢 Numbering comment streams...")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE comment SET seq = numbered.base + numbered.n FROM (
+                SELECT c.rowid AS rid, c.seq AS old,
+                       sum(c.seq IS NULL) OVER (PARTITION BY c.ticket_id ORDER BY c.created_at, c.id
+                                                ROWS UNBOUNDED PRECEDING) AS n,
+                       coalesce(max(c.seq) OVER (PARTITION BY c.ticket_id), 0) AS base
+                FROM comment c
+            ) AS numbered WHERE comment.rowid = numbered.rid AND numbered.old IS NULL
+        """))
+
+def create_missing_indexes():
+    # create_all() skips tables that already exist, including any index added to them later.
+    # Indexes of ours (ix_*) the models no longer declare are dropped, so the planner can't pick them.
+    for table in SQLModel.metadata.sorted_tables:
+        declared = {index.name for index in table.indexes}
+        schema = table.schema or "main"
+        with engine.begin() as conn:
+            for index in inspect(conn).get_indexes(table.name, schema=table.schema):
+                if index["name"].startswith("ix_") and index["name"] not in declared:
+                    conn.execute(text(f'DROP INDEX "{schema}"."{index["name"]}"'))
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+# --- FULL-TEXT SEARCH (FTS5) ---
+# External-content FTS5 tables over ticket and comment. Triggers keep them in sync
+# with every write to the base tables, so routes never have to touch the index.
+# The index rows are keyed on the base tables' implicit rowid. Both tables have TEXT primary
+# keys, so VACUUM may renumber those rowids and leave every hit pointing at the wrong row, with
+# no error: never run a bare VACUUM, use vacuum_databases() (manage.py vacuum), which rebuilds.
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS ticket_fts USING fts5(title, description, tags, content='ticket', content_rowid='rowid')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS comment_fts USING fts5(content, content='comment', content_rowid='rowid')",
+    """CREATE TRIGGER IF NOT EXISTS ticket_fts_ai AFTER INSERT ON ticket BEGIN
+        INSERT INTO ticket_fts(rowid, title, description, tags) VALUES (new.rowid, new.title, new.description, new.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS ticket_fts_ad AFTER DELETE ON ticket BEGIN
+        INSERT INTO ticket_fts(ticket_fts, rowid, title, description, tags) VALUES ('delete', old.rowid, old.title, old.description, old.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS ticket_fts_au AFTER UPDATE OF title, description, tags ON ticket BEGIN
+        INSERT INTO ticket_fts(ticket_fts, rowid, title, description, tags) VALUES ('delete', old.rowid, old.title, old.description, old.tags);
+        INSERT INTO ticket_fts(rowid, title, description, tags) VALUES (new.rowid, new.title, new.description, new.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_ai AFTER INSERT ON comment BEGIN
+        INSERT INTO comment_fts(rowid, content) VALUES (new.rowid, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_ad AFTER DELETE ON comment BEGIN
+        INSERT INTO comment_fts(comment_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_au AFTER UPDATE OF content ON comment BEGIN
+        INSERT INTO comment_fts(comment_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        INSERT INTO comment_fts(rowid, content) VALUES (new.rowid, new.content);
+    END""",
+]
+
+# Column weights for bm25(): title > tags > description. Comment hits rank below ticket hits.
+TICKET_FTS_WEIGHTS = "10.0, 3.0, 6.0"
+COMMENT_FTS_WEIGHT = 0.5
+SNIPPET_TOKENS = 12
+
+def create_search_index():
+    is_new = "ticket_fts" not in inspect(engine).get_table_names()
+    with engine.begin() as conn:
+        for ddl in SEARCH_DDL:
+            conn.execute(text(ddl))
+    if is_new:
+        rebuild_search_index()
+
+def rebuild_search_index():
+    with engine.begin() as conn:
+        for schema in ("main", ARCHIVE_SCHEMA):
+            for index in ("ticket_fts", "comment_fts"):
+                conn.execute(text(f"INSERT INTO {schema}.{index}({index}) VALUES ('rebuild')"))
+                conn.execute(text(f"INSERT INTO {schema}.{index}({index}) VALUES ('optimize')"))
+
+def vacuum_databases():
+    # VACUUM can't run inside a transaction; the search index must follow the renumbered rowids
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for schema in ("main", ARCHIVE_SCHEMA):
+            conn.execute(text(f"VACUUM {schema}"))
+    rebuild_search_index()
+
+def fts_query(q: str) -> Optional[str]:
+    # Quote every term so user input can't inject FTS syntax; prefix-match the terms
+    # so search-as-you-type keeps working on partial words.
+    terms = re.findall(r"\w+", q)
+    if not terms: return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+def search_hits(match: str, schema: str = "main", snippets: bool = True):
+    # One row per matching ticket: its best bm25 rank (lower is better) and the snippet
+    # of the best-matching document, whether that was the ticket itself or a comment.
+    # schema picks the hot tables or the archive's, which have an index of their own.
+    # Without snippets, rows name the best document instead (kind and rowid, see FTS_DOCS).
+    if snippets:
+        ticket_best = f"snippet(ticket_fts, -1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet"
+        comment_best = f"snippet(comment_fts, 0, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet"
+        best = ["snippet"]
+    else:
+        ticket_best, comment_best, best = "'ticket' AS kind, ticket_fts.rowid AS doc", "'comment' AS kind, comment_fts.rowid AS doc", ["kind", "doc"]
+    return text(f"""
+        SELECT ticket_id, min(rank) AS rank, {", ".join(best)} FROM (
+            SELECT t.id AS ticket_id,
+                   bm25(ticket_fts, {TICKET_FTS_WEIGHTS}) AS rank,
+                   {ticket_best}
+            FROM {schema}.ticket_fts JOIN {schema}.ticket t ON t.rowid = ticket_fts.rowid
+            WHERE ticket_fts MATCH :match
+            UNION ALL
+            SELECT c.ticket_id,
+                   bm25(comment_fts) * {COMMENT_FTS_WEIGHT} AS rank,
+                   {comment_best}
+            FROM {schema}.comment_fts JOIN {schema}.comment c ON c.rowid = comment_fts.rowid
+            WHERE comment_fts MATCH :match
+        ) GROUP BY ticket_id
+    """).bindparams(match=match).columns(column("ticket_id"), column("rank"), *map(column, best)).subquery("hits")
+
+# search_hits() ranks, snippets and groups every match, which is what facets and exports need.
+# A page of results (search_page) instead works per kind of document with the helpers below:
+# the best few by rank, straight from the index, then ranks and snippets of listed documents.
+FTS_DOCS = {
+    # kind: (index, rank expression, snippet column)
+    "ticket": ("ticket_fts", f"bm25(ticket_fts, {TICKET_FTS_WEIGHTS})", -1),
+    "comment": ("comment_fts", f"bm25(comment_fts) * {COMMENT_FTS_WEIGHT}", 0),
+}
+
+def best_docs(session: Session, match: str, schema: str, kind: str, limit: Optional[int], min_rank: Optional[float]) -> list:
+    """[(rowid, rank)] of the `limit` best matching documents ranked at least min_rank, best
+    first. Ranked inside the index: the base table is only read for the rows that survive."""
+    index, rank, _ = FTS_DOCS[kind]
+    sql = f"SELECT rowid AS doc, {rank} AS rank FROM {schema}.{index} WHERE {index} MATCH :match"
+    params = {"match": match}
+    if min_rank is not None:
+        sql += f" AND {rank} >= :min_rank"
+        params["min_rank"] = min_rank
+    sql += " ORDER BY rank"
+    if limit:
+        sql += " LIMIT :limit"
+        params["limit"] = limit
+    return session.execute(text(sql), params).all()
+
+def listed_docs(session: Session, match: str, schema: str, kind: str, rowids, snippets: bool = False) -> dict:
+    """rowid -> rank (or snippet) of those listed documents that match. The unary + keeps the
+    rowid list away from FTS5, which would seek every rowid through the (prefix-expanded)
+    match; one pass over the matches with the list as a filter is far cheaper."""
+    if not rowids: return {}
+    index, rank, snippet_column = FTS_DOCS[kind]
+    value = f"snippet({index}, {snippet_column}, '<mark>', '</mark>', '…', {SNIPPET_TOKENS})" if snippets else rank
+    query = text(f"SELECT rowid, {value} FROM {schema}.{index} WHERE {index} MATCH :match AND +rowid IN :rowids")
+    return dict(session.execute(query.bindparams(bindparam("rowids", expanding=True)), {"match": match, "rowids": list(rowids)}).all())
+
+# --- DERIVED COUNTERS ---
+# Per-user unread notification counts and per-(status, priority) ticket counts, maintained by
+# triggers in the same transaction as the write, so the bell and the unfiltered facets read a
+# handful of rows instead of counting whole tables.
+COUNTER_TABLES = ("notification_counter", "ticket_counter")
+NOTIFICATION_COUNTER_DDL = [
+    "CREATE TABLE IF NOT EXISTS notification_counter (user_id VARCHAR PRIMARY KEY, unread INTEGER NOT NULL DEFAULT 0)",
+    """CREATE TRIGGER IF NOT EXISTS notification_counter_ai AFTER INSERT ON notification WHEN NOT new.is_read BEGIN
+        INSERT INTO notification_counter(user_id, unread) VALUES (new.recipient_id, 1)
+        ON CONFLICT(user_id) DO UPDATE SET unread = unread + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notification_counter_ad AFTER DELETE ON notification WHEN NOT old.is_read BEGIN
+        UPDATE notification_counter SET unread = unread - 1 WHERE user_id = old.recipient_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notification_counter_au AFTER UPDATE OF is_read ON notification WHEN old.is_read != new.is_read BEGIN
+        INSERT INTO notification_counter(user_id, unread) VALUES (new.recipient_id, CASE WHEN new.is_read THEN -1 ELSE 1 END)
+        ON CONFLICT(user_id) DO UPDATE SET unread = unread + excluded.unread;
+    END""",
+]
+TICKET_COUNTER_DDL = [
+    """CREATE TABLE IF NOT EXISTS ticket_counter (
+        status VARCHAR NOT NULL, priority VARCHAR NOT NULL, tickets INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (status, priority)
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS ticket_counter_ai AFTER INSERT ON ticket BEGIN
+        INSERT INTO ticket_counter(status, priority, tickets) VALUES (new.status, new.priority, 1)
+        ON CONFLICT(status, priority) DO UPDATE SET tickets = tickets + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS ticket_counter_ad AFTER DELETE ON ticket BEGIN
+        UPDATE ticket_counter SET tickets = tickets - 1 WHERE status = old.status AND priority = old.priority;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS ticket_counter_au AFTER UPDATE OF status, priority ON ticket
+    WHEN old.status != new.status OR old.priority != new.priority BEGIN
+        UPDATE ticket_counter SET tickets = tickets - 1 WHERE status = old.status AND priority = old.priority;
+        INSERT INTO ticket_counter(status, priority, tickets) VALUES (new.status, new.priority, 1)
+        ON CONFLICT(status, priority) DO UPDATE SET tickets = tickets + 1;
+    END""",
+]
+COUNTER_DDL = NOTIFICATION_COUNTER_DDL + TICKET_COUNTER_DDL
+
+def create_counters():
+    existing = inspect(engine).get_table_names()
+    is_new = any(table not in existing for table in COUNTER_TABLES)
+    with engine.begin() as conn:
+        for ddl in COUNTER_DDL:
+            conn.execute(text(ddl))
+    if is_new:
+        rebuild_counters()
+
+def rebuild_counters():
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM notification_counter"))
+        conn.execute(text("""
+            INSERT INTO notification_counter(user_id, unread)
+            SELECT recipient_id, count(*) FROM notification WHERE NOT is_read GROUP BY recipient_id
+        """))
+        for schema in ("main", ARCHIVE_SCHEMA):
+            conn.execute(text(f"DELETE FROM {schema}.ticket_counter"))
+            conn.execute(text(f"""
+                INSERT INTO {schema}.ticket_counter(status, priority, tickets)
+                SELECT status, priority, count(*) FROM {schema}.ticket GROUP BY status, priority
+            """))
+
+# --- TAG INDEX ---
+# ticket.tags stays the display string; tag/tickettag are the normalized index the tag
+# filter and facets query. Write paths call set_ticket_tags() next to the column update.
+# tag_counter holds tickets per (tag, status, priority), maintained by triggers on the links
+# and on status/priority changes, so tag facets under status/priority filters are row reads.
+TAG_DDL = [
+    """CREATE TABLE IF NOT EXISTS tag_counter (
+        tag_id INTEGER NOT NULL, status VARCHAR NOT NULL, priority VARCHAR NOT NULL, tickets INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (tag_id, status, priority)
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tag_counter_link_ai AFTER INSERT ON tickettag BEGIN
+        INSERT INTO tag_counter(tag_id, status, priority, tickets)
+        SELECT new.tag_id, status, priority, 1 FROM ticket WHERE id = new.ticket_id
+        ON CONFLICT(tag_id, status, priority) DO UPDATE SET tickets = tickets + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_counter_link_ad AFTER DELETE ON tickettag BEGIN
+        UPDATE tag_counter SET tickets = tickets - 1
+        WHERE (tag_id, status, priority) = (SELECT old.tag_id, status, priority FROM ticket WHERE id = old.ticket_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tag_counter_ticket_au AFTER UPDATE OF status, priority ON ticket
+    WHEN old.status != new.status OR old.priority != new.priority BEGIN
+        UPDATE tag_counter SET tickets = tickets - 1
+        WHERE status = old.status AND priority = old.priority AND tag_id IN (SELECT tag_id FROM tickettag WHERE ticket_id = old.id);
+        INSERT INTO tag_counter(tag_id, status, priority, tickets)
+        SELECT tag_id, new.status, new.priority, 1 FROM tickettag WHERE ticket_id = new.id
+        ON CONFLICT(tag_id, status, priority) DO UPDATE SET tickets = tickets + 1;
+    END""",
+]
+
+def parse_tags(tags: Optional[str]) -> List[str]:
+    # "Python, docker,,python " -> ["python", "docker"]
+    names = (name.strip().lower() for name in (tags or "").split(","))
+    return list(dict.fromkeys(name for name in names if name))
+
+def create_tag_index():
+    # Migration: a database from before the tag tables has tagged tickets but no links yet.
+    # Built before the triggers exist, so the bulk load doesn't pay for them row by row.
+    with engine.connect() as conn:
+        unmigrated = (conn.execute(select(TicketTag.ticket_id).limit(1)).first() is None
+                      and conn.execute(select(Ticket.id).where(Ticket.tags != "").limit(1)).first() is not None)
+    if unmigrated:
+        print("🏷️  Building tag index from ticket.tags...")
+        rebuild_tag_index()
+    with engine.begin() as conn:
+        for ddl in TAG_DDL:
+            conn.execute(text(ddl))
+
+def rebuild_tag_index():
+    with engine.begin() as conn:
+        conn.execute(text(TAG_DDL[0]))
+        conn.execute(delete(TicketTag))
+        tag_ids = dict(conn.execute(select(Tag.name, Tag.id)).all())
+        last = ""
+        while True:
+            # Keyset batches over the primary key: no cursor left open while inserting
+            rows = conn.execute(select(Ticket.id, Ticket.tags).where(Ticket.id > last).order_by(Ticket.id).limit(TAG_REBUILD_BATCH)).all()
+            if not rows: break
+            links = []
+            for ticket_id, tags in rows:
+                for name in parse_tags(tags):
+                    if name not in tag_ids:
+                        tag_ids[name] = conn.execute(Tag.__table__.insert().values(name=name)).inserted_primary_key[0]
+                    links.append({"ticket_id": ticket_id, "tag_id": tag_ids[name]})
+            if links: conn.execute(TicketTag.__table__.insert(), links)
+            last = rows[-1].id
+        conn.execute(text("DELETE FROM tag_counter"))
+        conn.execute(text("""
+            INSERT INTO tag_counter(tag_id, status, priority, tickets)
+            SELECT l.tag_id, t.status, t.priority, count(*) FROM tickettag l JOIN ticket t ON t.id = l.ticket_id
+            GROUP BY l.tag_id, t.status, t.priority
+        """))
+
+def set_ticket_tags(session: Session, ticket_ids: List[str], names: List[str]):
+    """Replaces the tag links of these tickets with `names` (already parsed)."""
+    session.exec(delete(TicketTag).where(TicketTag.ticket_id.in_(ticket_ids)))
+    if not names: return
+    session.exec(sqlite_insert(Tag).values([{"name": name} for name in names]).on_conflict_do_nothing(index_elements=["name"]))
+    tag_ids = session.exec(select(Tag.id).where(Tag.name.in_(names))).all()
+    # executemany: a bulk update can link thousands of tickets, past SQLite's bound-variable limit
+    session.execute(TicketTag.__table__.insert(), [{"ticket_id": t, "tag_id": g} for t in ticket_ids for g in tag_ids])
+
+def tag_filter(names: List[str], mode: "TagMatch", correlated: bool = True, tables: Optional[dict] = None):
+    """Ticket clause for the tag filter. Correlated probes of the (ticket_id, tag_id) key suit a
+    keyset page, which stops once it has enough rows; aggregates over the whole match (facets)
+    want the uncorrelated form, which starts from the tag's tickets via ix_tickettag_tag_id_ticket_id.
+    tables is HOT (the default) or ARCHIVED; tag names and ids always live in main."""
+    tickets, links = (tables or HOT)[Ticket], (tables or HOT)[TicketTag]
+    tag_ids = select(Tag.id).where(Tag.name.in_(names))
+    if not correlated:
+        tagged = select(links.c.ticket_id).where(links.c.tag_id.in_(tag_ids))
+        if mode == TagMatch.ALL: tagged = tagged.group_by(links.c.ticket_id).having(func.count() == len(names))
+        return tickets.c.id.in_(tagged)
+    def probe(tag_ids):
+        return select(links.c.ticket_id).where(links.c.ticket_id == tickets.c.id, links.c.tag_id.in_(tag_ids)).exists()
+    if mode == TagMatch.ALL: return and_(*(probe(select(Tag.id).where(Tag.name == name)) for name in names))
+    return probe(tag_ids)
+
+# --- TICKET STATS ---
+# Dashboard aggregates, maintained by triggers in the same transaction as every ticket write
+# (create, update, bulk update, delete, owner removal). Scope '*' is every ticket; the other
+# scopes are owner ids, for a user's own dashboard. Totals per status/priority for '*' are
+# ticket_counter; per owner they are owner_ticket_counter.
+ALL_OWNERS = "*"
+STATS_TABLES = ("ticket_daily_stats", "owner_ticket_counter")
+SOLVE_SECONDS = "(julianday({row}.solved_at) - julianday({row}.created_at)) * 86400"
+
+def daily_contributions(row: str, sign: str = "", source: str = "") -> str:
+    """What one ticket row adds to ticket_daily_stats (a created count on its creation day, a
+    solved count and solve time on its solve day), for its owner and for '*'."""
+    solved = f"{row}.status = 'SOLVED' AND {row}.solved_at IS NOT NULL"
+    seconds = SOLVE_SECONDS.format(row=row)
+    return f"""
+        SELECT '{ALL_OWNERS}' AS scope, date({row}.created_at) AS day, {sign}1 AS created, 0 AS solved, 0.0 AS solve_seconds {source}
+        UNION ALL SELECT {row}.owner_id, date({row}.created_at), {sign}1, 0, 0.0 {source} WHERE {row}.owner_id IS NOT NULL
+        UNION ALL SELECT '{ALL_OWNERS}', date({row}.solved_at), 0, {sign}1, {sign}({seconds}) {source} WHERE {solved}
+        UNION ALL SELECT {row}.owner_id, date({row}.solved_at), 0, {sign}1, {sign}({seconds}) {source} WHERE {solved} AND {row}.owner_id IS NOT NULL
+    """
+
+def stats_delta(row: str, sign: str) -> str:
+    return f"""
+        INSERT INTO ticket_daily_stats(scope, day, created, solved, solve_seconds)
+        SELECT * FROM ({daily_contributions(row, sign)}) WHERE true
+        ON CONFLICT(scope, day) DO UPDATE SET created = created + excluded.created,
+            solved = solved + excluded.solved, solve_seconds = solve_seconds + excluded.solve_seconds;
+        INSERT INTO owner_ticket_counter(owner_id, status, priority, tickets)
+        SELECT {row}.owner_id, {row}.status, {row}.priority, {sign}1 WHERE {row}.owner_id IS NOT NULL
+        ON CONFLICT(owner_id, status, priority) DO UPDATE SET tickets = tickets + excluded.tickets;
+    """
+
+STATS_DDL = [
+    """CREATE TABLE IF NOT EXISTS ticket_daily_stats (
+        scope VARCHAR NOT NULL, day DATE NOT NULL,
+        created INTEGER NOT NULL DEFAULT 0, solved INTEGER NOT NULL DEFAULT 0, solve_seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, day)
+    )""",
+    """CREATE TABLE IF NOT EXISTS owner_ticket_counter (
+        owner_id VARCHAR NOT NULL, status VARCHAR NOT NULL, priority VARCHAR NOT NULL, tickets INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (owner_id, status, priority)
+    )""",
+    f"CREATE TRIGGER IF NOT EXISTS ticket_stats_ai AFTER INSERT ON ticket BEGIN {stats_delta('new', '')} END",
+    f"CREATE TRIGGER IF NOT EXISTS ticket_stats_ad AFTER DELETE ON ticket BEGIN {stats_delta('old', '-')} END",
+    # Take the old row's contribution out and put the new one's in
+    f"""CREATE TRIGGER IF NOT EXISTS ticket_stats_au AFTER UPDATE OF status, priority, owner_id, created_at, solved_at ON ticket
+    WHEN old.status IS NOT new.status OR old.priority IS NOT new.priority OR old.owner_id IS NOT new.owner_id
+      OR old.created_at IS NOT new.created_at OR old.solved_at IS NOT new.solved_at BEGIN
+        {stats_delta('old', '-')}
+        {stats_delta('new', '')}
+    END""",
+]
+
+def create_ticket_stats():
+    existing = inspect(engine).get_table_names()
+    if any(table not in existing for table in STATS_TABLES):
+        # First start with stats: backfill before the triggers exist, so it isn't counted row by row
+        print("📊 Building ticket stats...")
+        rebuild_ticket_stats()
+    with engine.begin() as conn:
+        for ddl in STATS_DDL:
+            conn.execute(text(ddl))
+
+def rebuild_ticket_stats():
+    with engine.begin() as conn:
+        for ddl in STATS_DDL[:2]:
+            conn.execute(text(ddl))
+        # Tickets solved before solved_at existed: their last activity is the best estimate
+        conn.execute(text("""
+            UPDATE ticket SET solved_at = coalesce((SELECT max(c.created_at) FROM comment c WHERE c.ticket_id = ticket.id), created_at)
+            WHERE status = 'SOLVED' AND solved_at IS NULL
+        """))
+        conn.execute(text("UPDATE ticket SET solved_at = NULL WHERE status != 'SOLVED' AND solved_at IS NOT NULL"))
+        # The archive keeps its own share of the stats (see ARCHIVE); readers add the two up
+        for schema in ("main", ARCHIVE_SCHEMA):
+            conn.execute(text(f"DELETE FROM {schema}.ticket_daily_stats"))
+            conn.execute(text(f"""
+                INSERT INTO {schema}.ticket_daily_stats(scope, day, created, solved, solve_seconds)
+                SELECT scope, day, sum(created), sum(solved), sum(solve_seconds)
+                FROM ({daily_contributions("ticket", source=f"FROM {schema}.ticket AS ticket")}) GROUP BY scope, day
+            """))
+            conn.execute(text(f"DELETE FROM {schema}.owner_ticket_counter"))
+            conn.execute(text(f"""
+                INSERT INTO {schema}.owner_ticket_counter(owner_id, status, priority, tickets)
+                SELECT owner_id, status, priority, count(*) FROM {schema}.ticket WHERE owner_id IS NOT NULL GROUP BY owner_id, status, priority
+            """))
+
+# --- ARCHIVE ---
+# The archive database holds the same ticket/comment/tickettag/notification tables (ARCHIVED,
+# declared with the models) plus its own full-text index and its own share of the ticket
+# aggregates, built from the hot DDL. Dashboard stats add main and archive up (all_schemas);
+# the ticket list and its facets stay on main, searches and ticket reads also look in the archive.
+def in_archive(ddl: str) -> str:
+    return ddl.replace("IF NOT EXISTS ", f"IF NOT EXISTS {ARCHIVE_SCHEMA}.", 1)
+
+ARCHIVE_DDL = [in_archive(ddl) for ddl in SEARCH_DDL + TICKET_COUNTER_DDL + STATS_DDL]
+
+def create_archive():
+    # The tables come from create_all(); an archive starts empty, so there is nothing to backfill
+    with engine.begin() as conn:
+        for ddl in ARCHIVE_DDL:
+            conn.execute(text(ddl))
+
+def all_schemas(sql: str) -> str:
+    """`sql` (with a {schema} placeholder) over main and the archive, as one UNION ALL."""
+    return " UNION ALL ".join(sql.format(schema=schema) for schema in ("main", ARCHIVE_SCHEMA))
+
+# --- PUB/SUB BROKER ---
+# Channels are "ticket:<ticket_id>", "user:<user_id>" and "cache:tickets"/"cache:users".
+# Payloads travel pre-serialized so a message is encoded once no matter how many workers and
+# sockets receive it.
+class LocalBroker:
+    """In-process broker: publishing delivers straight to this worker's sockets."""
+
+    def __init__(self):
+        self.deliver = None
+
+    async def start(self, deliver):
+        self.deliver = deliver
+
+    async def stop(self):
+        pass
+
+    async def publish(self, channel: str, payload: str):
+        self.deliver(channel, payload)
+
+class SqliteBroker(LocalBroker):
+    """Cross-process broker over an append-only message log in a shared SQLite file (WAL).
+    Publishers deliver locally right away and append to the log; every worker tails the log
+    and delivers rows written by other workers. Old rows are trimmed after a retention window."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.node_id = uuid.uuid4().hex
+        self.last_id = 0
+        self.task = None
+        # sqlite3 connections are thread-bound, so all log I/O runs on one dedicated thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broker")
+        self.db = None
+
+    def _open(self):
+        self.db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS message_log ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, payload TEXT NOT NULL, "
+            "origin TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.last_id = self.db.execute("SELECT coalesce(max(id), 0) FROM message_log").fetchone()[0]
+
+    def _append(self, channel: str, payload: str):
+        self.db.execute(
+            "INSERT INTO message_log (channel, payload, origin, created_at) VALUES (?, ?, ?, ?)",
+            (channel, payload, self.node_id, time.time()),
+        )
+
+    def _read_new(self) -> list:
+        rows = self.db.execute(
+            "SELECT id, channel, payload, origin FROM message_log WHERE id > ? ORDER BY id LIMIT 1000", (self.last_id,)
+        ).fetchall()
+        if rows: self.last_id = rows[-1][0]
+        return rows
+
+    def _trim(self):
+        self.db.execute("DELETE FROM message_log WHERE created_at < ?", (time.time() - BROKER_RETENTION_SECONDS,))
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        await self._run(self._open)
+        self.task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self.task: self.task.cancel()
+        if self.db: await self._run(self.db.close)
+        self.executor.shutdown(wait=False)
+
+    async def publish(self, channel: str, payload: str):
+        self.deliver(channel, payload)
+        await self._run(self._append, channel, payload)
+
+    async def _tail(self):
+        last_trim = time.monotonic()
+        while True:
+            try:
+                for _, channel, payload, origin in await self._run(self._read_new):
+                    if origin != self.node_id:
+                        self.deliver(channel, payload)
+                if time.monotonic() - last_trim > BROKER_RETENTION_SECONDS:
+                    await self._run(self._trim)
+                    last_trim = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[BROKER] Error reading message log: {e!r}")
+            await asyncio.sleep(BROKER_POLL_SECONDS)
+
+def create_broker():
+    if BROKER_BACKEND == "sqlite":
+        return SqliteBroker(BROKER_DB_FILE)
+    return LocalBroker()
 
 # --- WEBSOCKET MANAGER (MULTI-TAB SUPPORT) ---
-class ConnectionManager:
+class RoomStats:
+    """Delivery counters for one room/channel. Latency is measured from the moment a
+    message is queued for a socket until the send to that socket completes."""
+
+    COUNTERS = ("delivered", "dropped", "evicted", "send_failures")
+
     def __init__(self):
-        # Ticket Chat Rooms: ticket_id -> List[WebSocket]
-        self.ticket_connections: Dict[str, List[WebSocket]] = {}
-        # User Notifications: user_id -> List[WebSocket] (Supports multiple tabs)
-        self.user_connections: Dict[str, List[WebSocket]] = {}
+        self.delivered = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.send_failures = 0
+        self.latencies = deque(maxlen=WS_LATENCY_SAMPLES)
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.latencies)
+        def pct(p): return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3) if samples else None
+        return {
+            "delivered": self.delivered, "dropped": self.dropped,
+            "evicted": self.evicted, "send_failures": self.send_failures,
+            "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": pct(1.0)},
+        }
+
+class ClientConnection:
+    """One socket plus its bounded outbound queue, drained by a dedicated writer task,
+    so a slow client only ever delays itself."""
+
+    def __init__(self, websocket: WebSocket, stats: RoomStats, on_dead, paused: bool = False):
+        self.websocket = websocket
+        self.stats = stats
+        self.on_dead = on_dead
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+        # A resuming client gets its replay first; live messages queue up until resume() is done
+        self.ready = asyncio.Event()
+        if not paused: self.ready.set()
+        self.writer = asyncio.create_task(self.write_loop())
+
+    def offer(self, payload: str) -> bool:
+        """Queue a pre-serialized message without waiting. False means the client is too slow
+        and should be evicted."""
+        item = (payload, time.perf_counter())
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            if WS_SLOW_CONSUMER_POLICY != "drop_oldest":
+                return False
+            self.queue.get_nowait()
+            self.queue.put_nowait(item)
+            self.stats.dropped += 1
+            return True
+
+    async def write_loop(self):
+        await self.ready.wait()
+        while True:
+            payload, queued_at = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(payload), WS_SEND_TIMEOUT_SECONDS)
+            except Exception as e:
+                print(f"[WS] Send failed, dropping connection: {e!r}")
+                self.stats.send_failures += 1
+                self.on_dead(self)
+                return
+            self.stats.delivered += 1
+            self.stats.latencies.append(time.perf_counter() - queued_at)
+
+    def close(self, code: int = 1000):
+        # Also called from the writer itself on send failure, so never cancel the running task
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), WS_SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+
+class ConnectionManager:
+    def __init__(self, broker: LocalBroker):
+        self.broker = broker
+        # Ticket Chat Rooms: ticket_id -> {WebSocket: ClientConnection}
+        self.ticket_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        # User Notifications: user_id -> {WebSocket: ClientConnection} (Supports multiple tabs)
+        self.user_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        self.ticket_stats: Dict[str, RoomStats] = {}
+        self.user_stats: Dict[str, RoomStats] = {}
+        # Counters of rooms that have since emptied, so totals survive the room going away
+        self.retired = {"ticket": dict.fromkeys(RoomStats.COUNTERS, 0), "user": dict.fromkeys(RoomStats.COUNTERS, 0)}
+        # Replay buffers: ticket_id -> [(seq, payload)] sorted by seq, rooms in LRU order
+        self.ticket_history: "OrderedDict[str, list]" = OrderedDict()
+        self.replays = {"buffer": 0, "database": 0, "messages": 0}
+
+    # --- SHARED PLUMBING ---
+    def _add(self, rooms: dict, stats: dict, key: str, websocket: WebSocket, paused: bool = False) -> int:
+        room_stats = stats.setdefault(key, RoomStats())
+        conn = ClientConnection(websocket, room_stats, lambda c: self._evict(rooms, stats, key, c), paused)
+        rooms.setdefault(key, {})[websocket] = conn
+        return len(rooms[key])
+
+    def _remove(self, rooms: dict, stats: dict, key: str, websocket: WebSocket) -> Optional[ClientConnection]:
+        room = rooms.get(key)
+        conn = room.pop(websocket, None) if room is not None else None
+        if room is not None and not room:
+            del rooms[key]
+            room_stats = stats.pop(key, None)
+            if room_stats:
+                retired = self.retired["ticket" if stats is self.ticket_stats else "user"]
+                for name in RoomStats.COUNTERS: retired[name] += getattr(room_stats, name)
+        return conn
+
+    def _evict(self, rooms: dict, stats: dict, key: str, conn: ClientConnection):
+        conn.stats.evicted += 1
+        if self._remove(rooms, stats, key, conn.websocket) is not None:
+            # 1013 = "try again later": the client may reconnect once it catches up
+            conn.close(code=1013)
+
+    def _fan_out(self, rooms: dict, stats: dict, key: str, payload: str) -> int:
+        room = rooms.get(key)
+        if not room: return 0
+        for conn in list(room.values()):
+            if not conn.offer(payload):
+                print(f"[WS] {key}: slow consumer evicted (queue full)")
+                self._evict(rooms, stats, key, conn)
+        return len(room)
+
+    def deliver(self, channel: str, payload: str):
+        # Called by the broker for every message published on any worker
+        kind, _, key = channel.partition(":")
+        if kind == "ticket":
+            self._remember(key, payload)
+            self._fan_out(self.ticket_connections, self.ticket_stats, key, payload)
+        elif kind == "user":
+            if not self._fan_out(self.user_connections, self.user_stats, key, payload) and BROKER_BACKEND == "local":
+                print(f"[WS] User {key} is offline. Notification skipped.")
+        elif channel == "cache:tickets":
+            # Another worker committed ticket writes: drop our cached responses for them
+            response_cache.invalidate(json.loads(payload))
+        elif channel == "cache:users":
+            # ... or changed/deleted users: stop serving their cached rows to get_current_user
+            changed = json.loads(payload)
+            auth_cache.invalidate_users(changed["usernames"])
+            leaderboard.forget(changed["ids"])
+
+    @staticmethod
+    def encode(message: dict) -> str:
+        # Same encoding as send_json
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+    async def publish(self, channel: str, message: dict):
+        # Serialize once per broadcast, not once per socket
+        await self.broker.publish(channel, self.encode(message))
 
     # --- TICKET LOGIC ---
-    async def connect_ticket(self, websocket: WebSocket, ticket_id: str):
+    async def connect_ticket(self, websocket: WebSocket, ticket_id: str, paused: bool = False):
         await websocket.accept()
-        if ticket_id not in self.ticket_connections:
-            self.ticket_connections[ticket_id] = []
-        self.ticket_connections[ticket_id].append(websocket)
-        print(f"[WS] Ticket {ticket_id}: Client connected. Total: {len(self.ticket_connections[ticket_id])}")
+        total = self._add(self.ticket_connections, self.ticket_stats, ticket_id, websocket, paused)
+        print(f"[WS] Ticket {ticket_id}: Client connected. Total: {total}")
+
+    def _remember(self, ticket_id: str, payload: str):
+        seq = json.loads(payload).get("seq")
+        if seq is None: return
+        history = self.ticket_history.get(ticket_id)
+        if history is None:
+            history = self.ticket_history[ticket_id] = []
+            if len(self.ticket_history) > WS_REPLAY_ROOMS: self.ticket_history.popitem(last=False)
+        else:
+            self.ticket_history.move_to_end(ticket_id)
+        # Kept sorted: with several workers, messages for one ticket can arrive out of order
+        at = bisect.bisect_left(history, seq, key=lambda item: item[0])
+        if at < len(history) and history[at][0] == seq: return
+        history.insert(at, (seq, payload))
+        if len(history) > WS_REPLAY_BUFFER: del history[0]
+
+    def buffered_since(self, ticket_id: str, last_seq: int) -> Optional[List[tuple]]:
+        """Buffered messages after last_seq, or None when the buffer can't prove it has all of them."""
+        history = self.ticket_history.get(ticket_id)
+        if not history: return None
+        newer = history[bisect.bisect_right(history, last_seq, key=lambda item: item[0]):]
+        if newer and (newer[0][0] != last_seq + 1 or newer[-1][0] - last_seq != len(newer)): return None
+        return newer
+
+    async def resume_ticket(self, websocket: WebSocket, ticket_id: str, last_seq: int, load_page):
+        """Sends a reconnecting client what it missed after last_seq, then releases its live queue.
+        load_page(ticket_id, after_seq) -> [(seq, payload)] reads up to WS_REPLAY_PAGE_SIZE
+        messages from the database, for gaps the buffer doesn't cover."""
+        missed, source = self.buffered_since(ticket_id, last_seq), "buffer"
+        if missed is None:
+            missed, source = await run_in_threadpool(load_page, ticket_id, last_seq), "database"
+        sent, seq = 0, last_seq
+        while missed:
+            for seq, payload in missed:
+                await asyncio.wait_for(websocket.send_text(payload), WS_SEND_TIMEOUT_SECONDS)
+            sent += len(missed)
+            missed = await run_in_threadpool(load_page, ticket_id, seq) if source == "database" and len(missed) == WS_REPLAY_PAGE_SIZE else None
+        self.replays[source] += 1
+        self.replays["messages"] += sent
+        await websocket.send_text(self.encode({"type": "resumed", "seq": seq, "replayed": sent, "source": source}))
+        conn = self.ticket_connections.get(ticket_id, {}).get(websocket)
+        if conn: conn.ready.set()
+        print(f"[WS] Ticket {ticket_id}: Client resumed after seq {last_seq} ({sent} replayed from {source})")
 
     def disconnect_ticket(self, websocket: WebSocket, ticket_id: str):
-        if ticket_id in self.ticket_connections:
-            if websocket in self.ticket_connections[ticket_id]:
-                self.ticket_connections[ticket_id].remove(websocket)
-                if not self.ticket_connections[ticket_id]:
-                    del self.ticket_connections[ticket_id]
+        conn = self._remove(self.ticket_connections, self.ticket_stats, ticket_id, websocket)
+        if conn: conn.writer.cancel()
         print(f"[WS] Ticket {ticket_id}: Client disconnected.")
 
     async def broadcast_ticket(self, ticket_id: str, message: dict):
-        if ticket_id in self.ticket_connections:
-            # Iterate over a copy to handle disconnects safely
-            for connection in self.ticket_connections[ticket_id][:]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"[WS] Error sending to ticket {ticket_id}: {e}")
-                    # Optionally remove dead connection here if needed
+        await self.publish(f"ticket:{ticket_id}", message)
 
     # --- USER NOTIFICATION LOGIC ---
     async def connect_user(self, websocket: WebSocket, user_id: str):
         await websocket.accept()
-        if user_id not in self.user_connections:
-            self.user_connections[user_id] = []
-        self.user_connections[user_id].append(websocket)
-        print(f"[WS] User {user_id}: Notification channel connected. Total tabs: {len(self.user_connections[user_id])}")
+        total = self._add(self.user_connections, self.user_stats, user_id, websocket)
+        print(f"[WS] User {user_id}: Notification channel connected. Total tabs: {total}")
 
     def disconnect_user(self, websocket: WebSocket, user_id: str):
-        if user_id in self.user_connections:
-            if websocket in self.user_connections[user_id]:
-                self.user_connections[user_id].remove(websocket)
-                if not self.user_connections[user_id]:
-                    del self.user_connections[user_id]
+        conn = self._remove(self.user_connections, self.user_stats, user_id, websocket)
+        if conn: conn.writer.cancel()
         print(f"[WS] User {user_id}: Notification channel disconnected.")
 
     async def send_personal_message(self, user_id: str, message: dict):
-        if user_id in self.user_connections:
-            print(f"[WS] Sending notification to User {user_id} (Active tabs: {len(self.user_connections[user_id])})")
-            # Iterate over a copy of the list [:] to avoid modification errors during iteration
-            for connection in self.user_connections[user_id][:]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"[WS] Error sending to user {user_id}: {e}")
-                    # If sending fails, assume socket is dead and remove it
-                    try:
-                        self.user_connections[user_id].remove(connection)
-                    except ValueError:
-                        pass
-        else:
-            print(f"[WS] User {user_id} is offline. Notification skipped.")
+        # Reaches ALL active tabs for this user, on whichever worker they are connected
+        await self.publish(f"user:{user_id}", message)
+
+    def stats(self) -> dict:
+        return {
+            "tickets": {key: {"sockets": len(self.ticket_connections.get(key, ())), **s.snapshot()} for key, s in self.ticket_stats.items()},
+            "users": {key: {"sockets": len(self.user_connections.get(key, ())), **s.snapshot()} for key, s in self.user_stats.items()},
+            "replays": dict(self.replays, buffered_rooms=len(self.ticket_history)),
+        }
+
+    def totals(self, kind: str) -> dict:
+        live = self.ticket_stats if kind == "ticket" else self.user_stats
+        return {name: self.retired[kind][name] + sum(getattr(s, name) for s in list(live.values())) for name in RoomStats.COUNTERS}
+
+manager = ConnectionManager(create_broker())
+
+# --- METRICS ---
+class QueryStats:
+    """SQL statements issued on behalf of one request (including its write-queue jobs)."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+current_queries: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("current_queries", default=None)
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    queries = current_queries.get()
+    if queries is not None:
+        queries.count += 1
+        queries.seconds += elapsed
 
-manager = ConnectionManager()
+for pooled_engine in (engine, async_engine.sync_engine, write_engine):
+    event.listen(pooled_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(pooled_engine, "after_cursor_execute", after_cursor_execute)
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        out, cumulative = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            out.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        out.append(f"{name}_sum{{{labels}}} {self.sum}")
+        out.append(f"{name}_count{{{labels}}} {self.count}")
+        return out
+
+class RequestMetrics:
+    """Per-route request latency and SQL accounting, rendered in the Prometheus text format.
+    Routes are labelled by their template ("/tickets/{ticket_id}"), never the raw path."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: Dict[tuple, Histogram] = {}
+        self.queries: Dict[tuple, Histogram] = {}
+        self.sql_seconds: Dict[tuple, float] = {}
+        self.responses: Dict[tuple, int] = {}
+
+    def observe(self, method: str, route: str, status_code: int, seconds: float, queries: QueryStats):
+        key = (method, route)
+        with self.lock:
+            self.latency.setdefault(key, Histogram(METRICS_LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(key, Histogram(METRICS_QUERY_BUCKETS)).observe(queries.count)
+            self.sql_seconds[key] = self.sql_seconds.get(key, 0.0) + queries.seconds
+            self.responses[key + (status_code,)] = self.responses.get(key + (status_code,), 0) + 1
+
+    def render(self) -> List[str]:
+        def labels(method, route): return f'method="{method}",route="{route}"'
+        with self.lock:
+            out = ["# HELP devex_http_request_duration_seconds Request latency by route.",
+                   "# TYPE devex_http_request_duration_seconds histogram"]
+            for key, histogram in sorted(self.latency.items()):
+                out += histogram.lines("devex_http_request_duration_seconds", labels(*key))
+            out += ["# HELP devex_http_requests_total Responses by route and status code.",
+                    "# TYPE devex_http_requests_total counter"]
+            for (method, route, code), count in sorted(self.responses.items()):
+                out.append(f'devex_http_requests_total{{{labels(method, route)},status="{code}"}} {count}')
+            out += ["# HELP devex_sql_statements_per_request SQL statements executed per request.",
+                    "# TYPE devex_sql_statements_per_request histogram"]
+            for key, histogram in sorted(self.queries.items()):
+                out += histogram.lines("devex_sql_statements_per_request", labels(*key))
+            out += ["# HELP devex_sql_duration_seconds_total Time spent in SQL statements by route.",
+                    "# TYPE devex_sql_duration_seconds_total counter"]
+            for key, seconds in sorted(self.sql_seconds.items()):
+                out.append(f"devex_sql_duration_seconds_total{{{labels(*key)}}} {seconds}")
+        return out
+
+request_metrics = RequestMetrics()
+
+class MetricsMiddleware:
+    """Times every HTTP request and counts the SQL it runs (plain ASGI, so the query counter
+    set here is inherited by the route, its threadpool work and its write-queue jobs)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        queries, status_code = QueryStats(), [500]
+        token = current_queries.set(queries)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start": status_code[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_queries.reset(token)
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            request_metrics.observe(scope["method"], path, status_code[0], elapsed, queries)
+            over_latency = PERF_LATENCY_BUDGET_MS and elapsed * 1000 > PERF_LATENCY_BUDGET_MS
+            over_queries = PERF_QUERY_BUDGET and queries.count > PERF_QUERY_BUDGET
+            if over_latency or over_queries:
+                print(f"[PERF] {scope['method']} {scope['path']} -> {status_code[0]}: {elapsed * 1000:.1f} ms, "
+                      f"{queries.count} SQL statements ({queries.seconds * 1000:.1f} ms)")
+
+# --- ADMISSION CONTROL ---
+class AdmissionController:
+    """Token buckets per (route class, caller) and a cap on write requests in flight, with a
+    bounded FIFO of requests waiting for a slot. Only touched from the event loop, so no lock."""
+
+    def __init__(self, limits: dict, max_in_flight: int, max_waiting: int, wait_seconds: float, max_keys: int):
+        self.limits = limits
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_seconds = wait_seconds
+        self.max_keys = max_keys
+        self.buckets: OrderedDict = OrderedDict()
+        self.in_flight = 0
+        self.waiters: deque = deque()
+        self.routes = None
+        self.admitted: Dict[str, int] = {}
+        self.rejected: Dict[tuple, int] = {}
+        self.wait_time = Histogram(METRICS_LATENCY_BUCKETS)
+
+    def classify(self, scope) -> Optional[str]:
+        if self.routes is None:
+            self.routes = [(route, ADMISSION_ROUTES[(method, route.path)]) for route in app.router.routes
+                           for method in getattr(route, "methods", None) or () if (method, route.path) in ADMISSION_ROUTES]
+        for route, route_class in self.routes:
+            if route.matches(scope)[0] == Match.FULL:
+                # Lets the metrics middleware label a 429 by route even though routing never ran
+                scope["route"] = route
+                return route_class
+        return None
+
+    def take(self, route_class: str, caller: str) -> float:
+        """Spends a token; returns 0 if there was one, else the seconds until the next."""
+        rate, burst = self.limits[route_class]
+        now, key = time.monotonic(), (route_class, caller)
+        tokens, updated = self.buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+        self.buckets[key] = (tokens - 1 if tokens >= 1 else tokens, now)
+        # An evicted bucket comes back full; the least recently used one has mostly refilled anyway
+        if len(self.buckets) > self.max_keys: self.buckets.popitem(last=False)
+        return wait
+
+    async def acquire(self) -> Optional[str]:
+        """Takes a write slot, waiting in line if need be; returns why not if it can't."""
+        if self.in_flight < self.max_in_flight and not self.waiters:
+            self.in_flight += 1
+            return None
+        if len(self.waiters) >= self.max_waiting: return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.wait_seconds)
+            return None
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # The client went away just as a slot was handed over: pass it on
+            if waiter.done() and not waiter.cancelled(): self.release()
+            raise
+        finally:
+            self.wait_time.observe(time.perf_counter() - started)
+            if waiter in self.waiters: self.waiters.remove(waiter)
+
+    def release(self):
+        # Hand the slot straight to the next waiter, so in_flight never dips and lets a newcomer jump the line
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+admission = AdmissionController(RATE_LIMITS, WRITE_MAX_IN_FLIGHT, WRITE_MAX_WAITING, WRITE_ADMISSION_WAIT_SECONDS, RATE_LIMIT_KEYS)
+
+def admission_caller(scope) -> str:
+    # The bearer token's user when it verifies (cached, no SQL); otherwise the client address
+    scheme, _, token = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            return f"user:{verify_token(token)}"
+        except HTTPException:
+            pass
+    client = scope.get("client")
+    return f"addr:{client[0] if client else 'unknown'}"
+
+class AdmissionMiddleware:
+    """Rejects over-limit write requests with 429 + Retry-After before the route runs (or an
+    upload body is read), instead of letting them pile up behind SQLite's single writer."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route_class = admission.classify(scope) if scope["type"] == "http" and scope["method"] != "GET" else None
+        if route_class is None:
+            return await self.app(scope, receive, send)
+        if RATE_LIMITS_ENABLED:
+            retry_after = admission.take(route_class, admission_caller(scope))
+            if retry_after:
+                return await self.reject(scope, receive, send, route_class, "rate_limited", retry_after)
+        reason = await admission.acquire()
+        if reason:
+            return await self.reject(scope, receive, send, route_class, reason, admission.wait_seconds)
+        admission.admitted[route_class] = admission.admitted.get(route_class, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release()
+
+    @staticmethod
+    async def reject(scope, receive, send, route_class: str, reason: str, retry_after: float):
+        admission.rejected[route_class, reason] = admission.rejected.get((route_class, reason), 0) + 1
+        response = JSONResponse({"detail": "Too many requests, slow down"}, status_code=429,
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+        await response(scope, receive, send)
+
+class UploadLimitMiddleware:
+    """Caps the body of POST /upload before Starlette spools it to disk: a Content-Length over the
+    limit is refused without reading anything, and a body that grows past it (chunked, or longer
+    than declared) fails with 413 at that point. AttachmentStore.save still checks the file exactly."""
+
+    def __init__(self, app, max_file_bytes: int):
+        self.app = app
+        self.max_file_bytes = max_file_bytes
+        self.max_body_bytes = max_file_bytes + UPLOAD_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != "/upload":
+            return await self.app(scope, receive, send)
+        detail = f"File exceeds {self.max_file_bytes} bytes"
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_body_bytes:
+            return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                # FastAPI re-raises an HTTPException from body parsing as is
+                if received > self.max_body_bytes: raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
 
 # --- ENUMS ---
 class UserRole(str, Enum):
@@ -104,6 +1374,19 @@ class UserRole(str, Enum):
     MANAGER = "manager"
     USER = "user"
 
+class LeaderboardWindow(str, Enum):
+    ALL = "all"
+    WEEK = "week"
+    MONTH = "month"
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+class TagMatch(str, Enum):
+    ANY = "any"
+    ALL = "all"
+
 class TicketPriority(str, Enum):
     CRITICAL = "critical"
     HIGH = "high"
@@ -114,6 +1397,12 @@ class TicketStatus(str, Enum):
     OPEN = "open"
     SOLVED = "solved"
 
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
 # --- MODELS ---
 class User(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
@@ -124,7 +1413,7 @@ class User(SQLModel, table=True):
     email: Optional[str] = None
     bio: Optional[str] = None
     is_active: bool = True 
-    reputation: int = Field(default=0)
+    reputation: int = Field(default=0, index=True)
     
     tickets: List["Ticket"] = Relationship(back_populates="owner")
     comments: List["Comment"] = Relationship(back_populates="author")
@@ -138,10 +1427,23 @@ class Ticket(SQLModel, table=True):
     status: TicketStatus = TicketStatus.OPEN
     tags: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Set when the ticket moves to SOLVED, cleared if it is reopened
+    solved_at: Optional[datetime] = None
     owner_id: Optional[str] = Field(default=None, foreign_key="user.id")
     owner: Optional[User] = Relationship(back_populates="tickets")
     comments: List["Comment"] = Relationship(back_populates="ticket")
 
+    __table_args__ = (
+        # Keyset pagination order for the ticket list
+        Index("ix_ticket_created_at_id", "created_at", "id"),
+        # ... and for one owner's tickets (?owner_id=, My Tickets), also what a search narrowed to an owner ranks
+        Index("ix_ticket_owner_id_created_at_id", "owner_id", "created_at", "id"),
+        # Archive candidates in solve order. solved_at is only set on SOLVED tickets, so status needn't
+        # lead: an index starting with status would be picked for the list's ?status= filter and
+        # trade the created_at walk for a sort of every matching ticket
+        Index("ix_ticket_solved_at_id", "solved_at", "id"),
+    )
+
 class Comment(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     content: str
@@ -151,6 +1453,15 @@ class Comment(SQLModel, table=True):
     author: Optional[User] = Relationship(back_populates="comments")
     ticket_id: Optional[str] = Field(default=None, foreign_key="ticket.id")
     ticket: Optional[Ticket] = Relationship(back_populates="comments")
+    # Position in the ticket's WebSocket stream (1, 2, ...): what a reconnecting client resumes from
+    seq: Optional[int] = None
+
+    __table_args__ = (
+        # Keyset pagination order for a ticket's thread
+        Index("ix_comment_ticket_created_at_id", "ticket_id", "created_at", "id"),
+        # Next seq (max + 1) and replay of a stream after a given seq
+        Index("ix_comment_ticket_seq", "ticket_id", "seq", unique=True),
+    )
 
 class Notification(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
@@ -161,6 +1472,96 @@ class Notification(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     recipient: Optional[User] = Relationship(back_populates="notifications")
 
+    __table_args__ = (
+        # Keyset pagination order for a user's inbox
+        Index("ix_notification_recipient_created_at_id", "recipient_id", "created_at", "id"),
+        # Unread-only inbox, bulk mark-read and retention (is_read + created_at range)
+        Index("ix_notification_recipient_is_read_created_at", "recipient_id", "is_read", "created_at"),
+        # Notifications of a ticket (by link), for bulk ticket deletes
+        Index("ix_notification_link", "link"),
+    )
+
+class Attachment(SQLModel, table=True):
+    sha256: str = Field(primary_key=True)
+    size: int
+    content_type: Optional[str] = None
+    extension: str = ""
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class DerivativeJob(SQLModel, table=True):
+    # One row per image attachment; the dispatcher claims PENDING rows (or RUNNING rows whose
+    # worker died) and renders their derivatives in a process pool.
+    sha256: str = Field(primary_key=True, foreign_key="attachment.sha256")
+    status: JobStatus = Field(default=JobStatus.PENDING, index=True)
+    attempts: int = 0
+    error: Optional[str] = None
+    claimed_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class OutboxEvent(SQLModel, table=True):
+    # Written in the same transaction as the change it describes; OutboxDispatcher delivers it
+    # and deletes the row. Rows that exhaust their attempts stay behind as FAILED.
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str
+    payload: str
+    status: JobStatus = JobStatus.PENDING
+    attempts: int = 0
+    available_at: datetime = Field(default_factory=datetime.utcnow)
+    claimed_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+    __table_args__ = (
+        # The dispatcher's claim: due PENDING rows (and stale RUNNING ones) in id order
+        Index("ix_outboxevent_status_available_at", "status", "available_at"),
+        # Notification ids are derived from event ids, so an id must never be reused once the table drains
+        {"sqlite_autoincrement": True},
+    )
+
+class ReputationEvent(SQLModel, table=True):
+    # Append-only ledger: user.reputation is the running sum of these deltas
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: str = Field(foreign_key="user.id", index=True)
+    delta: int
+    reason: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    # Windowed leaderboards scan a created_at range and group by user
+    __table_args__ = (Index("ix_reputationevent_created_at_user_id", "created_at", "user_id"),)
+
+class TicketVersion(SQLModel, table=True):
+    # Bumped by every write that changes how a ticket's detail or comment thread renders.
+    # The "*" row covers changes that can touch any ticket: user profiles, finished thumbnails.
+    ticket_id: str = Field(primary_key=True)
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class Tag(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)
+
+class TicketTag(SQLModel, table=True):
+    ticket_id: str = Field(foreign_key="ticket.id", primary_key=True)
+    tag_id: int = Field(foreign_key="tag.id", primary_key=True)
+
+    # Tickets of a tag (the primary key covers tags of a ticket)
+    __table_args__ = (Index("ix_tickettag_tag_id_ticket_id", "tag_id", "ticket_id"),)
+
+def archive_table(model) -> Table:
+    """The model's table in the archive database: same columns and indexes, no foreign keys
+    (SQLite can't enforce them across database files)."""
+    table = model.__table__
+    return Table(
+        table.name, SQLModel.metadata,
+        *(Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in table.columns),
+        *(Index(index.name, *(c.name for c in index.columns), unique=index.unique) for index in table.indexes),
+        schema=ARCHIVE_SCHEMA,
+    )
+
+# What moves to the archive with a ticket, parents first; queries take either mapping
+ARCHIVE_MODELS = (Ticket, Comment, TicketTag, Notification)
+HOT = {model: model.__table__ for model in ARCHIVE_MODELS}
+ARCHIVED = {model: archive_table(model) for model in ARCHIVE_MODELS}
+
 # --- DTOs ---
 class UserRead(SQLModel):
     id: str
@@ -185,6 +1586,21 @@ class TicketUpdate(SQLModel):
     status: Optional[TicketStatus] = None
     tags: Optional[str] = None
 
+class TicketDraft(SQLModel):
+    # The parts of a TicketCreate that similar-ticket suggestions look at
+    title: str = ""
+    description: str = ""
+    tags: str = ""
+
+class SimilarTicket(SQLModel):
+    id: str
+    title: str
+    status: TicketStatus
+    tags: str
+    created_at: datetime
+    # TF-IDF cosine with the draft, 0..1
+    score: float
+
 class TicketRead(SQLModel):
     id: str
     title: str
@@ -194,8 +1610,10 @@ class TicketRead(SQLModel):
     tags: str
     created_at: datetime
     owner_name: str
-    owner_id: str
+    # None once the owner's account has been deleted
+    owner_id: Optional[str] = None
     owner_email: Optional[str] = None
+    snippet: Optional[str] = None
 
 class CommentCreate(SQLModel):
     content: str
@@ -205,9 +1623,16 @@ class CommentRead(SQLModel):
     id: str
     content: str
     attachment_url: Optional[str] = None
+    # Small WebP renditions of an image attachment, once the background job has produced them
+    attachment_thumb_url: Optional[str] = None
+    attachment_preview_url: Optional[str] = None
     created_at: datetime
     author_name: str
     author_role: str
+    seq: Optional[int] = None
+
+class TicketExport(TicketRead):
+    comments: List[CommentRead] = []
 
 class UserUpdate(SQLModel):
     full_name: Optional[str] = None
@@ -224,7 +1649,13 @@ class Token(SQLModel):
     role: str
 
 class DeleteRequest(SQLModel):
-    ids: List[str]
+    ids: List[str] = Field(max_length=BULK_MAX_IDS)
+
+class TicketBulkUpdate(SQLModel):
+    ids: List[str] = Field(max_length=BULK_MAX_IDS)
+    status: Optional[TicketStatus] = None
+    priority: Optional[TicketPriority] = None
+    tags: Optional[str] = None
 
 class NotificationRead(SQLModel):
     id: str
@@ -233,10 +1664,57 @@ class NotificationRead(SQLModel):
     is_read: bool
     created_at: datetime
 
+# Cursor pages. next_cursor is opaque to clients and is None on the last page.
+class TicketPage(SQLModel):
+    items: List[TicketRead]
+    next_cursor: Optional[str] = None
+
+class CommentPage(SQLModel):
+    items: List[CommentRead]
+    next_cursor: Optional[str] = None
+
+class NotificationPage(SQLModel):
+    items: List[NotificationRead]
+    next_cursor: Optional[str] = None
+
+class TagCount(SQLModel):
+    name: str
+    count: int
+
+class TicketFacets(SQLModel):
+    total: int
+    status: Dict[TicketStatus, int]
+    priority: Dict[TicketPriority, int]
+    tags: List[TagCount]
+
+class DailyTicketStats(SQLModel):
+    day: date
+    created: int
+    solved: int
+    avg_solve_seconds: Optional[float] = None
+
+class TicketStats(SQLModel):
+    total: int
+    status: Dict[TicketStatus, int]
+    priority: Dict[TicketPriority, int]
+    # Over every solved ticket in scope, not just the days below
+    avg_solve_seconds: Optional[float] = None
+    # Oldest first, one entry per day (including empty days) up to today, UTC
+    daily: List[DailyTicketStats]
+
+class MarkReadRequest(SQLModel):
+    # Omitted: mark the whole inbox read
+    ids: Optional[List[str]] = None
+
 # --- APP SETUP ---
 app = FastAPI()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Inside CORS so a 429 still carries the CORS headers the browser needs to read it
+app.add_middleware(AdmissionMiddleware)
+# Likewise for a 413; outside admission, so an oversized upload spends no token and takes no slot
+app.add_middleware(UploadLimitMiddleware, max_file_bytes=MAX_UPLOAD_BYTES)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -245,13 +1723,464 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
+# --- ATTACHMENT STORE ---
+# Leading bytes of the image formats an upload is recognised as (WebP is checked separately)
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"), (b"\xff\xd8\xff", "image/jpeg"), (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"), (b"BM", "image/bmp"), (b"II*\x00", "image/tiff"), (b"MM\x00*", "image/tiff"),
+]
+SNIFF_BYTES = 16
+
+def sniff_content_type(head: bytes) -> str:
+    # From the content only: the client's filename and part Content-Type are not trusted
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP": return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature): return content_type
+    return "application/octet-stream"
+
+def download_headers(content_type: Optional[str], filename: str) -> tuple:
+    """(media type, headers) to serve an upload with: allowed images inline, anything else as a
+    download. nosniff keeps browsers from second-guessing either."""
+    headers = {"X-Content-Type-Options": "nosniff"}
+    if content_type in INLINE_IMAGE_TYPES: return content_type, headers
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return "application/octet-stream", headers
+
+class LegacyUploads(StaticFiles):
+    # Served under the same rules as attachments; these files have no stored type, so sniff them
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        with open(full_path, "rb") as f:
+            media_type, headers = download_headers(sniff_content_type(f.read(SNIFF_BYTES)), os.path.basename(full_path))
+        response.headers.update(headers)
+        if response.status_code != 304: response.headers["content-type"] = media_type
+        return response
+
+# Legacy uploads (random UUID names) stay reachable; new uploads go through the attachment store
 os.makedirs("static", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", LegacyUploads(directory="static"), name="static")
+
+class AttachmentStore:
+    """Content-addressed blob store. Uploads are streamed to a temp file chunk by chunk, off the
+    event loop, and hashed as they go. The finished file is renamed to its SHA-256, so identical
+    uploads are kept on disk exactly once."""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+    def path_for(self, digest: str) -> str:
+        # Two levels of fan-out keep directories small: ab/cd/abcd...
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    @staticmethod
+    def _write_chunk(buffer, hasher, chunk: bytes):
+        hasher.update(chunk)
+        buffer.write(chunk)
+
+    def _commit_blob(self, tmp_path: str, digest: str) -> bool:
+        final_path = self.path_for(digest)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            return False
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+        return True
+
+    async def save(self, upload: UploadFile) -> tuple:
+        """Returns (sha256, size, is_new, content_type), the type sniffed from the first bytes."""
+        if upload.size is not None and upload.size > self.max_bytes:
+            raise HTTPException(status_code=413, detail=f"File exceeds {self.max_bytes} bytes")
+        tmp_path = os.path.join(self.root, "tmp", uuid.uuid4().hex)
+        hasher, size, head = hashlib.sha256(), 0, b""
+        buffer = await run_in_threadpool(open, tmp_path, "wb")
+        try:
+            while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+                if len(head) < SNIFF_BYTES: head += chunk[:SNIFF_BYTES - len(head)]
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File exceeds {self.max_bytes} bytes")
+                await run_in_threadpool(self._write_chunk, buffer, hasher, chunk)
+        except BaseException:
+            await run_in_threadpool(buffer.close)
+            await run_in_threadpool(os.remove, tmp_path)
+            raise
+        await run_in_threadpool(buffer.close)
+        digest = hasher.hexdigest()
+        is_new = await run_in_threadpool(self._commit_blob, tmp_path, digest)
+        return digest, size, is_new, sniff_content_type(head)
+
+attachment_store = AttachmentStore(ATTACHMENT_DIR, MAX_UPLOAD_BYTES)
+
+# --- IMAGE DERIVATIVES ---
+class DerivativePipeline:
+    """Renders thumbnail and WebP derivatives of image attachments in the background. Work
+    items are derivative_job rows, so queued jobs survive restarts; a dispatcher task claims
+    them through the write queue and renders them in a process pool, off the request path."""
+
+    def __init__(self, store: AttachmentStore, workers: int):
+        self.store = store
+        self.workers = workers
+        self.pool = None
+        self.task = None
+        self.wakeup = None
+
+    async def start(self):
+        if not DERIVATIVES_ENABLED:
+            print("[IMG] Pillow is not installed; image derivatives are disabled.")
+            return
+        self.pool = self._new_pool()
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn, not fork: this process already runs writer and broker threads
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def stop(self):
+        if self.task: self.task.cancel()
+        if self.pool: self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def notify(self):
+        if self.wakeup: self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await write_queue.run(self._claim)
+                if claimed:
+                    await asyncio.gather(*(self._render(digest) for digest in claimed))
+                    continue
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), DERIVATIVE_CLAIM_TIMEOUT_SECONDS / 10)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[IMG] Derivative dispatcher error: {e!r}")
+                await asyncio.sleep(5)
+
+    def _claim(self, session: Session) -> list:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=DERIVATIVE_CLAIM_TIMEOUT_SECONDS)
+        jobs = session.exec(
+            select(DerivativeJob).where(or_(
+                DerivativeJob.status == JobStatus.PENDING,
+                and_(DerivativeJob.status == JobStatus.RUNNING, DerivativeJob.claimed_at < stale),
+            )).limit(self.workers * 2)
+        ).all()
+        for job in jobs:
+            job.status = JobStatus.RUNNING
+            job.claimed_at = now
+            job.attempts += 1
+            session.add(job)
+        return [job.sha256 for job in jobs]
+
+    async def _render(self, digest: str):
+        error = None
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.pool, render_derivatives, self.store.path_for(digest))
+        except Exception as e:
+            error = repr(e)
+            print(f"[IMG] Rendering {digest} failed: {error}")
+            if isinstance(e, BrokenProcessPool):
+                # A worker crashed (e.g. OOM on a huge image); the pool is unusable from now on
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._new_pool()
+
+        def finish(session: Session):
+            job = session.get(DerivativeJob, digest)
+            if error is None:
+                job.status, job.error = JobStatus.DONE, None
+            else:
+                job.status = JobStatus.FAILED if job.attempts >= DERIVATIVE_MAX_ATTEMPTS else JobStatus.PENDING
+                job.error = error
+            session.add(job)
+            # Comments showing this image now have thumbnails; which tickets isn't indexed, so bump all
+            if error is None: bump_ticket_version(session)
+        await write_queue.run(finish)
+
+derivative_pipeline = DerivativePipeline(attachment_store, DERIVATIVE_WORKERS)
+
+# --- OUTBOX ---
+class OutboxDispatcher:
+    """Delivers the side effects of committed comment writes. create_comment only adds an
+    outbox_event row to its own transaction; this task claims due rows in batches through the
+    write queue, creates the notifications they imply (coalesced to one per recipient and
+    ticket per batch, in the claiming transaction) and publishes their WebSocket messages.
+    Delivery is at least once: a batch that fails to publish goes back with a backoff and is
+    sent again, so messages carry ids that clients dedupe on, and notification ids are derived
+    from the event ids so a retried batch never inserts a notification twice."""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.task = None
+        self.wakeup = None
+        self.counters = {"events": 0, "batches": 0, "notifications": 0, "retries": 0, "failed": 0}
+
+    async def start(self):
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task: self.task.cancel()
+
+    def notify(self):
+        if self.wakeup: self.wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                # Cleared before claiming, so a notify() during the claim isn't lost
+                self.wakeup.clear()
+                claimed = await write_queue.run(self._claim)
+                if claimed[0]:
+                    await self._dispatch(*claimed)
+                    continue
+                try:
+                    # Polling picks up retries and events committed by other workers
+                    await asyncio.wait_for(self.wakeup.wait(), OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[OUTBOX] Dispatcher error: {e!r}")
+                await asyncio.sleep(1)
+
+    def _claim(self, session: Session) -> tuple:
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT_SECONDS)
+        events = session.exec(
+            select(OutboxEvent).where(or_(
+                and_(OutboxEvent.status == JobStatus.PENDING, OutboxEvent.available_at <= now),
+                and_(OutboxEvent.status == JobStatus.RUNNING, OutboxEvent.claimed_at < stale),
+            )).order_by(OutboxEvent.id).limit(self.batch_size)
+        ).all()
+        for row in events:
+            row.status = JobStatus.RUNNING
+            row.claimed_at = now
+            row.attempts += 1
+            session.add(row)
+        claimed = [(row.id, json.loads(row.payload)) for row in events]
+        notifications = self._coalesce(claimed, now)
+        if notifications:
+            session.exec(sqlite_insert(Notification).values(notifications).on_conflict_do_nothing(index_elements=["id"]))
+        return claimed, notifications
+
+    @staticmethod
+    def _coalesce(claimed: list, now: datetime) -> list:
+        # One notification per (recipient, ticket) however many comments this batch holds for it
+        groups: Dict[tuple, list] = {}
+        for event_id, payload in claimed:
+            if payload.get("notify"):
+                notify = payload["notify"]
+                groups.setdefault((notify["recipient_id"], payload["ticket_id"]), []).append((event_id, notify))
+        notifications = []
+        for (recipient_id, ticket_id), items in groups.items():
+            title = items[0][1]["title"]
+            authors = list(dict.fromkeys(notify["author"] for _, notify in items))
+            if len(items) == 1:
+                content = f"{authors[0]} commented on your ticket: {title}"
+            elif len(authors) == 1:
+                content = f"{authors[0]} left {len(items)} comments on your ticket: {title}"
+            else:
+                content = f"{authors[0]} and {len(authors) - 1} others commented on your ticket: {title}"
+            notifications.append({
+                "id": str(uuid.uuid5(uuid.NAMESPACE_OID, f"outbox:{items[0][0]}")),
+                "recipient_id": recipient_id, "content": content,
+                "link": f"/dashboard/tickets/{ticket_id}", "is_read": False, "created_at": now,
+            })
+        return notifications
+
+    async def _dispatch(self, claimed: list, notifications: list):
+        ids = [event_id for event_id, _ in claimed]
+        try:
+            for _, payload in claimed:
+                await manager.broadcast_ticket(payload["ticket_id"], payload["message"])
+            for n in notifications:
+                # Reaches ALL active connections for this user
+                await manager.send_personal_message(n["recipient_id"], {
+                    "type": "notification", "id": n["id"], "content": n["content"], "link": n["link"]
+                })
+        except Exception as e:
+            error = repr(e)
+            print(f"[OUTBOX] Delivering {len(ids)} events failed, will retry: {error}")
+            await write_queue.run(lambda session: self._release(session, ids, error))
+            return
+        await write_queue.run(lambda session: session.exec(delete(OutboxEvent).where(OutboxEvent.id.in_(ids))))
+        self.counters["events"] += len(ids)
+        self.counters["batches"] += 1
+        self.counters["notifications"] += len(notifications)
+
+    def _release(self, session: Session, ids: List[int], error: str):
+        now = datetime.utcnow()
+        for row in session.exec(select(OutboxEvent).where(OutboxEvent.id.in_(ids))).all():
+            row.error = error
+            row.claimed_at = None
+            if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                row.status = JobStatus.FAILED
+                self.counters["failed"] += 1
+            else:
+                row.status = JobStatus.PENDING
+                delay = min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (row.attempts - 1), OUTBOX_RETRY_MAX_SECONDS)
+                row.available_at = now + timedelta(seconds=delay)
+                self.counters["retries"] += 1
+            session.add(row)
+
+outbox = OutboxDispatcher(OUTBOX_BATCH_SIZE)
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
 
+@app.on_event("startup")
+async def start_broker():
+    global main_loop
+    main_loop = asyncio.get_running_loop()
+    await manager.broker.start(manager.deliver)
+
+@app.on_event("shutdown")
+async def stop_broker():
+    await manager.broker.stop()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
+
+@app.on_event("startup")
+async def start_derivative_pipeline():
+    await derivative_pipeline.start()
+
+@app.on_event("shutdown")
+async def stop_derivative_pipeline():
+    await derivative_pipeline.stop()
+
+@app.on_event("startup")
+async def start_outbox():
+    await outbox.start()
+
+@app.on_event("shutdown")
+async def stop_outbox():
+    await outbox.stop()
+
+@app.on_event("shutdown")
+def stop_write_queue():
+    write_queue.stop()
+
+# --- SIMILAR TICKETS ---
+# Duplicate suggestions while a ticket is drafted, from every ticket including archived ones.
+# create_ticket indexes what this process creates; tickets other workers created are picked up
+# by created_at before each query. Signatures only shortlist: the score comes from current text.
+if SIMILARITY_ENABLED:
+    from similarity import SimilarityIndex, terms
+
+def epoch_us(moment: datetime) -> int:
+    return int(moment.replace(tzinfo=timezone.utc).timestamp() * 1_000_000)
+
+class SimilarTickets:
+    """The app's side of similarity.py: what to index, when to save, and scoring from the database."""
+
+    def __init__(self, path: str):
+        self.index = SimilarityIndex(path) if SIMILARITY_ENABLED else None
+        self.caught_up_at = -math.inf
+
+    def start(self):
+        if self.index is None:
+            print("[SIMILAR] NumPy is not installed; similar-ticket suggestions are disabled.")
+            return
+        if not self.index.load():
+            print("🧭 Building similar-ticket index...")
+            self.rebuild()
+        with Session(engine) as session:
+            self.catch_up(session)
+
+    def stop(self):
+        if self.index is not None and self.index.tail_ids: self.save()
+
+    def rebuild(self):
+        with Session(engine) as session:
+            latest = session.exec(select(func.max(Ticket.created_at))).one()
+        def batches():
+            # Keyset over each schema's primary key; build() drops archive copies of restored tickets
+            for tables in (HOT, ARCHIVED):
+                tickets, last = tables[Ticket], ""
+                while True:
+                    with Session(engine) as session:
+                        rows = session.exec(select(tickets.c.id, tickets.c.title, tickets.c.description, tickets.c.tags)
+                                            .where(tickets.c.id > last).order_by(tickets.c.id).limit(SIMILARITY_BUILD_BATCH)).all()
+                    if not rows: break
+                    yield rows
+                    last = rows[-1].id
+        self.index.build(batches, epoch_us(latest) if latest else 0)
+
+    def add(self, ticket: Ticket):
+        if self.index is None: return
+        self.index.add(ticket.id, ticket.title, ticket.description, ticket.tags)
+        self.save_soon()
+
+    def catch_up(self, session: Session):
+        """Indexes tickets created since the index's watermark, by this process or any other."""
+        self.caught_up_at = time.monotonic()
+        latest = session.exec(select(func.max(Ticket.created_at))).one()
+        if latest is None or epoch_us(latest) <= self.index.watermark: return
+        since = datetime(1970, 1, 1) + timedelta(microseconds=self.index.watermark, seconds=-SIMILARITY_CATCH_UP_SLACK_SECONDS)
+        rows = session.exec(select(Ticket.id, Ticket.title, Ticket.description, Ticket.tags, Ticket.created_at)
+                            .where(Ticket.created_at > since)).all()
+        for row in rows:
+            self.index.add(row.id, row.title, row.description, row.tags)
+        with self.index.lock:
+            self.index.watermark = max([self.index.watermark] + [epoch_us(row.created_at) for row in rows])
+        self.save_soon()
+
+    def save_soon(self):
+        # Merging rewrites the whole file, so it runs on its own thread, one at a time
+        if len(self.index.tail_ids) >= SIMILARITY_SAVE_EVERY and not self.index.save_lock.locked():
+            threading.Thread(target=self.save, name="similarity-save", daemon=True).start()
+
+    def save(self):
+        try:
+            self.index.save()
+        except OSError as e:
+            print(f"[SIMILAR] Saving {self.index.path} failed: {e!r}")
+
+    def suggest(self, session: Session, draft: TicketDraft, limit: int) -> List[SimilarTicket]:
+        # This process indexes its own tickets as they are created (add), so only other processes'
+        # need looking for, and a second's delay is fine for those
+        if time.monotonic() - self.caught_up_at >= SIMILARITY_CATCH_UP_INTERVAL_SECONDS: self.catch_up(session)
+        counts = terms(draft.title, draft.description, draft.tags)
+        if not counts: return []
+        wanted = self.index.nearest(counts, SIMILARITY_CANDIDATES)
+        found = session.execute(SIMILAR_CANDIDATES_QUERY, {"ids": wanted}).all() if wanted else []
+        scores = self.index.scores(counts, [terms(row.title, row.description, row.tags) for row in found])
+        scored = sorted(zip(scores.tolist(), found), key=lambda pair: (-pair[0], pair[1].id))
+        return [SimilarTicket(id=row.id, title=row.title, status=row.status, tags=row.tags, created_at=row.created_at, score=round(score, 4))
+                for score, row in scored[:limit] if score >= SIMILARITY_MIN_SCORE]
+
+# The candidates from both databases in one statement, built once: constructing an IN of 50 literals
+# per request cost more than running it. A restored ticket's archive copy is main's business.
+SIMILAR_CANDIDATES_QUERY = union_all(*(
+    select(tickets.c.id, tickets.c.title, tickets.c.description, tickets.c.status, tickets.c.tags, tickets.c.created_at)
+    .where(tickets.c.id.in_(bindparam("ids", expanding=True)),
+           *([~select(Ticket.id).where(Ticket.id == tickets.c.id).exists()] if tables is ARCHIVED else []))
+    for tables in (HOT, ARCHIVED) for tickets in [tables[Ticket]]
+))
+
+similar_tickets = SimilarTickets(SIMILARITY_FILE)
+
+@app.on_event("startup")
+def start_similar_tickets():
+    similar_tickets.start()
+
+@app.on_event("shutdown")
+def stop_similar_tickets():
+    similar_tickets.stop()
+
 # --- HELPER FUNCTIONS ---
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -260,18 +2189,561 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+# --- READ PROJECTIONS ---
+# List/detail endpoints select exactly the DTO columns with the author/owner joined in,
+# instead of loading ORM objects and lazy-loading the user relationship row by row.
+# tables is HOT (the default) or ARCHIVED: the same row shape from either database.
+def ticket_read_query(*extra_columns, tables: Optional[dict] = None):
+    tickets = (tables or HOT)[Ticket]
+    return select(
+        tickets.c.id, tickets.c.title, tickets.c.description, tickets.c.priority, tickets.c.status, tickets.c.tags,
+        tickets.c.created_at, tickets.c.owner_id,
+        func.coalesce(User.username, "Unknown").label("owner_name"),
+        User.email.label("owner_email"),
+        *extra_columns
+    ).outerjoin(User, User.id == tickets.c.owner_id)
+
+def comment_read_query(*extra_columns, tables: Optional[dict] = None):
+    comments = (tables or HOT)[Comment]
+    return select(
+        comments.c.id, comments.c.content, comments.c.attachment_url, comments.c.created_at,
+        func.coalesce(User.username, "Unknown").label("author_name"),
+        # Typed literal: enums are stored by name, so a bare UserRole.USER would bind as "user"
+        func.coalesce(User.role, literal(UserRole.USER, User.role.type)).label("author_role"),
+        comments.c.seq,
+        *extra_columns
+    ).outerjoin(User, User.id == comments.c.author_id)
+
+def to_ticket_read(row, snippet: Optional[str] = None) -> TicketRead:
+    return TicketRead(
+        id=row.id, title=row.title, description=row.description,
+        priority=row.priority, status=row.status, tags=row.tags,
+        created_at=row.created_at,
+        owner_name=row.owner_name, owner_id=row.owner_id, owner_email=row.owner_email,
+        snippet=snippet
+    )
+
+ATTACHMENT_DIGEST = re.compile(r"/attachments/([0-9a-f]{64})")
+
+def attachment_digest(url: Optional[str]) -> Optional[str]:
+    match = ATTACHMENT_DIGEST.search(url) if url else None
+    return match.group(1) if match else None
+
+def rendered_attachments(session: Session, urls) -> set:
+    # One lookup per page: which of these attachments already have derivatives on disk
+    digests = {d for d in map(attachment_digest, urls) if d}
+    if not digests: return set()
+    return set(session.exec(select(DerivativeJob.sha256).where(
+        DerivativeJob.sha256.in_(digests), DerivativeJob.status == JobStatus.DONE
+    )).all())
+
+def derivative_url(digest: str, variant: str) -> str:
+    return f"{PUBLIC_BASE_URL}/attachments/{digest}.{variant}.webp"
+
+def to_comment_read(row, rendered: set = frozenset()) -> CommentRead:
+    digest = attachment_digest(row.attachment_url)
+    ready = digest in rendered
+    return CommentRead(
+        id=row.id, content=row.content, attachment_url=row.attachment_url, created_at=row.created_at,
+        attachment_thumb_url=derivative_url(digest, "thumb") if ready else None,
+        attachment_preview_url=derivative_url(digest, "preview") if ready else None,
+        author_name=row.author_name, author_role=row.author_role, seq=row.seq
+    )
+
+def encode_cursor(*key) -> str:
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in key]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    # A cursor is the sort key of the last row on the previous page
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(values) != len(types): raise ValueError(cursor)
+        return tuple(datetime.fromisoformat(v) if t is datetime else t(v) for v, t in zip(values, types))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def page_params(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    # Clients that send neither limit nor cursor keep getting the full, unpaginated list
+    if limit is None and cursor is None: return None
+    return limit or DEFAULT_PAGE_SIZE
+
+# --- AUTH CACHE ---
+class AuthCache:
+    """Bounded LRU/TTL cache of verified tokens (token -> username, expiry) and of the
+    users they resolve to (username -> column snapshot). Entries for a user are dropped
+    as soon as a transaction that changed or deleted that user commits. Without cache_users
+    only tokens are cached (their claims never change) and every request reads the user."""
+
+    def __init__(self, max_size: int, ttl: float, cache_users: bool = True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_users = cache_users
+        self.tokens: OrderedDict = OrderedDict()
+        self.users: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"token_hits": 0, "token_misses": 0, "user_hits": 0, "user_misses": 0, "invalidations": 0}
+
+    def _get(self, entries: OrderedDict, key: str, kind: str, valid=None):
+        with self.lock:
+            entry = entries.get(key)
+            if entry is None or entry[1] < time.monotonic() or (valid and not valid(entry[0])):
+                entries.pop(key, None)
+                self.counters[f"{kind}_misses"] += 1
+                return None
+            entries.move_to_end(key)
+            self.counters[f"{kind}_hits"] += 1
+            return entry[0]
+
+    def _put(self, entries: OrderedDict, key: str, value):
+        with self.lock:
+            entries[key] = (value, time.monotonic() + self.ttl)
+            entries.move_to_end(key)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def get_token(self, token: str) -> Optional[tuple]:
+        # Never trust a cached token past its own exp claim (epoch seconds, so compared to time.time())
+        return self._get(self.tokens, token, "token", lambda claims: claims[1] > time.time())
+
+    def put_token(self, token: str, username: str, expires_at: float):
+        self._put(self.tokens, token, (username, expires_at))
+
+    def get_user(self, username: str) -> Optional[dict]:
+        if not self.cache_users: return None
+        return self._get(self.users, username, "user")
+
+    def put_user(self, user: "User"):
+        if not self.cache_users: return
+        self._put(self.users, user.username, {c.name: getattr(user, c.name) for c in User.__table__.columns})
+
+    def invalidate_users(self, usernames):
+        with self.lock:
+            for username in usernames:
+                self.users.pop(username, None)
+            self.counters["invalidations"] += 1
+
+    def invalidate_user_ids(self, user_ids):
+        user_ids = set(user_ids)
+        with self.lock:
+            for username in [name for name, (data, _) in self.users.items() if data["id"] in user_ids]:
+                del self.users[username]
+            self.counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {**self.counters, "tokens": len(self.tokens), "users": len(self.users)}
+
+# Deleting or deactivating a user must lock them out at once. Workers that can't hear about
+# each other's user changes (several behind the local broker) therefore don't cache users.
+auth_cache = AuthCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS, cache_users=not CACHES_NEED_REVALIDATION)
+
+# Any committed ORM change to a User (profile edit, reputation, deletion) evicts its cached copy,
+# on every worker (via the broker). Invalidating after commit (not flush) stops a concurrent
+# request re-caching the old row.
+@event.listens_for(Session, "after_flush")
+def collect_changed_users(session, flush_context):
+    changed = [obj for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)]
+    if changed:
+        session.info.setdefault("changed_users", set()).update(user.username for user in changed)
+        session.info.setdefault("changed_user_ids", set()).update(user.id for user in changed)
+
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_users(session):
+    usernames = session.info.pop("changed_users", None)
+    changed_ids = session.info.pop("changed_user_ids", None)
+    if usernames: auth_cache.invalidate_users(usernames)
+    if changed_ids: leaderboard.forget(changed_ids)
+    if usernames or changed_ids:
+        publish_invalidation("cache:users", {"usernames": sorted(usernames or ()), "ids": sorted(changed_ids or ())})
+
+@event.listens_for(Session, "after_rollback")
+def discard_changed_users(session):
+    session.info.pop("changed_users", None)
+    session.info.pop("changed_user_ids", None)
+    session.info.pop("reputation_rows", None)
+
+# --- LEADERBOARD ---
+LEADERBOARD_COLUMNS = (User.id, User.username, User.role, User.full_name, User.email, User.bio, User.reputation, User.is_active)
+
+class Leaderboard:
+    """Top users by reputation, held in memory and updated incrementally from committed
+    reputation events, so a page view is a sort of a few dozen dicts instead of a table sort.
+    It keeps LEADERBOARD_SLACK more entries than it serves; it reloads from the indexed
+    reputation column only when that slack runs out, when a listed user changes or is
+    deleted, or every LEADERBOARD_REFRESH_SECONDS to pick up other workers' events."""
+
+    def __init__(self, size: int, slack: int):
+        self.size = size
+        self.capacity = size + slack
+        self.entries: Dict[str, dict] = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def top(self, session: Session, n: int) -> List[dict]:
+        with self.lock:
+            stale = self.loaded_at is None or time.monotonic() - self.loaded_at > LEADERBOARD_REFRESH_SECONDS
+        if stale: self.reload(session)
+        with self.lock:
+            return sorted(self.entries.values(), key=lambda e: -e["reputation"])[:n]
+
+    def reload(self, session: Session):
+        rows = session.exec(select(*LEADERBOARD_COLUMNS).order_by(User.reputation.desc()).limit(self.capacity)).all()
+        with self.lock:
+            self.entries = {row.id: dict(row._mapping) for row in rows}
+            self.loaded_at = time.monotonic()
+
+    def apply(self, rows):
+        # rows carry each user's new total (UPDATE ... RETURNING), so no extra query is needed
+        with self.lock:
+            for row in rows:
+                entry = dict(row)
+                if entry["id"] in self.entries or len(self.entries) < self.capacity:
+                    self.entries[entry["id"]] = entry
+                    continue
+                lowest = min(self.entries.values(), key=lambda e: e["reputation"])
+                if entry["reputation"] > lowest["reputation"]:
+                    del self.entries[lowest["id"]]
+                    self.entries[entry["id"]] = entry
+
+    def forget(self, user_ids):
+        with self.lock:
+            if any(user_id in self.entries for user_id in user_ids):
+                self.loaded_at = None
+
+class WindowedLeaderboard:
+    """Weekly/monthly leaderboards summed from the reputation ledger, cached briefly."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.cache: Dict[str, tuple] = {}
+
+    def top(self, session: Session, window: LeaderboardWindow, n: int) -> List[dict]:
+        cached = self.cache.get(window)
+        if cached and cached[0] > time.monotonic(): return cached[1]
+        since = datetime.utcnow() - timedelta(days=7 if window == LeaderboardWindow.WEEK else 30)
+        points = (
+            select(ReputationEvent.user_id, func.sum(ReputationEvent.delta).label("points"))
+            .where(ReputationEvent.created_at >= since, ReputationEvent.reason != OPENING_BALANCE_REASON)
+            .group_by(ReputationEvent.user_id)
+            .order_by(func.sum(ReputationEvent.delta).desc())
+            .limit(n)
+            .subquery()
+        )
+        rows = session.exec(
+            select(*LEADERBOARD_COLUMNS, points.c.points).join(points, points.c.user_id == User.id).order_by(points.c.points.desc())
+        ).all()
+        # Same shape as the all-time board; reputation is the points earned within the window
+        result = [{**dict(row._mapping), "reputation": row.points} for row in rows]
+        self.cache[window] = (time.monotonic() + self.ttl, result)
+        return result
+
+leaderboard = Leaderboard(LEADERBOARD_SIZE, LEADERBOARD_SLACK)
+windowed_leaderboard = WindowedLeaderboard(LEADERBOARD_WINDOW_CACHE_SECONDS)
+
+@event.listens_for(Session, "after_commit")
+def apply_reputation_events(session):
+    rows = session.info.pop("reputation_rows", None)
+    if rows: leaderboard.apply(rows)
+
+def compact_notifications(older_than_days: int, batch_size: int = NOTIFICATION_COMPACT_BATCH) -> int:
+    # Deletes read notifications past retention in short batches, so other writes interleave
+    # with a large purge instead of waiting behind one long transaction.
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    def delete_batch(session: Session) -> int:
+        batch = select(Notification.id).where(Notification.is_read == True, Notification.created_at < cutoff).limit(batch_size)
+        return session.exec(delete(Notification).where(Notification.id.in_(batch))).rowcount
+    deleted = 0
+    while True:
+        count = write_queue.run_sync(delete_batch)
+        deleted += count
+        if count < batch_size: return deleted
+
+def ticket_rows(tables: dict, model, ticket_ids: List[str]):
+    """Rows of `model` that belong to these tickets (notifications only through their link;
+    unread ones never move, so inboxes and their counters are left alone)."""
+    table = tables[model]
+    if model is Ticket: return table.c.id.in_(ticket_ids)
+    if model is Notification:
+        return and_(table.c.link.in_([f"/dashboard/tickets/{t}" for t in ticket_ids]), table.c.is_read == True)
+    return table.c.ticket_id.in_(ticket_ids)
+
+def copy_ticket_rows(session: Session, ticket_ids: List[str], source: dict, target: dict):
+    for model in ARCHIVE_MODELS:
+        columns = [c.name for c in model.__table__.columns]
+        rows = select(*(source[model].c[name] for name in columns)).where(ticket_rows(source, model, ticket_ids))
+        session.execute(target[model].insert().from_select(columns, rows))
+
+def delete_ticket_rows(session: Session, ticket_ids: List[str], tables: dict, copied_to: Optional[dict] = None):
+    # Children first: the tag counter triggers look the ticket up when a link goes
+    for model in reversed(ARCHIVE_MODELS):
+        rows = ticket_rows(tables, model, ticket_ids)
+        if model is Notification and copied_to:
+            # Only the ones that made it into the copy: a notification read since then stays
+            rows = and_(rows, tables[model].c.id.in_(select(copied_to[model].c.id).where(ticket_rows(copied_to, model, ticket_ids))))
+        session.exec(delete(tables[model]).where(rows))
+
+def ticket_versions(session: Session, ticket_ids: List[str]) -> dict:
+    return dict(session.exec(select(TicketVersion.ticket_id, TicketVersion.version).where(TicketVersion.ticket_id.in_(ticket_ids))).all())
+
+def archive_solved_tickets(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH) -> int:
+    """Moves solved tickets past the cutoff to the archive database, batch_size at a time.
+    SQLite commits a transaction over two WAL databases atomically per file only, so every
+    step writes a single database: copy the batch into the archive, delete from main the
+    tickets nobody wrote to in between (ticket_version unchanged), drop the copies of the rest.
+    Readers prefer main, so a ticket that is briefly in both is never shown twice."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    after, moved = None, 0
+    while True:
+        def copy(session: Session):
+            query = select(Ticket.id, Ticket.solved_at).where(Ticket.status == TicketStatus.SOLVED, Ticket.solved_at < cutoff)
+            if after: query = query.where(tuple_(Ticket.solved_at, Ticket.id) > tuple_(*after))
+            rows = session.exec(query.order_by(Ticket.solved_at, Ticket.id).limit(batch_size)).all()
+            ids = [row.id for row in rows]
+            if ids:
+                # Leftovers of an interrupted run are replaced, not duplicated
+                delete_ticket_rows(session, ids, ARCHIVED)
+                copy_ticket_rows(session, ids, HOT, ARCHIVED)
+            return rows, ticket_versions(session, ids)
+        rows, versions = write_queue.run_sync(copy)
+        if not rows: return moved
+        ids = [row.id for row in rows]
+
+        def swap(session: Session) -> List[str]:
+            current = ticket_versions(session, ids)
+            copied = set(session.exec(select(ARCHIVED[Ticket].c.id).where(ARCHIVED[Ticket].c.id.in_(ids))).all())
+            unchanged = [t for t in ids if t in copied and current.get(t) == versions.get(t)]
+            if unchanged: delete_ticket_rows(session, unchanged, HOT, copied_to=ARCHIVED)
+            return unchanged
+        unchanged = write_queue.run_sync(swap)
+        stale = sorted(set(ids) - set(unchanged))
+        if stale: write_queue.run_sync(lambda session: delete_ticket_rows(session, stale, ARCHIVED))
+        moved += len(unchanged)
+        if len(rows) < batch_size: return moved
+        after = (rows[-1].solved_at, rows[-1].id)
+
+def restore_tickets(session: Session, ticket_ids: List[str], owner_id: Optional[str] = None) -> List[str]:
+    """Moves archived tickets among ticket_ids (only owner_id's, if given) back to main, for a
+    write that is about to change them. Their archive copies are dropped after the commit."""
+    archived = ARCHIVED[Ticket]
+    query = select(archived.c.id, select(Ticket.id).where(Ticket.id == archived.c.id).exists().label("hot")).where(archived.c.id.in_(ticket_ids))
+    if owner_id: query = query.where(archived.c.owner_id == owner_id)
+    rows = session.exec(query).all()
+    if not rows: return []
+    # A copy whose ticket is back in main already (an interrupted move) is only dropped
+    cold = [row.id for row in rows if not row.hot]
+    if cold: copy_ticket_rows(session, cold, ARCHIVED, HOT)
+    session.info.setdefault("restored_tickets", set()).update(row.id for row in rows)
+    return cold
+
+def writable_ticket(session: Session, ticket_id: str) -> Optional[Ticket]:
+    ticket = session.get(Ticket, ticket_id)
+    if ticket is None and restore_tickets(session, [ticket_id]):
+        ticket = session.get(Ticket, ticket_id)
+    return ticket
+
+@event.listens_for(Session, "after_commit")
+def drop_restored_copies(session):
+    # Runs on the writer thread: queue the archive-only cleanup as a transaction of its own
+    restored = session.info.pop("restored_tickets", None)
+    if restored: write_queue.submit(lambda s: delete_ticket_rows(s, sorted(restored), ARCHIVED))
+
+@event.listens_for(Session, "after_rollback")
+def forget_restored_copies(session):
+    session.info.pop("restored_tickets", None)
+
+def add_reputation(session: Session, user: User, delta: int, reason: str):
+    # Ledger event + increment in SQL (not Python), in the caller's transaction: concurrent
+    # writers can't lose each other's updates, and the ledger always sums to the total.
+    session.add(ReputationEvent(user_id=user.id, delta=delta, reason=reason))
+    row = session.exec(
+        update(User).where(User.id == user.id).values(reputation=User.reputation + delta).returning(*LEADERBOARD_COLUMNS)
+    ).first()
+    if row is None: return
+    session.info.setdefault("changed_users", set()).add(user.username)
+    session.info.setdefault("reputation_rows", []).append(dict(row._mapping))
+
+def verify_token(token: str) -> str:
+    claims = auth_cache.get_token(token)
+    if claims is not None: return claims[0]
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None: raise HTTPException(status_code=401)
     except JWTError:
         raise HTTPException(status_code=401)
-    statement = select(User).where(User.username == username)
-    user = session.exec(statement).first()
+    auth_cache.put_token(token, username, payload["exp"])
+    return username
+
+def cached_user(username: str, session) -> Optional[User]:
+    cached = auth_cache.get_user(username)
+    if cached is None: return None
+    # Rebuild the row as a clean persistent object in this request's session, no SQL needed
+    user = User(**cached)
+    make_transient_to_detached(user)
+    session.add(user)
+    return user
+
+def check_active(user: Optional[User]) -> User:
     if user is None: raise HTTPException(status_code=401)
+    if not user.is_active: raise HTTPException(status_code=401, detail="Account is deactivated")
     return user
 
+# Plain def: FastAPI runs it in the threadpool, keeping the sync query off the event loop
+def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+    username = verify_token(token)
+    user = cached_user(username, session)
+    if user is None:
+        user = session.exec(select(User).where(User.username == username)).first()
+        if user: auth_cache.put_user(user)
+    return check_active(user)
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_async_session)):
+    username = verify_token(token)
+    user = cached_user(username, session)
+    if user is None:
+        user = (await session.exec(select(User).where(User.username == username))).first()
+        if user: auth_cache.put_user(user)
+    return check_active(user)
+
+# --- RESPONSE CACHE ---
+ALL_TICKETS = "*"
+
+def bump_ticket_version(session: Session, ticket_id: str = ALL_TICKETS):
+    bump_ticket_versions(session, [ticket_id])
+
+def bump_ticket_versions(session: Session, ticket_ids: List[str]):
+    # One multi-row upsert however many tickets changed
+    if not ticket_ids: return
+    now = datetime.utcnow()
+    statement = sqlite_insert(TicketVersion).values([{"ticket_id": t, "version": 1, "updated_at": now} for t in ticket_ids])
+    session.exec(statement.on_conflict_do_update(
+        index_elements=["ticket_id"], set_={"version": TicketVersion.version + 1, "updated_at": now}
+    ))
+    session.info.setdefault("changed_tickets", set()).update(ticket_ids)
+
+def ticket_validators(session: Session, ticket_id: str) -> tuple:
+    rows = {row.ticket_id: row for row in session.exec(
+        select(TicketVersion).where(TicketVersion.ticket_id.in_([ticket_id, ALL_TICKETS]))
+    ).all()}
+    ticket, everything = rows.get(ticket_id), rows.get(ALL_TICKETS)
+    etag = f'"{ticket.version if ticket else 0}.{everything.version if everything else 0}"'
+    last_modified = max((row.updated_at for row in rows.values()), default=None)
+    return etag, last_modified
+
+class ResponseCache:
+    """Serialized GET responses per ticket, LRU-bounded. Entries are dropped after the commit
+    of any write that bumps the ticket's version (on every worker, via a shared broker), so a
+    repeat view of a hot ticket is served without rendering it again."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.keys_by_ticket: Dict[str, set] = {}
+        # Bumped on every invalidation; a miss computed across one is not stored (it may be stale)
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key: tuple, etag: Optional[str] = None):
+        """The entry for key; with `etag`, only if it was rendered at that version."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (etag is not None and entry[0] != etag):
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry
+
+    def put(self, key: tuple, entry: tuple, generation: int):
+        ticket_id = key[0]
+        with self.lock:
+            if generation != self.generation: return
+            self.entries[key] = entry
+            self.keys_by_ticket.setdefault(ticket_id, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                old_key, _ = self.entries.popitem(last=False)
+                keys = self.keys_by_ticket.get(old_key[0])
+                if keys is not None:
+                    keys.discard(old_key)
+                    if not keys: del self.keys_by_ticket[old_key[0]]
+
+    def invalidate(self, ticket_ids):
+        with self.lock:
+            self.generation += 1
+            self.counters["invalidations"] += 1
+            if ALL_TICKETS in ticket_ids:
+                self.entries.clear()
+                self.keys_by_ticket.clear()
+                return
+            for ticket_id in ticket_ids:
+                for key in self.keys_by_ticket.pop(ticket_id, ()):
+                    self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {**self.counters, "entries": len(self.entries)}
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+main_loop: Optional[asyncio.AbstractEventLoop] = None
+
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_tickets(session):
+    changed = session.info.pop("changed_tickets", None)
+    if not changed: return
+    response_cache.invalidate(changed)
+    publish_invalidation("cache:tickets", sorted(changed))
+
+def publish_invalidation(channel: str, data):
+    # Other workers drop their copies when the broker delivers this (see ConnectionManager.deliver).
+    # Called from after_commit hooks, which may run on any thread.
+    if BROKER_BACKEND == "local" or main_loop is None: return
+    payload = json.dumps(data)
+    main_loop.call_soon_threadsafe(lambda: asyncio.ensure_future(manager.broker.publish(channel, payload)))
+
+@event.listens_for(Session, "after_rollback")
+def discard_changed_tickets(session):
+    session.info.pop("changed_tickets", None)
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    # If-None-Match wins when present; If-Modified-Since is only a fallback (RFC 9110 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def cached_ticket_response(request: Request, session: Session, ticket_id: str, render) -> Response:
+    """Serves render()'s JSON body for this ticket from the response cache, answering 304 when
+    the client already has the current version. render() runs (and queries) only on a miss."""
+    key = (ticket_id, request.url.path, request.url.query)
+    # Only a shared broker tells this worker about writes committed by the others. When several
+    # workers share the in-process one, check the entry against ticket_version first: an indexed
+    # read of two rows, still no render. A single process serves hits from memory.
+    current = ticket_validators(session, ticket_id)[0] if CACHES_NEED_REVALIDATION else None
+    entry = response_cache.get(key, current)
+    if entry is None:
+        generation = response_cache.generation
+        etag, last_modified = ticket_validators(session, ticket_id)
+        entry = (etag, last_modified, render())
+        response_cache.put(key, entry, generation)
+    etag, last_modified, body = entry
+    # no-cache: browsers keep the body but revalidate every time, which is what polling needs
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified: headers["Last-Modified"] = http_date(last_modified)
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
 # --- ROUTES ---
 
 @app.get("/users", response_model=List[UserRead])
@@ -282,41 +2754,59 @@ def read_users(session: Session = Depends(get_session), current_user: User = Dep
     return users
 
 @app.post("/users", response_model=User)
-def create_user(user: User, session: Session = Depends(get_session)):
-    statement = select(User).where(User.username == user.username)
-    if session.exec(statement).first():
-        raise HTTPException(status_code=400, detail="Username taken")
-    session.add(user)
-    session.commit()
-    session.refresh(user)
-    return user
+def create_user(user: User):
+    def write(session: Session):
+        statement = select(User).where(User.username == user.username)
+        if session.exec(statement).first():
+            raise HTTPException(status_code=400, detail="Username taken")
+        user.role = UserRole(user.role)
+        session.add(user)
+        return user
+    return write_queue.run_sync(write)
+
+def delete_users(session: Session, ids: List[str]) -> int:
+    """Deletes users and what hangs off them with one statement per table: their tickets and
+    comments stay (shown as "Unknown"), their inbox, counters, stats and reputation ledger go."""
+    users = session.exec(select(User.id, User.username).where(User.id.in_(ids))).all()
+    if not users: return 0
+    ids = [user.id for user in users]
+    for tables in (HOT, ARCHIVED):
+        session.exec(update(tables[Ticket]).where(tables[Ticket].c.owner_id.in_(ids)).values(owner_id=None))
+        session.exec(update(tables[Comment]).where(tables[Comment].c.author_id.in_(ids)).values(author_id=None))
+        session.exec(delete(tables[Notification]).where(tables[Notification].c.recipient_id.in_(ids)))
+    statements = ["DELETE FROM notification_counter WHERE user_id IN :ids"]
+    for schema in ("main", ARCHIVE_SCHEMA):
+        statements += [f"DELETE FROM {schema}.owner_ticket_counter WHERE owner_id IN :ids",
+                       f"DELETE FROM {schema}.ticket_daily_stats WHERE scope IN :ids"]
+    for statement in statements:
+        session.execute(text(statement).bindparams(bindparam("ids", expanding=True)), {"ids": ids})
+    session.exec(delete(ReputationEvent).where(ReputationEvent.user_id.in_(ids)))
+    session.exec(delete(User).where(User.id.in_(ids)))
+    # Core statements skip the ORM flush hooks, so queue the auth cache / leaderboard invalidation here
+    session.info.setdefault("changed_users", set()).update(user.username for user in users)
+    session.info.setdefault("changed_user_ids", set()).update(ids)
+    bump_ticket_version(session)
+    return len(users)
 
 @app.post("/users/bulk-delete") 
 def delete_users_bulk(
     delete_req: DeleteRequest, 
-    session: Session = Depends(get_session), 
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Not authorized")
-    statement = select(User).where(User.id.in_(delete_req.ids))
-    users = session.exec(statement).all()
-    for user in users: session.delete(user)
-    session.commit()
-    return {"ok": True, "deleted_count": len(users)}
+    return {"ok": True, "deleted_count": write_queue.run_sync(lambda session: delete_users(session, delete_req.ids))}
 
 @app.delete("/users/{user_id}")
 def delete_user(
     user_id: str, 
-    session: Session = Depends(get_session), 
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Not authorized")
-    user = session.get(User, user_id)
-    if not user: raise HTTPException(status_code=404, detail="User not found")
-    session.delete(user)
-    session.commit()
+    def write(session: Session):
+        if not delete_users(session, [user_id]): raise HTTPException(status_code=404, detail="User not found")
+    write_queue.run_sync(write)
     return {"ok": True}
 
 @app.post("/login", response_model=Token)
@@ -332,201 +2822,771 @@ def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 @app.patch("/users/me", response_model=User)
-def update_user_me(user_update: UserUpdate, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
+def update_user_me(user_update: UserUpdate, current_user: User = Depends(get_current_user)):
     user_data = user_update.dict(exclude_unset=True)
-    for key, value in user_data.items():
-        setattr(current_user, key, value)
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
-    return current_user 
+    def write(session: Session):
+        user = session.get(User, current_user.id)
+        for key, value in user_data.items():
+            setattr(user, key, value)
+        session.add(user)
+        # Names and emails are rendered into ticket details and comment threads
+        bump_ticket_version(session)
+        return user
+    return write_queue.run_sync(write)
+
+@app.get("/admin/auth-cache")
+def read_auth_cache_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return auth_cache.stats()
+
+def metrics_access(request: Request, session: Session = Depends(get_session)):
+    scheme, _, credential = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not credential: raise HTTPException(status_code=401)
+    if METRICS_TOKEN and hmac.compare_digest(credential.encode(), METRICS_TOKEN.encode()): return
+    if get_current_user(credential, session).role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+@app.get("/metrics", dependencies=[Depends(metrics_access)])
+def read_metrics():
+    def gauge(name: str, help_text: str, samples: List[tuple], kind: str = "gauge") -> List[str]:
+        return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"] + [f"{name}{labels} {value}" for labels, value in samples]
+
+    lines = request_metrics.render()
+    ticket_rooms = {key: len(room) for key, room in list(manager.ticket_connections.items())}
+    user_channels = {key: len(room) for key, room in list(manager.user_connections.items())}
+    lines += gauge("devex_ws_ticket_rooms", "Ticket rooms with at least one socket.", [("", len(ticket_rooms))])
+    # A distribution, not a series per ticket: room ids are unbounded (and not for scrapers to see)
+    room_sizes = Histogram(METRICS_ROOM_BUCKETS)
+    for count in ticket_rooms.values():
+        room_sizes.observe(count)
+    lines += ["# HELP devex_ws_room_sockets Open sockets per ticket room.",
+              "# TYPE devex_ws_room_sockets histogram"] + room_sizes.lines("devex_ws_room_sockets", 'kind="ticket"')
+    lines += gauge("devex_ws_user_channels", "Users with at least one notification socket.", [("", len(user_channels))])
+    lines += gauge("devex_ws_sockets", "Open sockets by kind.",
+                   [('{kind="ticket"}', sum(ticket_rooms.values())), ('{kind="user"}', sum(user_channels.values()))])
+    for name in RoomStats.COUNTERS:
+        lines += gauge(f"devex_ws_{name}_total", f"WebSocket messages/sockets {name.replace('_', ' ')}.",
+                       [(f'{{kind="{kind}"}}', manager.totals(kind)[name]) for kind in ("ticket", "user")], "counter")
+    lines += gauge("devex_ws_resumes_total", "Ticket stream resumes by where the missed messages came from.",
+                   [(f'{{source="{source}"}}', manager.replays[source]) for source in ("buffer", "database")], "counter")
+    lines += gauge("devex_ws_replayed_messages_total", "Messages replayed to resuming clients.", [("", manager.replays["messages"])], "counter")
+    lines += gauge("devex_outbox_total", "Outbox events delivered, batches, notifications created, retries and failures.",
+                   [(f'{{counter="{name}"}}', value) for name, value in outbox.counters.items()], "counter")
+    with Session(engine) as session:
+        backlog = dict(session.exec(select(OutboxEvent.status, func.count()).group_by(OutboxEvent.status)).all())
+    lines += gauge("devex_outbox_events", "Undelivered outbox events by status.",
+                   [(f'{{status="{s.value}"}}', backlog.get(s, 0)) for s in (JobStatus.PENDING, JobStatus.RUNNING, JobStatus.FAILED)])
+    lines += gauge("devex_admission_in_flight", "Write requests holding an admission slot.", [("", admission.in_flight)])
+    lines += gauge("devex_admission_waiting", "Write requests queued for an admission slot.", [("", len(admission.waiters))])
+    lines += gauge("devex_admission_admitted_total", "Write requests admitted by route class.",
+                   [(f'{{route_class="{name}"}}', count) for name, count in sorted(admission.admitted.items())], "counter")
+    lines += gauge("devex_admission_rejected_total", "Write requests answered 429 by route class and reason.",
+                   [(f'{{route_class="{name}",reason="{reason}"}}', count) for (name, reason), count in sorted(admission.rejected.items())], "counter")
+    lines += ["# HELP devex_admission_wait_seconds Time queued requests waited for a slot.",
+              "# TYPE devex_admission_wait_seconds histogram"] + admission.wait_time.lines("devex_admission_wait_seconds", 'queue="write"')
+    if SIMILARITY_ENABLED:
+        lines += gauge("devex_similarity_tickets", "Tickets in the similar-ticket index by where their signature is kept.",
+                       [('{part="file"}', len(similar_tickets.index.ids)), ('{part="memory"}', len(similar_tickets.index.tail_ids))])
+    lines += gauge("devex_write_queue_total", "Write-queue jobs, transactions and failed commits.",
+                   [(f'{{counter="{name}"}}', value) for name, value in write_queue.counters.items()], "counter")
+    lines += gauge("devex_write_queue_depth", "Jobs waiting for the writer thread.", [("", write_queue.jobs.qsize())])
+    responses = response_cache.stats()
+    lines += gauge("devex_response_cache_entries", "Cached ticket/comment responses.", [("", responses.pop("entries"))])
+    lines += gauge("devex_response_cache_total", "Response cache hits, misses and invalidations.",
+                   [(f'{{counter="{name}"}}', value) for name, value in responses.items()], "counter")
+    cache = auth_cache.stats()
+    lines += gauge("devex_auth_cache_entries", "Auth cache size.", [('{kind="tokens"}', cache.pop("tokens")), ('{kind="users"}', cache.pop("users"))])
+    lines += gauge("devex_auth_cache_total", "Auth cache lookups and invalidations.",
+                   [(f'{{counter="{name}"}}', value) for name, value in cache.items()], "counter")
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/ws-stats")
+def read_ws_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return manager.stats()
 
 @app.get("/leaderboard", response_model=List[UserRead])
-def read_leaderboard(session: Session = Depends(get_session)):
-    users = session.exec(select(User).order_by(User.reputation.desc()).limit(10)).all()
-    return users
+def read_leaderboard(window: LeaderboardWindow = LeaderboardWindow.ALL, session: Session = Depends(get_session)):
+    if window == LeaderboardWindow.ALL:
+        return leaderboard.top(session, LEADERBOARD_SIZE)
+    return windowed_leaderboard.top(session, window, LEADERBOARD_SIZE)
 
 # --- TICKET ROUTES ---
 
 @app.post("/tickets", response_model=Ticket)
-def create_ticket(ticket: TicketCreate, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    db_ticket = Ticket.from_orm(ticket)
-    db_ticket.owner_id = current_user.id
-    session.add(db_ticket)
-    current_user.reputation += 10
-    session.add(current_user)
-    session.commit()
-    session.refresh(db_ticket)
+def create_ticket(ticket: TicketCreate, current_user: User = Depends(get_current_user)):
+    def write(session: Session):
+        db_ticket = Ticket.from_orm(ticket)
+        db_ticket.owner_id = current_user.id
+        session.add(db_ticket)
+        session.flush()
+        set_ticket_tags(session, [db_ticket.id], parse_tags(ticket.tags))
+        add_reputation(session, current_user, 10, "ticket_created")
+        return db_ticket
+    db_ticket = write_queue.run_sync(write)
+    similar_tickets.add(db_ticket)
     return db_ticket
 
-@app.get("/tickets", response_model=List[TicketRead])
+@app.post("/tickets/similar", response_model=List[SimilarTicket])
+def read_similar_tickets(
+    draft: TicketDraft,
+    limit: int = Query(SIMILAR_DEFAULT_LIMIT, ge=1, le=SIMILAR_MAX_LIMIT),
+    session: Session = Depends(get_session)
+):
+    """Existing tickets most like a draft (title, description, tags), best match first."""
+    if not SIMILARITY_ENABLED:
+        raise HTTPException(status_code=503, detail="Similar-ticket suggestions need NumPy")
+    return similar_tickets.suggest(session, draft, limit)
+
+def ticket_filters(status: Optional[TicketStatus], priority: Optional[TicketPriority], owner_id: Optional[str],
+                   tags: Optional[str], tag_match: TagMatch, correlated: bool = True, tables: Optional[dict] = None) -> list:
+    tickets = (tables or HOT)[Ticket]
+    clauses = []
+    if status: clauses.append(tickets.c.status == status)
+    if priority: clauses.append(tickets.c.priority == priority)
+    if owner_id: clauses.append(tickets.c.owner_id == owner_id)
+    names = parse_tags(tags)
+    if names: clauses.append(tag_filter(names, tag_match, correlated, tables))
+    if tables is ARCHIVED:
+        # A copy of a ticket that is (back) in main is main's business
+        clauses.append(~select(Ticket.id).where(Ticket.id == tickets.c.id).exists())
+    return clauses
+
+def ticket_list_query(q: Optional[str], status: Optional[TicketStatus], priority: Optional[TicketPriority],
+                      owner_id: Optional[str], tags: Optional[str] = None, tag_match: TagMatch = TagMatch.ANY,
+                      cursor: Optional[str] = None, tables: Optional[dict] = None):
+    """The ticket list with read_tickets' filters and order, over HOT (default) or ARCHIVED.
+    Returns (query, match); match is the FTS expression when searching (rows then carry rank
+    and snippet), else None."""
+    tickets = (tables or HOT)[Ticket]
+    match = fts_query(q) if q else None
+    if match:
+        # Search results are ordered by relevance, so the keyset is (rank, id)
+        hits = search_hits(match, tickets.schema or "main")
+        query = ticket_read_query(hits.c.snippet, hits.c.rank, tables=tables).join(hits, hits.c.ticket_id == tickets.c.id)
+        if cursor:
+            query = query.where(tuple_(hits.c.rank, tickets.c.id) > tuple_(*decode_cursor(cursor, float, str)))
+        query = query.order_by(hits.c.rank, tickets.c.id)
+    else:
+        query = ticket_read_query(tables=tables)
+        if cursor:
+            query = query.where(tuple_(tickets.c.created_at, tickets.c.id) < tuple_(*decode_cursor(cursor, datetime, str)))
+        query = query.order_by(tickets.c.created_at.desc(), tickets.c.id.desc())
+    return query.where(*ticket_filters(status, priority, owner_id, tags, tag_match, tables=tables)), match
+
+def best_ticket_docs(session: Session, match: str, tables: dict, ticket_ids: list) -> dict:
+    # ticket id -> (rank, kind, rowid) of the best match among the ticket and its comments
+    tickets, comments = tables[Ticket], tables[Comment]
+    best = {}
+    for kind, query in (
+        ("ticket", select(literal_column(f"{tickets.fullname}.rowid"), tickets.c.id).where(tickets.c.id.in_(ticket_ids))),
+        ("comment", select(literal_column(f"{comments.fullname}.rowid"), comments.c.ticket_id).where(comments.c.ticket_id.in_(ticket_ids))),
+    ):
+        owner_of = dict(session.execute(query).all()) if ticket_ids else {}
+        for doc, rank in listed_docs(session, match, tickets.schema or "main", kind, owner_of).items():
+            best[owner_of[doc]] = min(best.get(owner_of[doc], (math.inf,)), (rank, kind, doc))
+    return best
+
+def search_page(session: Session, match: str, filters: list, cursor: Optional[str], page_size: int, tables: dict) -> list:
+    """One page of a search over HOT or ARCHIVED: up to page_size + 1 [(rank, ticket row, snippet)]
+    in (rank, id) order, as ticket_list_query would list them. A ticket ranks as its best match
+    (itself or a comment). Only the best documents of each kind are ranked, read and snippeted."""
+    tickets, comments = tables[Ticket], tables[Comment]
+    schema = tickets.schema or "main"
+    ticket_rowid, comment_rowid = literal_column(f"{tickets.fullname}.rowid"), literal_column(f"{comments.fullname}.rowid")
+    after = decode_cursor(cursor, float, str) if cursor else None
+    listed = lambda ranked: sorted(ranked)[:page_size + 1]
+
+    # Narrow filters (an owner, a rare tag): rank the documents of the few tickets that pass
+    narrow = session.execute(select(tickets.c.id).where(*filters).limit(SEARCH_MAX_CANDIDATES + 1)).scalars().all() if filters else []
+    if filters and len(narrow) <= SEARCH_MAX_CANDIDATES:
+        ranked = listed((rank, ticket_id, kind, doc) for ticket_id, (rank, kind, doc) in best_ticket_docs(session, match, tables, narrow).items()
+                        if after is None or (rank, ticket_id) > after)
+        return search_page_rows(session, match, ranked, tables)
+
+    owners = {
+        "ticket": (ticket_rowid, select(ticket_rowid, tickets.c.id).select_from(tickets)),
+        "comment": (comment_rowid, select(comment_rowid, tickets.c.id).select_from(comments).join(tickets, tickets.c.id == comments.c.ticket_id)),
+    }
+    # Ranking sorts every match whatever the limit, so the first read is generous: ties at the
+    # boundary and tickets hit twice would otherwise cost a second one
+    limits, docs, bounds, earlier = dict.fromkeys(FTS_DOCS, (page_size + 1) * SEARCH_GROWTH), {}, {}, {}
+    while True:
+        for kind, limit in limits.items():
+            if kind in docs: continue
+            docs[kind] = best_docs(session, match, schema, kind, limit, after[0] if after else None)
+            bounds[kind] = docs[kind][-1].rank if len(docs[kind]) == limit else math.inf
+        # A ticket none of whose documents were read ranks at `bound` or worse, so a ticket whose
+        # best read document ranks better is final: none of its unread ones can beat it
+        bound, best = min(bounds.values()), {}
+        for kind, (rowid, query) in owners.items():
+            rank_of = dict(docs[kind])
+            for doc, ticket_id in session.execute(query.where(rowid.in_(list(rank_of)), *filters)):
+                best[ticket_id] = min(best.get(ticket_id, (math.inf,)), (rank_of[doc], kind, doc))
+        ranked = [(rank, ticket_id, kind, doc) for ticket_id, (rank, kind, doc) in best.items()
+                  if rank < bound and (after is None or (rank, ticket_id) > after)]
+        if after:
+            # Documents ranked above the cursor were never read: a ticket with one of them was
+            # listed on an earlier page
+            unchecked = [ticket_id for _, ticket_id, _, _ in ranked if ticket_id not in earlier]
+            earlier.update({ticket_id: rank < after[0] for ticket_id, (rank, _, _) in best_ticket_docs(session, match, tables, unchecked).items()})
+            ranked = [hit for hit in ranked if not earlier[hit[1]]]
+        if len(ranked) > page_size or bound == math.inf: break
+        # Short (filtered out, several hits on one ticket, listed before): read more of the kind
+        # whose unread documents hold the page back
+        held_back = [kind for kind in bounds if bounds[kind] == bound]
+        if any(limits[kind] * SEARCH_GROWTH > SEARCH_MAX_CANDIDATES for kind in held_back):
+            # Few of the best matches pass the filters: rank every match against the filtered tickets
+            hits = search_hits(match, schema, snippets=False)
+            query = select(hits.c.rank, tickets.c.id, hits.c.kind, hits.c.doc).join(hits, hits.c.ticket_id == tickets.c.id).where(*filters)
+            if after: query = query.where(tuple_(hits.c.rank, tickets.c.id) > tuple_(*after))
+            ranked = session.execute(query.order_by(hits.c.rank, tickets.c.id).limit(page_size + 1)).all()
+            break
+        for kind in held_back:
+            limits[kind] *= SEARCH_GROWTH
+            del docs[kind]
+    return search_page_rows(session, match, listed(ranked), tables)
+
+def search_page_rows(session: Session, match: str, ranked: list, tables: dict) -> list:
+    # [(rank, ticket id, kind, rowid)] -> [(rank, ticket row, snippet of that document)]
+    tickets, schema = tables[Ticket], tables[Ticket].schema or "main"
+    rows = {row.id: row for row in session.execute(ticket_read_query(tables=tables).where(tickets.c.id.in_([hit[1] for hit in ranked])))}
+    snippets = {kind: listed_docs(session, match, schema, kind, [doc for _, _, k, doc in ranked if k == kind], snippets=True)
+                for kind in FTS_DOCS}
+    return [(rank, rows[ticket_id], snippets[kind].get(doc)) for rank, ticket_id, kind, doc in ranked]
+
+@app.get("/tickets", response_model=Union[List[TicketRead], TicketPage])
 def read_tickets(
     session: Session = Depends(get_session),
     q: Optional[str] = None,
     status: Optional[TicketStatus] = None,
     priority: Optional[TicketPriority] = None,
-    owner_id: Optional[str] = None
+    owner_id: Optional[str] = None,
+    tags: Optional[str] = Query(None, description="Comma-separated tag names"),
+    tag_match: TagMatch = TagMatch.ANY,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
 ):
-    query = select(Ticket)
-    if status: query = query.where(Ticket.status == status)
-    if priority: query = query.where(Ticket.priority == priority)
-    if owner_id: query = query.where(Ticket.owner_id == owner_id)
-    if q: query = query.where(or_(Ticket.title.contains(q), Ticket.description.contains(q)))
-    query = query.order_by(Ticket.created_at.desc())
-    tickets = session.exec(query).all()
-    
-    return [
-        TicketRead(
-            id=t.id, title=t.title, description=t.description,
-            priority=t.priority, status=t.status, tags=t.tags,
-            created_at=t.created_at,
-            owner_name=t.owner.username if t.owner else "Unknown",
-            owner_id=t.owner_id,
-            owner_email=t.owner.email if t.owner else None
-        ) for t in tickets
-    ]
+    page_size = page_params(limit, cursor)
+    match = fts_query(q) if q else None
+    if match and page_size:
+        # Searches also cover the archive: merge its page into main's, both in (rank, id) order
+        hits = sorted((hit for tables in (HOT, ARCHIVED) for hit in search_page(
+            session, match, ticket_filters(status, priority, owner_id, tags, tag_match, tables=tables), cursor, page_size, tables
+        )), key=lambda hit: (hit[0], hit[1].id))
+        rows, ranks, snippets = [hit[1] for hit in hits], [hit[0] for hit in hits], [hit[2] for hit in hits]
+    else:
+        query, match = ticket_list_query(q, status, priority, owner_id, tags, tag_match, cursor)
+        if page_size: query = query.limit(page_size + 1)
+        # Nothing searchable in q (punctuation only) -> nothing can match
+        rows = session.execute(query).all() if match or not q else []
+        if match:
+            archived, _ = ticket_list_query(q, status, priority, owner_id, tags, tag_match, cursor, ARCHIVED)
+            rows = sorted(rows + session.execute(archived).all(), key=lambda row: (row.rank, row.id))
+        ranks = [row.rank for row in rows] if match else None
+        snippets = [row.snippet for row in rows] if match else [None] * len(rows)
 
-@app.get("/tickets/{ticket_id}", response_model=TicketRead)
-def read_ticket_detail(ticket_id: str, session: Session = Depends(get_session)):
-    ticket = session.get(Ticket, ticket_id)
-    if not ticket: raise HTTPException(status_code=404)
-    return TicketRead(
-        id=ticket.id, title=ticket.title, description=ticket.description,
-        priority=ticket.priority, status=ticket.status, tags=ticket.tags,
-        created_at=ticket.created_at,
-        owner_name=ticket.owner.username if ticket.owner else "Unknown",
-        owner_id=ticket.owner_id,
-        owner_email=ticket.owner.email if ticket.owner else None
+    next_cursor = None
+    if page_size and len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(ranks[page_size - 1], last.id) if match else encode_cursor(last.created_at, last.id)
+
+    items = [to_ticket_read(row, snippet) for row, snippet in zip(rows, snippets)]
+    if page_size is None: return items
+    return TicketPage(items=items, next_cursor=next_cursor)
+
+@app.get("/tickets/facets", response_model=TicketFacets)
+def read_ticket_facets(
+    session: Session = Depends(get_session),
+    q: Optional[str] = None,
+    status: Optional[TicketStatus] = None,
+    priority: Optional[TicketPriority] = None,
+    owner_id: Optional[str] = None,
+    tags: Optional[str] = Query(None, description="Comma-separated tag names"),
+    tag_match: TagMatch = TagMatch.ANY
+):
+    """Ticket counts per status, priority and tag for the same filters as GET /tickets."""
+    if not q and not owner_id and not parse_tags(tags):
+        # Only status/priority filters (or none): answered from the trigger-maintained counters
+        def selected(row) -> bool:
+            return status in (None, TicketStatus[row.status]) and priority in (None, TicketPriority[row.priority])
+        grouped = [
+            (TicketStatus[row.status], TicketPriority[row.priority], row.tickets)
+            for row in session.execute(text("SELECT status, priority, tickets FROM ticket_counter WHERE tickets > 0")) if selected(row)
+        ]
+        tag_totals: Dict[int, int] = {}
+        for row in session.execute(text("SELECT tag_id, status, priority, tickets FROM tag_counter WHERE tickets > 0")):
+            if selected(row): tag_totals[row.tag_id] = tag_totals.get(row.tag_id, 0) + row.tickets
+        top = sorted(tag_totals.items(), key=lambda item: -item[1])[:FACET_TAG_LIMIT]
+        names = dict(session.execute(select(Tag.id, Tag.name).where(Tag.id.in_([tag_id for tag_id, _ in top]))).all())
+        tag_rows = sorted(((names[tag_id], count) for tag_id, count in top), key=lambda item: (-item[1], item[0]))
+    else:
+        match = fts_query(q) if q else None
+        grouped, tag_totals = [], {}
+        # Like GET /tickets, a search also counts archived tickets
+        for tables in (HOT, ARCHIVED) if match else (HOT,):
+            tickets, links = tables[Ticket], tables[TicketTag]
+            filtered = select(tickets.c.id).where(*ticket_filters(status, priority, owner_id, tags, tag_match, correlated=False, tables=tables))
+            if match:
+                hits = search_hits(match, tickets.schema or "main")
+                filtered = filtered.join(hits, hits.c.ticket_id == tickets.c.id)
+            elif q:
+                # Nothing searchable in q (punctuation only) -> nothing can match
+                filtered = filtered.where(false())
+            filtered = filtered.subquery()
+            grouped += session.execute(
+                select(tickets.c.status, tickets.c.priority, func.count()).join(filtered, filtered.c.id == tickets.c.id)
+                .group_by(tickets.c.status, tickets.c.priority)
+            ).all()
+            count = func.count().label("count")
+            for name, tickets_with_tag in session.execute(
+                select(Tag.name, count).select_from(links).join(filtered, filtered.c.id == links.c.ticket_id)
+                .join(Tag, Tag.id == links.c.tag_id).group_by(Tag.id).order_by(count.desc(), Tag.name).limit(FACET_TAG_LIMIT)
+            ):
+                tag_totals[name] = tag_totals.get(name, 0) + tickets_with_tag
+        tag_rows = sorted(tag_totals.items(), key=lambda item: (-item[1], item[0]))[:FACET_TAG_LIMIT]
+    by_status, by_priority = {s: 0 for s in TicketStatus}, {p: 0 for p in TicketPriority}
+    for row_status, row_priority, tickets in grouped:
+        by_status[row_status] += tickets
+        by_priority[row_priority] += tickets
+    return TicketFacets(
+        total=sum(by_status.values()), status=by_status, priority=by_priority,
+        tags=[TagCount(name=name, count=count) for name, count in tag_rows]
+    )
+
+@app.get("/tickets/stats", response_model=TicketStats)
+def read_ticket_stats(
+    session: Session = Depends(get_session),
+    owner_id: Optional[str] = None,
+    days: int = Query(30, ge=1, le=STATS_MAX_DAYS)
+):
+    """Dashboard numbers for every ticket, or for one owner's, read from the trigger-maintained
+    aggregates: a bounded number of rows whatever the size of the ticket table. Archived
+    tickets count too; the archive keeps its own aggregates, which are added to main's."""
+    scope = owner_id or ALL_OWNERS
+    if owner_id:
+        counts = session.execute(text(all_schemas("SELECT status, priority, tickets FROM {schema}.owner_ticket_counter WHERE owner_id = :owner_id")), {"owner_id": owner_id})
+    else:
+        counts = session.execute(text(all_schemas("SELECT status, priority, tickets FROM {schema}.ticket_counter")))
+    by_status, by_priority = {s: 0 for s in TicketStatus}, {p: 0 for p in TicketPriority}
+    for row in counts:
+        by_status[TicketStatus[row.status]] += row.tickets
+        by_priority[TicketPriority[row.priority]] += row.tickets
+    daily_stats = all_schemas("SELECT day, created, solved, solve_seconds FROM {schema}.ticket_daily_stats WHERE scope = :scope")
+    solved, seconds = session.execute(
+        text(f"SELECT sum(solved), sum(solve_seconds) FROM ({daily_stats})"), {"scope": scope}
+    ).one()
+    today = datetime.utcnow().date()
+    first = today - timedelta(days=days - 1)
+    rows = {row.day: row for row in session.execute(text(f"""
+        SELECT day, sum(created) AS created, sum(solved) AS solved, sum(solve_seconds) AS solve_seconds
+        FROM ({daily_stats}) WHERE day >= :first GROUP BY day
+    """), {"scope": scope, "first": first.isoformat()})}
+    daily = []
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        row = rows.get(day.isoformat())
+        daily.append(DailyTicketStats(
+            day=day, created=row.created if row else 0, solved=row.solved if row else 0,
+            avg_solve_seconds=round(row.solve_seconds / row.solved, 1) if row and row.solved else None
+        ))
+    return TicketStats(
+        total=sum(by_status.values()), status=by_status, priority=by_priority,
+        avg_solve_seconds=round(seconds / solved, 1) if solved else None, daily=daily
     )
 
+EXPORT_CSV_COLUMNS = [
+    "ticket_id", "title", "description", "priority", "status", "tags", "created_at",
+    "owner_id", "owner_name", "owner_email",
+    "comment_id", "comment_author", "comment_author_role", "comment_created_at", "comment_content", "comment_attachment_url",
+]
+
+def export_batches(parts: list, match: Optional[str]):
+    """Yields lists of TicketExport, EXPORT_CHUNK_SIZE tickets at a time, from each (query, tables)
+    in `parts` in turn. Runs in its own session: the request's session is closed before a
+    streaming body is sent."""
+    with Session(engine) as session:
+        for query, tables in parts:
+            comments_table = tables[Comment]
+            result = session.execute(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+            for rows in result.partitions():
+                # One comment query per batch, not per ticket
+                comments = session.execute(
+                    comment_read_query(comments_table.c.ticket_id, tables=tables)
+                    .where(comments_table.c.ticket_id.in_([row.id for row in rows]))
+                    .order_by(comments_table.c.ticket_id, comments_table.c.created_at, comments_table.c.id)
+                ).all()
+                rendered = rendered_attachments(session, [c.attachment_url for c in comments])
+                threads: Dict[str, list] = {}
+                for c in comments:
+                    threads.setdefault(c.ticket_id, []).append(to_comment_read(c, rendered))
+                yield [
+                    TicketExport(**to_ticket_read(row, row.snippet if match else None).model_dump(), comments=threads.get(row.id, []))
+                    for row in rows
+                ]
+
+def export_ndjson(batches):
+    for batch in batches:
+        yield "".join(ticket.model_dump_json() + "\n" for ticket in batch)
+
+def export_csv(batches):
+    # One line per comment (tickets without comments get one line with empty comment columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    for batch in batches:
+        for t in batch:
+            ticket = [t.id, t.title, t.description, t.priority.value, t.status.value, t.tags, t.created_at.isoformat(),
+                      t.owner_id, t.owner_name, t.owner_email]
+            for c in t.comments or [None]:
+                writer.writerow(ticket + ([c.id, c.author_name, c.author_role, c.created_at.isoformat(), c.content, c.attachment_url] if c else [None] * 6))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+@app.get("/admin/export/tickets")
+def export_tickets(
+    current_user: User = Depends(get_current_user),
+    format: ExportFormat = ExportFormat.NDJSON,
+    q: Optional[str] = None,
+    status: Optional[TicketStatus] = None,
+    priority: Optional[TicketPriority] = None,
+    owner_id: Optional[str] = None,
+    tags: Optional[str] = None,
+    tag_match: TagMatch = TagMatch.ANY
+):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    # Main's tickets, then the archive's. A ticket briefly in both (mid-archive or mid-restore)
+    # is exported once, from main, as the read paths show it (ticket_filters skips its archive copy).
+    parts = []
+    for tables in (HOT, ARCHIVED):
+        query, match = ticket_list_query(q, status, priority, owner_id, tags, tag_match, tables=tables)
+        # Punctuation-only q can't match anything; fall through to an empty export
+        if q and not match: query = query.where(false())
+        parts.append((query, tables))
+    # A sync generator: Starlette iterates it in the threadpool, so the reads stay off the event loop
+    batches = export_batches(parts, match)
+    stream, media_type = (export_csv(batches), "text/csv") if format == ExportFormat.CSV else (export_ndjson(batches), "application/x-ndjson")
+    filename = f"tickets-{datetime.utcnow():%Y%m%d-%H%M%S}.{format.value}"
+    return StreamingResponse(stream, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/tickets/{ticket_id}", response_model=TicketRead)
+def read_ticket_detail(ticket_id: str, request: Request, session: Session = Depends(get_session)):
+    def render() -> bytes:
+        row = session.execute(ticket_read_query().where(Ticket.id == ticket_id)).first()
+        if not row:
+            archived = ARCHIVED[Ticket]
+            row = session.execute(ticket_read_query(tables=ARCHIVED).where(archived.c.id == ticket_id)).first()
+        if not row: raise HTTPException(status_code=404)
+        return to_ticket_read(row).model_dump_json().encode()
+    return cached_ticket_response(request, session, ticket_id, render)
+
 @app.patch("/tickets/{ticket_id}", response_model=Ticket)
 def update_ticket(
     ticket_id: str, 
     ticket_update: dict, 
-    session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    ticket = session.get(Ticket, ticket_id)
-    if not ticket: raise HTTPException(status_code=404, detail="Ticket not found")
-    
-    # --- PERMISSION CHECK ---
-    # Only Admin OR Ticket Owner can edit/resolve
-    if current_user.role != UserRole.ADMIN and ticket.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="You are not authorized to manage this ticket.")
-    
-    if "status" in ticket_update:
-        if ticket_update["status"] == "solved" and ticket.status != "solved":
-             current_user.reputation += 20
-             session.add(current_user)
-        ticket.status = ticket_update["status"]
+    def write(session: Session):
+        ticket = writable_ticket(session, ticket_id)
+        if not ticket: raise HTTPException(status_code=404, detail="Ticket not found")
         
-    session.add(ticket)
-    session.commit()
-    session.refresh(ticket)
-    return ticket
+        # --- PERMISSION CHECK ---
+        # Only Admin OR Ticket Owner can edit/resolve
+        if current_user.role != UserRole.ADMIN and ticket.owner_id != current_user.id:
+            raise HTTPException(status_code=403, detail="You are not authorized to manage this ticket.")
+        
+        if "status" in ticket_update:
+            try:
+                new_status = TicketStatus(ticket_update["status"])
+            except ValueError:
+                raise HTTPException(status_code=422, detail="Invalid status")
+            if new_status == TicketStatus.SOLVED and ticket.status != TicketStatus.SOLVED:
+                add_reputation(session, current_user, 20, "ticket_solved")
+                ticket.solved_at = datetime.utcnow()
+            elif new_status != TicketStatus.SOLVED:
+                ticket.solved_at = None
+            ticket.status = new_status
+            
+        session.add(ticket)
+        bump_ticket_version(session, ticket_id)
+        return ticket
+    return write_queue.run_sync(write)
+
+def manageable_tickets(session: Session, ids: List[str], user: User) -> list:
+    # Same rule as update_ticket: admins manage any ticket, everyone else only their own
+    restore_tickets(session, ids, None if user.role == UserRole.ADMIN else user.id)
+    query = select(Ticket.id, Ticket.status).where(Ticket.id.in_(ids))
+    if user.role != UserRole.ADMIN: query = query.where(Ticket.owner_id == user.id)
+    return session.exec(query).all()
+
+@app.post("/tickets/bulk-update")
+def bulk_update_tickets(request: TicketBulkUpdate, current_user: User = Depends(get_current_user)):
+    values = request.model_dump(include={"status", "priority", "tags"}, exclude_none=True)
+    if not values: raise HTTPException(status_code=422, detail="Nothing to update")
+    if request.status == TicketStatus.SOLVED:
+        # Already-solved tickets keep their original solve time
+        values["solved_at"] = func.coalesce(Ticket.solved_at, datetime.utcnow())
+    elif request.status is not None:
+        values["solved_at"] = None
+    def write(session: Session):
+        tickets = manageable_tickets(session, request.ids, current_user)
+        ids = [t.id for t in tickets]
+        if not ids: return ids
+        if request.status == TicketStatus.SOLVED:
+            # Same reward as solving them one by one through update_ticket
+            newly_solved = sum(1 for t in tickets if t.status != TicketStatus.SOLVED)
+            if newly_solved: add_reputation(session, current_user, 20 * newly_solved, "ticket_solved")
+        session.exec(update(Ticket).where(Ticket.id.in_(ids)).values(**values))
+        if request.tags is not None: set_ticket_tags(session, ids, parse_tags(request.tags))
+        bump_ticket_versions(session, ids)
+        return ids
+    updated = write_queue.run_sync(write)
+    return {"ok": True, "updated_count": len(updated), "skipped": sorted(set(request.ids) - set(updated))}
+
+@app.post("/tickets/bulk-delete")
+def bulk_delete_tickets(delete_req: DeleteRequest, current_user: User = Depends(get_current_user)):
+    def write(session: Session):
+        ids = [t.id for t in manageable_tickets(session, delete_req.ids, current_user)]
+        if not ids: return ids
+        session.exec(delete(Comment).where(Comment.ticket_id.in_(ids)))
+        # Notifications only point at a ticket through their link
+        session.exec(delete(Notification).where(Notification.link.in_([f"/dashboard/tickets/{t}" for t in ids])))
+        session.exec(delete(TicketVersion).where(TicketVersion.ticket_id.in_(ids)))
+        session.exec(delete(TicketTag).where(TicketTag.ticket_id.in_(ids)))
+        session.exec(delete(Ticket).where(Ticket.id.in_(ids)))
+        session.info.setdefault("changed_tickets", set()).update(ids)
+        return ids
+    deleted = write_queue.run_sync(write)
+    return {"ok": True, "deleted_count": len(deleted), "skipped": sorted(set(delete_req.ids) - set(deleted))}
 
 # --- COMMENT, UPLOAD & NOTIFICATION ROUTES ---
 
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    file_ext = file.filename.split(".")[-1]
-    file_name = f"{uuid.uuid4()}.{file_ext}"
-    file_path = f"static/{file_name}"
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"url": f"http://localhost:8000/static/{file_name}"}
+    digest, size, _, content_type = await attachment_store.save(file)
+    extension = file.filename.rsplit(".", 1)[-1].lower() if "." in (file.filename or "") else ""
+
+    # Only the job row is written here; rendering happens in the background pipeline
+    render = DERIVATIVES_ENABLED and content_type in DERIVATIVE_IMAGE_TYPES
+    def write(session: Session):
+        if not session.get(Attachment, digest):
+            session.add(Attachment(sha256=digest, size=size, content_type=content_type, extension=extension))
+            if render:
+                session.add(DerivativeJob(sha256=digest))
+    await write_queue.run(write)
+    if render: derivative_pipeline.notify()
+
+    name = f"{digest}.{extension}" if extension else digest
+    return {"url": f"{PUBLIC_BASE_URL}/attachments/{name}", "sha256": digest, "size": size}
+
+@app.get("/attachments/{name}")
+def read_attachment(name: str, request: Request, session: Session = Depends(get_session)):
+    # The name is <sha256>[.<ext>] for originals, <sha256>.<variant>.webp for derivatives.
+    # The extension is only there for browsers: the type served is the one sniffed at upload.
+    digest, _, extension = name.partition(".")
+    if not re.fullmatch(r"[0-9a-f]{64}", digest): raise HTTPException(status_code=404)
+    path, etag = attachment_store.path_for(digest), digest
+    variant = extension[:-len(".webp")] if extension.endswith(".webp") else None
+    if variant in VARIANTS:
+        path, etag = variant_path(path, variant), f"{digest}-{variant}"
+    if not os.path.exists(path): raise HTTPException(status_code=404)
+
+    # Content never changes for a given name: strong ETag + cache forever
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "public, max-age=31536000, immutable", "X-Content-Type-Options": "nosniff"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if f'"{etag}"' in if_none_match or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    # Derivatives are WebP we rendered ourselves
+    content_type = "image/webp" if variant in VARIANTS else session.exec(select(Attachment.content_type).where(Attachment.sha256 == digest)).first()
+    media_type, extra = download_headers(content_type, name)
+    # FileResponse streams from disk and answers Range requests with 206 partial content
+    return FileResponse(path, media_type=media_type, headers={**headers, **extra})
 
 @app.post("/tickets/{ticket_id}/comments", response_model=CommentRead)
 async def create_comment(
     ticket_id: str, 
     comment: CommentCreate, 
-    session: Session = Depends(get_session), 
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_async)
 ):
-    ticket = session.get(Ticket, ticket_id)
-    if not ticket: raise HTTPException(status_code=404, detail="Ticket not found")
-    
-    db_comment = Comment(
-        content=comment.content,
-        attachment_url=comment.attachment_url,
-        ticket_id=ticket_id,
-        author_id=current_user.id
-    )
-    session.add(db_comment)
-    
-    current_user.reputation += 5
-    session.add(current_user)
-    
-    # Notify owner (if not same person)
-    if ticket.owner_id and ticket.owner_id != current_user.id:
-        notif = Notification(
-            recipient_id=ticket.owner_id,
-            content=f"{current_user.username} commented on your ticket: {ticket.title}",
-            link=f"/dashboard/tickets/{ticket.id}"
-        )
-        session.add(notif)
-        session.commit()
-        session.refresh(notif)
+    def write(session: Session):
+        # Commenting on an archived ticket brings it back to main
+        ticket = writable_ticket(session, ticket_id)
+        if not ticket: raise HTTPException(status_code=404, detail="Ticket not found")
+        # Writes are serialized, so max + 1 can't race (the unique index would catch it anyway)
+        last_seq = session.exec(select(func.max(Comment.seq)).where(Comment.ticket_id == ticket_id)).one()
         
-        # Send to ALL active connections for this user
-        await manager.send_personal_message(ticket.owner_id, {
-            "type": "notification",
-            "content": notif.content,
-            "link": notif.link
-        })
-
-    session.commit()
-    session.refresh(db_comment)
-    
-    # Convert to DTO
-    response_dto = CommentRead(
-        id=db_comment.id, 
-        content=db_comment.content, 
-        attachment_url=db_comment.attachment_url,
-        created_at=db_comment.created_at,
-        author_name=current_user.username, 
-        author_role=current_user.role
-    )
-    
-    ws_data = response_dto.dict()
-    ws_data['created_at'] = ws_data['created_at'].isoformat()
-    ws_data['type'] = 'chat'
-    await manager.broadcast_ticket(ticket_id, ws_data)
-    
+        db_comment = Comment(
+            content=comment.content,
+            attachment_url=comment.attachment_url,
+            ticket_id=ticket_id,
+            author_id=current_user.id,
+            seq=(last_seq or 0) + 1
+        )
+        session.add(db_comment)
+        add_reputation(session, current_user, 5, "comment_posted")
+        bump_ticket_version(session, ticket_id)
+
+        # Convert to DTO
+        digest = attachment_digest(db_comment.attachment_url)
+        rendered = rendered_attachments(session, [comment.attachment_url])
+        response_dto = CommentRead(
+            id=db_comment.id, 
+            content=db_comment.content, 
+            attachment_url=db_comment.attachment_url,
+            attachment_thumb_url=derivative_url(digest, "thumb") if digest in rendered else None,
+            attachment_preview_url=derivative_url(digest, "preview") if digest in rendered else None,
+            created_at=db_comment.created_at,
+            author_name=current_user.username, 
+            author_role=current_user.role,
+            seq=db_comment.seq
+        )
+
+        # Room broadcast and the owner's notification (if not same person) go through the outbox
+        notify = None
+        if ticket.owner_id and ticket.owner_id != current_user.id:
+            notify = {"recipient_id": ticket.owner_id, "author": current_user.username, "title": ticket.title}
+        message = {**response_dto.model_dump(mode="json"), "type": "chat"}
+        session.add(OutboxEvent(kind="comment", payload=json.dumps({"ticket_id": ticket_id, "message": message, "notify": notify})))
+        return response_dto
+
+    # One transaction on the writer thread; delivery to sockets happens off the request path
+    response_dto = await write_queue.run(write)
+    outbox.notify()
     return response_dto
 
-@app.get("/tickets/{ticket_id}/comments", response_model=List[CommentRead])
-def read_comments(ticket_id: str, session: Session = Depends(get_session)):
-    comments = session.exec(select(Comment).where(Comment.ticket_id == ticket_id).order_by(Comment.created_at.asc())).all()
-    return [
-        CommentRead(
-            id=c.id, content=c.content, attachment_url=c.attachment_url, created_at=c.created_at,
-            author_name=c.author.username if c.author else "Unknown",
-            author_role=c.author.role if c.author else "user"
-        ) for c in comments
-    ]
-
-@app.get("/notifications", response_model=List[NotificationRead])
-def read_notifications(session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    return session.exec(select(Notification).where(Notification.recipient_id == current_user.id).order_by(Notification.created_at.desc())).all()
+comment_list_adapter = TypeAdapter(List[CommentRead])
+
+@app.get("/tickets/{ticket_id}/comments", response_model=Union[List[CommentRead], CommentPage])
+def read_comments(
+    ticket_id: str,
+    request: Request,
+    session: Session = Depends(get_session),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    page_size = page_params(limit, cursor)
+    def thread(tables: dict) -> list:
+        comments = tables[Comment]
+        query = comment_read_query(tables=tables).where(comments.c.ticket_id == ticket_id)
+        if cursor:
+            query = query.where(tuple_(comments.c.created_at, comments.c.id) > tuple_(*decode_cursor(cursor, datetime, str)))
+        query = query.order_by(comments.c.created_at.asc(), comments.c.id.asc())
+        if page_size: query = query.limit(page_size + 1)
+        return session.execute(query).all()
+
+    def render() -> bytes:
+        rows = thread(HOT)
+        # Nothing in main: the ticket may be archived (one primary key probe to find out)
+        if not rows and session.execute(select(ARCHIVED[Ticket].c.id).where(ARCHIVED[Ticket].c.id == ticket_id)).first():
+            rows = thread(ARCHIVED)
+
+        next_cursor = None
+        if page_size and len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+        rendered = rendered_attachments(session, [row.attachment_url for row in rows])
+        items = [to_comment_read(row, rendered) for row in rows]
+        if page_size is None: return comment_list_adapter.dump_json(items)
+        return CommentPage(items=items, next_cursor=next_cursor).model_dump_json().encode()
+    return cached_ticket_response(request, session, ticket_id, render)
+
+@app.get("/notifications", response_model=Union[List[NotificationRead], NotificationPage])
+def read_notifications(
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    unread: bool = False
+):
+    page_size = page_params(limit, cursor)
+    query = select(Notification).where(Notification.recipient_id == current_user.id)
+    if unread: query = query.where(Notification.is_read == False)
+    if cursor:
+        query = query.where(tuple_(Notification.created_at, Notification.id) < tuple_(*decode_cursor(cursor, datetime, str)))
+    query = query.order_by(Notification.created_at.desc(), Notification.id.desc())
+    if page_size: query = query.limit(page_size + 1)
+    notifications = session.exec(query).all()
+    if page_size is None: return notifications
+
+    next_cursor = None
+    if len(notifications) > page_size:
+        notifications = notifications[:page_size]
+        next_cursor = encode_cursor(notifications[-1].created_at, notifications[-1].id)
+    return NotificationPage(items=notifications, next_cursor=next_cursor)
+
+@app.get("/notifications/unread-count")
+def read_unread_count(session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
+    unread = session.execute(
+        text("SELECT unread FROM notification_counter WHERE user_id = :user_id"), {"user_id": current_user.id}
+    ).scalar()
+    return {"unread": unread or 0}
+
+@app.post("/notifications/read")
+def mark_notifications_read(request: MarkReadRequest, current_user: User = Depends(get_current_user)):
+    # One set-based UPDATE for the whole selection; the counter trigger keeps the unread count in step
+    def write(session: Session):
+        query = update(Notification).where(Notification.recipient_id == current_user.id, Notification.is_read == False)
+        if request.ids is not None: query = query.where(Notification.id.in_(request.ids))
+        return session.exec(query.values(is_read=True)).rowcount
+    return {"ok": True, "updated": write_queue.run_sync(write)}
+
+@app.post("/admin/notifications/compact")
+def compact_old_notifications(
+    older_than_days: int = Query(NOTIFICATION_RETENTION_DAYS, ge=1),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {"deleted": compact_notifications(older_than_days)}
+
+@app.post("/admin/tickets/archive")
+def archive_old_tickets(
+    solved_before_days: int = Query(ARCHIVE_AFTER_DAYS, ge=1),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {"archived": archive_solved_tickets(solved_before_days)}
 
 @app.post("/notifications/{notif_id}/read")
-def mark_notification_read(notif_id: str, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    notif = session.get(Notification, notif_id)
-    if not notif or notif.recipient_id != current_user.id:
-        raise HTTPException(status_code=404)
-    notif.is_read = True
-    session.add(notif)
-    session.commit()
+def mark_notification_read(notif_id: str, current_user: User = Depends(get_current_user)):
+    def write(session: Session):
+        notif = session.get(Notification, notif_id)
+        if not notif or notif.recipient_id != current_user.id:
+            raise HTTPException(status_code=404)
+        notif.is_read = True
+        session.add(notif)
+    write_queue.run_sync(write)
     return {"ok": True}
 
+def missed_comments(ticket_id: str, after_seq: int) -> List[tuple]:
+    # One page of a ticket's stream from the database, encoded exactly like the live "chat" messages
+    with Session(engine) as session:
+        rows = session.execute(
+            comment_read_query().where(Comment.ticket_id == ticket_id, Comment.seq > after_seq)
+            .order_by(Comment.seq).limit(WS_REPLAY_PAGE_SIZE)
+        ).all()
+        rendered = rendered_attachments(session, [row.attachment_url for row in rows])
+    return [(row.seq, manager.encode({**to_comment_read(row, rendered).model_dump(mode="json"), "type": "chat"})) for row in rows]
+
 @app.websocket("/ws/ticket/{ticket_id}")
-async def websocket_ticket(websocket: WebSocket, ticket_id: str):
-    await manager.connect_ticket(websocket, ticket_id)
+async def websocket_ticket(websocket: WebSocket, ticket_id: str, last_seq: Optional[int] = None):
+    # ?last_seq=N when reconnecting: everything after N is replayed before live messages resume
+    await manager.connect_ticket(websocket, ticket_id, paused=last_seq is not None)
     try:
+        if last_seq is not None:
+            await manager.resume_ticket(websocket, ticket_id, last_seq, missed_comments)
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect_ticket(websocket, ticket_id)
 
 @app.websocket("/ws/user/{user_id}")
@@ -536,4 +3596,6 @@ async def websocket_user(websocket: WebSocket, user_id: str):
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect_user(websocket, user_id)
\ No newline at end of file
@@ -0,0 +1,94 @@
+import argparse
+from main import (
+    create_db_and_tables, rebuild_search_index, rebuild_counters, rebuild_tag_index, rebuild_ticket_stats,
+    compact_notifications, archive_solved_tickets, vacuum_databases, similar_tickets,
+    NOTIFICATION_RETENTION_DAYS, ARCHIVE_AFTER_DAYS, ARCHIVE_FILE_NAME, SIMILARITY_ENABLED, SIMILARITY_FILE
+)
+
+def rebuild_search(args):
+    create_db_and_tables()
+    print("🔎 Rebuilding full-text search index...")
+    rebuild_search_index()
+    print("✅ Search index rebuilt.")
+
+def rebuild_counters_cmd(args):
+    create_db_and_tables()
+    print("🔢 Recomputing unread notification and ticket counters...")
+    rebuild_counters()
+    print("✅ Counters rebuilt.")
+
+def rebuild_tags(args):
+    create_db_and_tables()
+    print("🏷️  Rebuilding tag index from ticket.tags...")
+    rebuild_tag_index()
+    print("✅ Tag index rebuilt.")
+
+def rebuild_stats(args):
+    create_db_and_tables()
+    print("📊 Backfilling solve times and recomputing ticket stats...")
+    rebuild_ticket_stats()
+    print("✅ Ticket stats rebuilt.")
+
+def compact_notifications_cmd(args):
+    create_db_and_tables()
+    print(f"🧹 Deleting read notifications older than {args.days} days...")
+    deleted = compact_notifications(args.days)
+    print(f"✅ Deleted {deleted} notifications.")
+
+def archive_tickets(args):
+    create_db_and_tables()
+    print(f"🗄️  Moving tickets solved more than {args.days} days ago to {ARCHIVE_FILE_NAME}...")
+    moved = archive_solved_tickets(args.days)
+    print(f"✅ Archived {moved} tickets.")
+
+def vacuum(args):
+    create_db_and_tables()
+    print(f"🧽 Vacuuming the databases (including {ARCHIVE_FILE_NAME}) and rebuilding the search index...")
+    vacuum_databases()
+    print("✅ Databases compacted, search index rebuilt.")
+
+def rebuild_similar(args):
+    if not SIMILARITY_ENABLED:
+        print("❌ NumPy is not installed; similar-ticket suggestions are disabled.")
+        return
+    create_db_and_tables()
+    print(f"🧭 Rebuilding similar-ticket index in {SIMILARITY_FILE}...")
+    similar_tickets.rebuild()
+    print(f"✅ Indexed {len(similar_tickets.index)} tickets.")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="DevExchange maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("rebuild-search", help="Rebuild the FTS5 index over tickets and comments")
+    cmd.set_defaults(func=rebuild_search)
+
+    cmd = commands.add_parser("rebuild-counters", help="Recompute trigger-maintained counters from the base tables")
+    cmd.set_defaults(func=rebuild_counters_cmd)
+
+    cmd = commands.add_parser("rebuild-tags", help="Rebuild tag links and tag counters from ticket.tags")
+    cmd.set_defaults(func=rebuild_tags)
+
+    cmd = commands.add_parser("rebuild-stats", help="Backfill ticket.solved_at and recompute the dashboard stats tables")
+    cmd.set_defaults(func=rebuild_stats)
+
+    cmd = commands.add_parser("compact-notifications", help="Delete read notifications past the retention window")
+    cmd.add_argument("--days", type=int, default=NOTIFICATION_RETENTION_DAYS)
+    cmd.set_defaults(func=compact_notifications_cmd)
+
+    cmd = commands.add_parser("archive-tickets", help="Move old solved tickets (with comments and read notifications) to the archive database")
+    cmd.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive tickets solved more than this many days ago")
+    cmd.set_defaults(func=archive_tickets)
+
+    cmd = commands.add_parser("vacuum", help="VACUUM both databases to reclaim free space, then rebuild the search index "
+                                           "(VACUUM may renumber the rowids it is keyed on)")
+    cmd.set_defaults(func=vacuum)
+
+    cmd = commands.add_parser("rebuild-similar", help="Rebuild the signature index behind POST /tickets/similar")
+    cmd.set_defaults(func=rebuild_similar)
+
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.func(args)
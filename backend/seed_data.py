@@ -1,116 +1,234 @@
-from sqlmodel import Session, select
-from main import User, Ticket, Comment, UserRole, TicketPriority, TicketStatus, engine, create_db_and_tables
+"""Deterministic synthetic data generator.
+
+    python seed_data.py                                   # small dev database
+    python seed_data.py --users 20000 --tickets 1000000 --comments 3000000 --notifications 2000000
+
+Every row is a pure function of (--seed, table, row index), so the same arguments always
+produce the same dataset regardless of --workers. Rows are generated in parallel chunks
+and written with Core executemany in one transaction per table; secondary indexes and the
+trigger-maintained derived data (search index, tag index, counters, stats) are built once
+after the load.
+"""
+from sqlmodel import SQLModel
+from main import (
+    User, Ticket, Comment, Notification, ReputationEvent, UserRole, TicketPriority, TicketStatus,
+    write_engine, create_db_and_tables, SQLITE_FILE_NAME, ARCHIVE_FILE_NAME, SIMILARITY_FILE, OPENING_BALANCE_REASON
+)
 from faker import Faker
-import random
+from faker.providers.lorem.en_US import Provider as LoremProvider
 from datetime import datetime, timedelta
+import multiprocessing
+import argparse
+import random
+import time
+import uuid
 import os
 
-fake = Faker()
+TAGS = ["python", "react", "docker", "bug", "feature", "deployment", "css", "api", "database", "nextjs"]
+PRIORITIES = [p.name for p in TicketPriority]
+STATUSES = [s.name for s in TicketStatus]
+ATTACHMENT_URL = "https://picsum.photos/400/300"
+# boss and intern always exist (same ids for a given seed) so benchmarks and demos can log in
+KEY_USERS = [
+    ("boss", UserRole.ADMIN.name, "Big Boss", "admin@devexchange.com", "System Administrator", 1000),
+    ("intern", UserRole.USER.name, "New Hire", "intern@devexchange.com", "Learning the ropes", 50),
+]
+
+WORDS = LoremProvider.word_list
+HANDLE_POOL_SIZE = 2000
+
+fake = None
+handles = []
+
+def init_worker(seed: int):
+    # Faker is far too slow to call per row at millions of rows: it is only used for users
+    # (few) and, once per worker, for a pool of handles. Bulk text is composed from the
+    # chunk's own RNG, which keeps it deterministic.
+    global fake, handles
+    fake = Faker()
+    fake.seed_instance(f"{seed}:handles")
+    handles = [fake.user_name() for _ in range(HANDLE_POOL_SIZE)]
+
+def sentence(rng: random.Random, min_words: int = 4, max_words: int = 12) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(min_words, max_words))).capitalize() + "."
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(sentence(rng) for _ in range(sentences))
+
+def title(rng: random.Random) -> str:
+    return sentence(rng, 4, 8)[:-1]
+
+def entity_id(seed: int, kind: str, index: int) -> str:
+    # Derived, not stored: any chunk can reference user #i or ticket #j without a lookup
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{seed}:{kind}:{index}"))
+
+def row_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def ticket_created_at(cfg: dict, index: int) -> datetime:
+    # Tickets are spread evenly over the window in index order, like real creation order
+    span = timedelta(days=cfg["days"])
+    return cfg["anchor"] - span + span * (index + 0.5) / cfg["tickets"]
 
-def seed_data():
+def pick_ticket(cfg: dict, rng: random.Random) -> int:
+    # Skewed towards recent tickets: most activity lands on a small, hot set of threads
+    return cfg["tickets"] - 1 - int(cfg["tickets"] * rng.random() ** 3)
+
+def gen_users(cfg, rng, start, stop):
+    rows = []
+    for i in range(start, stop):
+        if i < len(KEY_USERS):
+            username, role, full_name, email, bio, reputation = KEY_USERS[i]
+        else:
+            username = f"{fake.user_name()}{i}"
+            role = rng.choice([UserRole.USER.name, UserRole.MANAGER.name])
+            full_name, email, bio = fake.name(), fake.email(), fake.sentence()
+            reputation = rng.randint(0, 500)
+        rows.append((entity_id(cfg["seed"], "user", i), username, "123", role, full_name, email, bio, True, reputation))
+    return rows
+
+def gen_reputation_events(cfg, rng, start, stop):
+    # One opening-balance event per user, so the ledger sums to user.reputation. It is dated
+    # before the generated history: the balance was earned before it, not within any window.
+    users = generate_chunk(("gen_users", cfg, start, stop))
+    return [
+        (user[0], user[8], OPENING_BALANCE_REASON, cfg["anchor"] - timedelta(days=cfg["days"], seconds=rng.randint(1, 86400)))
+        for user in users
+    ]
+
+def gen_tickets(cfg, rng, start, stop):
+    rows = []
+    for i in range(start, stop):
+        status, created_at = rng.choice(STATUSES), ticket_created_at(cfg, i)
+        # Solved somewhere between minutes and a few days later, never after the anchor
+        solved_at = min(created_at + timedelta(minutes=rng.randint(10, 72 * 60)), cfg["anchor"]) if status == TicketStatus.SOLVED.name else None
+        rows.append((
+            entity_id(cfg["seed"], "ticket", i),
+            title(rng),
+            paragraph(rng, rng.randint(1, 5)),
+            rng.choice(PRIORITIES),
+            status,
+            f"{rng.choice(TAGS)}, {rng.choice(TAGS)}",
+            created_at,
+            solved_at,
+            entity_id(cfg["seed"], "user", rng.randrange(cfg["users"])),
+        ))
+    return rows
+
+def gen_comments(cfg, rng, start, stop):
+    rows = []
+    for _ in range(start, stop):
+        ticket = pick_ticket(cfg, rng)
+        rows.append((
+            row_id(rng),
+            paragraph(rng, rng.randint(1, 3)),
+            ticket_created_at(cfg, ticket) + timedelta(minutes=rng.randint(1, 48 * 60)),
+            ATTACHMENT_URL if rng.random() < 0.25 else None,
+            entity_id(cfg["seed"], "user", rng.randrange(cfg["users"])),
+            entity_id(cfg["seed"], "ticket", ticket),
+        ))
+    return rows
+
+def gen_notifications(cfg, rng, start, stop):
+    rows = []
+    for _ in range(start, stop):
+        ticket = pick_ticket(cfg, rng)
+        created_at = ticket_created_at(cfg, ticket) + timedelta(minutes=rng.randint(1, 48 * 60))
+        rows.append((
+            row_id(rng),
+            entity_id(cfg["seed"], "user", rng.randrange(cfg["users"])),
+            f"{rng.choice(handles)} commented on your ticket: {title(rng)}",
+            f"/dashboard/tickets/{entity_id(cfg['seed'], 'ticket', ticket)}",
+            rng.random() < 0.8,  # most of an inbox has been read
+            created_at,
+        ))
+    return rows
+
+# table, columns, generator, count key
+PLAN = [
+    (User.__table__, ["id", "username", "password", "role", "full_name", "email", "bio", "is_active", "reputation"], gen_users, "users"),
+    (ReputationEvent.__table__, ["user_id", "delta", "reason", "created_at"], gen_reputation_events, "users"),
+    (Ticket.__table__, ["id", "title", "description", "priority", "status", "tags", "created_at", "solved_at", "owner_id"], gen_tickets, "tickets"),
+    (Comment.__table__, ["id", "content", "created_at", "attachment_url", "author_id", "ticket_id"], gen_comments, "comments"),
+    (Notification.__table__, ["id", "recipient_id", "content", "link", "is_read", "created_at"], gen_notifications, "notifications"),
+]
+GENERATORS = {gen.__name__: gen for _, _, gen, _ in PLAN}
+
+def generate_chunk(task):
+    gen_name, cfg, start, stop = task
+    # Seeded per chunk (not per worker), so the output doesn't depend on how chunks are scheduled
+    chunk_seed = f"{cfg['seed']}:{gen_name}:{start}"
+    fake.seed_instance(chunk_seed)
+    return GENERATORS[gen_name](cfg, random.Random(chunk_seed), start, stop)
+
+def reset_database():
     # Remove old DB if exists to avoid schema conflicts during development
-    if os.path.exists("database.db"):
-        os.remove("database.db")
-        print("🗑️  Deleted old database.db")
+    for name in (SQLITE_FILE_NAME, ARCHIVE_FILE_NAME):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(name + suffix):
+                os.remove(name + suffix)
+    # Signatures of the old tickets; the app rebuilds the index on its next start
+    if os.path.exists(SIMILARITY_FILE): os.remove(SIMILARITY_FILE)
+    print(f"🗑️  Deleted old {SQLITE_FILE_NAME}, {ARCHIVE_FILE_NAME} and {SIMILARITY_FILE}")
+    # Bare tables only: indexes, search triggers and counters are built after the load
+    SQLModel.metadata.create_all(write_engine)
+    with write_engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(conn)
+
+def load_table(pool, conn, cfg, table, columns, gen, total):
+    started = time.perf_counter()
+    tasks = [(gen.__name__, cfg, start, min(start + cfg["chunk"], total)) for start in range(0, total, cfg["chunk"])]
+    insert = table.insert()
+    for rows in pool.imap(generate_chunk, tasks):
+        conn.execute(insert, [dict(zip(columns, row)) for row in rows])
+    elapsed = time.perf_counter() - started
+    print(f"   - {total:>10,} {table.name:<16} {elapsed:7.1f}s  {total / max(elapsed, 1e-9):>10,.0f} rows/s")
+    return total
 
-    print("🌱 Seeding Database...")
+def seed_data(cfg: dict):
+    print(f"🌱 Seeding Database (seed={cfg['seed']}, workers={cfg['workers']})...")
+    reset_database()
+    started = time.perf_counter()
+    loaded = 0
+    with multiprocessing.Pool(cfg["workers"], initializer=init_worker, initargs=(cfg["seed"],)) as pool:
+        for table, columns, gen, count_key in PLAN:
+            # One transaction per table: a commit per row (or per chunk) would dominate the load
+            with write_engine.begin() as conn:
+                loaded += load_table(pool, conn, cfg, table, columns, gen, cfg[count_key])
+    load_elapsed = time.perf_counter() - started
+
+    print("🔎 Building indexes, search index, tag index, counters and stats...")
+    derived_started = time.perf_counter()
     create_db_and_tables()
-    
-    with Session(engine) as session:
-        # 1. Create Key Users
-        print("Creating Users...")
-        admin = User(
-            username="boss", 
-            password="123", 
-            role=UserRole.ADMIN, 
-            full_name="Big Boss", 
-            email="admin@devexchange.com", 
-            bio="System Administrator",
-            reputation=1000,
-            is_active=True
-        )
-        session.add(admin)
-        
-        intern = User(
-            username="intern", 
-            password="123", 
-            role=UserRole.USER, 
-            full_name="New Hire", 
-            email="intern@devexchange.com", 
-            bio="Learning the ropes",
-            reputation=50,
-            is_active=True
-        )
-        session.add(intern)
-        
-        # Create 10 random users
-        users = [admin, intern]
-        for _ in range(10):
-            u = User(
-                username=fake.user_name(),
-                password="123",
-                role=random.choice([UserRole.USER, UserRole.MANAGER]),
-                full_name=fake.name(),
-                email=fake.email(),
-                bio=fake.sentence(),
-                reputation=random.randint(0, 500),
-                is_active=True
-            )
-            session.add(u)
-            users.append(u)
-        
-        session.commit()
-        
-        # Refresh users to get IDs
-        for u in users: session.refresh(u)
-
-        # 2. Create 100 Tickets
-        print("Creating 100 Tickets...")
-        priorities = list(TicketPriority)
-        statuses = list(TicketStatus)
-        tags_list = ["python", "react", "docker", "bug", "feature", "deployment", "css", "api", "database", "nextjs"]
-
-        tickets = []
-        for i in range(100):
-            # Create a realistic date in the past 30 days
-            created_date = datetime.utcnow() - timedelta(days=random.randint(0, 30))
-            
-            t = Ticket(
-                title=fake.sentence(nb_words=6).replace(".", ""),
-                description=fake.paragraph(nb_sentences=3),
-                priority=random.choice(priorities),
-                status=random.choice(statuses),
-                tags=f"{random.choice(tags_list)}, {random.choice(tags_list)}",
-                created_at=created_date,
-                owner_id=random.choice(users).id
-            )
-            session.add(t)
-            tickets.append(t)
-        
-        session.commit()
-        for t in tickets: session.refresh(t)
-
-        # 3. Create Comments
-        print("Adding Comments...")
-        for t in tickets:
-            # 70% chance a ticket has comments
-            if random.choice([True, True, False]):
-                for _ in range(random.randint(1, 6)):
-                    has_attachment = random.choice([True, False, False, False]) # 25% chance
-                    
-                    c = Comment(
-                        content=fake.paragraph(nb_sentences=2),
-                        created_at=t.created_at + timedelta(hours=random.randint(1, 48)),
-                        ticket_id=t.id,
-                        author_id=random.choice(users).id,
-                        attachment_url="https://picsum.photos/400/300" if has_attachment else None
-                    )
-                    session.add(c)
-
-        session.commit()
-        print("✅ Database Populated Successfully!")
-        print(f"   - {len(users)} Users")
-        print(f"   - {len(tickets)} Tickets")
+    derived_elapsed = time.perf_counter() - derived_started
+
+    total_elapsed = time.perf_counter() - started
+    print("✅ Database Populated Successfully!")
+    print(f"   - {loaded:,} rows loaded in {load_elapsed:.1f}s ({loaded / max(load_elapsed, 1e-9):,.0f} rows/s)")
+    print(f"   - derived data built in {derived_elapsed:.1f}s; {total_elapsed:.1f}s total "
+          f"({loaded / max(total_elapsed, 1e-9):,.0f} rows/s end to end)")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate a reproducible DevExchange database")
+    parser.add_argument("--users", type=int, default=12)
+    parser.add_argument("--tickets", type=int, default=100)
+    parser.add_argument("--comments", type=int, default=250)
+    parser.add_argument("--notifications", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=30, help="Spread ticket creation over this many days")
+    parser.add_argument("--anchor", type=datetime.fromisoformat, default=None,
+                        help="Newest timestamp (ISO date); defaults to today, pin it for byte-identical datasets")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=20000, help="Rows generated per worker task")
+    return parser
 
 if __name__ == "__main__":
-    seed_data()
\ No newline at end of file
+    args = build_parser().parse_args()
+    if args.users < len(KEY_USERS):
+        raise SystemExit(f"--users must be at least {len(KEY_USERS)} (boss and intern)")
+    if args.tickets < 1:
+        raise SystemExit("--tickets must be at least 1")
+    anchor = args.anchor or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    seed_data({**vars(args), "anchor": anchor})
@@ -0,0 +1,292 @@
+"""Similar-ticket search: SimHash signatures of TF-IDF vectors, scanned by Hamming distance.
+
+Like imaging.py this only depends on NumPy and the standard library and never imports the app,
+so manage.py and the benchmarks can build and query an index file directly. A signature only
+approximates the angle between two tickets; callers re-score the nearest ones with scores()."""
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are then only serialized within one process
+    fcntl = None
+
+# Changing any of these invalidates saved index files (load() then reports them as missing)
+FORMAT = 1
+SIGNATURE_BITS = 128
+FEATURE_BUCKETS = 1 << 18
+PLANE_SEED = 20250101
+# Ticket ids are stored as fixed-width bytes (a UUID string is 36 characters)
+ID_DTYPE = "S36"
+# Weight of a term in the title, description and tags
+FIELD_WEIGHTS = (2.0, 1.0, 2.0)
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+WORDS = SIGNATURE_BITS // 64
+# int64 header slots: format, bits, buckets, count, documents, watermark, 2 spare
+HEADER_SLOTS = 8
+# Rows per Hamming scan step (keeps the temporaries in cache) and per signing step in build()
+SCAN_BLOCK = 1 << 16
+BUILD_BATCH = 1000
+# Every SAMPLE_STRIDE-th distance is histogrammed to pick the cut-off for nearest()
+SAMPLE_STRIDE = 16
+# Feature buckets of the most recent tokens, kept so re-scoring candidates doesn't hash every word again
+TOKEN_CACHE_SIZE = 1 << 16
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:  # NumPy < 2.0
+    BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+    def popcount(words):
+        return BYTE_BITS[words.view(np.uint8)].reshape(len(words), 8).sum(axis=1, dtype=np.uint8)
+
+@lru_cache(maxsize=None)
+def planes() -> np.ndarray:
+    # A fixed random hyperplane pattern (one bit per signature bit) for every feature bucket
+    return np.random.default_rng(PLANE_SEED).integers(0, 256, (FEATURE_BUCKETS, SIGNATURE_BITS // 8), dtype=np.uint8)
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def bucket(token: str) -> int:
+    return zlib.crc32(token.encode()) & (FEATURE_BUCKETS - 1)
+
+def terms(title: str, description: str, tags: str) -> dict:
+    """Weighted term frequencies of a ticket, keyed by feature bucket."""
+    counts = {}
+    for text, weight in zip((title, description, tags), FIELD_WEIGHTS):
+        for token in TOKEN_RE.findall((text or "").lower()):
+            b = bucket(token)
+            counts[b] = counts.get(b, 0.0) + weight
+    return counts
+
+def hamming(sigs: np.ndarray, signature: np.ndarray) -> np.ndarray:
+    """Bit distance from `signature` to every column of the (WORDS, n) array `sigs`, as uint8."""
+    n = sigs.shape[1]
+    distances = np.empty(n, np.uint8)
+    for start in range(0, n, SCAN_BLOCK):
+        block = distances[start:start + SCAN_BLOCK]
+        np.copyto(block, popcount(sigs[0, start:start + SCAN_BLOCK] ^ signature[0]))
+        for word in range(1, WORDS):
+            block += popcount(sigs[word, start:start + SCAN_BLOCK] ^ signature[word])
+    return distances
+
+def closest(distances: np.ndarray, limit: int) -> np.ndarray:
+    """Positions of the `limit` smallest distances, nearest first."""
+    if len(distances) > limit:
+        # Guess a cut-off from a sample, then widen it until enough rows fall under it
+        sample = np.bincount(distances[::SAMPLE_STRIDE], minlength=SIGNATURE_BITS + 1).cumsum()
+        cutoff = int(np.searchsorted(sample, 2 * limit / SAMPLE_STRIDE))
+        while True:
+            hits = np.flatnonzero(distances <= cutoff)
+            if len(hits) >= limit: break
+            cutoff += 4
+        if len(hits) > limit:
+            hits = hits[np.argpartition(distances[hits], limit - 1)[:limit]]
+    else:
+        hits = np.arange(len(distances))
+    return hits[np.argsort(distances[hits], kind="stable")]
+
+class SimilarityIndex:
+    """Signatures of every indexed ticket, plus the term document frequencies behind their weights.
+
+    What load() finds on disk stays memory-mapped read-only (so workers share it through the
+    page cache); add() appends to an in-memory tail that save() merges into a new file.
+    `watermark` is the caller's: an int saved with the file (the app keeps a creation time in it)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.df = np.zeros(FEATURE_BUCKETS, np.int64)
+        self.documents = 0
+        self.watermark = 0
+        self.file_id = None
+        self.ids = np.empty(0, ID_DTYPE)
+        self.sigs = np.empty((WORDS, 0), np.uint64)
+        self.tail_ids, self.tail_sigs, self.tail_keys = [], [], set()
+        # Feature buckets of each tail entry, to re-apply its df increment over a remapped file
+        self.tail_buckets = []
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.tail_ids)
+
+    def __contains__(self, ticket_id: str) -> bool:
+        key = ticket_id.encode()
+        if key in self.tail_keys: return True
+        ids = self.ids
+        pos = int(np.searchsorted(ids, key))
+        return pos < len(ids) and ids[pos] == key
+
+    def flatten(self, docs: list):
+        """TF-IDF weights of a list of terms() outputs as flat (buckets, weights, starts) arrays.
+        A ticket without terms gets one zero-weight entry (reduceat needs a row per ticket)."""
+        counts = [c or {0: 1.0} for c in docs]
+        sizes = np.fromiter(map(len, counts), np.int64, len(counts))
+        buckets = np.fromiter((b for c in counts for b in c), np.int64, int(sizes.sum()))
+        tf = np.fromiter((t for c in counts for t in c.values()), np.float64, len(buckets))
+        weights = ((1 + np.log(tf)) * np.log((self.documents + 1) / (self.df[buckets] + 1))).astype(np.float32)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        weights[starts[[i for i, c in enumerate(docs) if not c]]] = 0
+        return buckets, weights, starts
+
+    def signatures(self, docs: list) -> np.ndarray:
+        """(len(docs), WORDS) signatures of a list of terms() outputs."""
+        buckets, weights, starts = self.flatten(docs)
+        # Each bit is the sign of the weighted +-1 votes of the ticket's terms
+        votes = np.add.reduceat(np.unpackbits(planes()[buckets], axis=1) * weights[:, None], starts)
+        bits = votes > (np.add.reduceat(weights, starts) / 2)[:, None]
+        return np.packbits(bits, axis=1).view(np.uint64)
+
+    def scores(self, counts: dict, docs: list) -> np.ndarray:
+        """TF-IDF cosine between terms() output `counts` and each of a list of terms() outputs."""
+        if not counts or not docs: return np.zeros(len(docs))
+        query = np.zeros(FEATURE_BUCKETS, np.float32)
+        buckets, weights, _ = self.flatten([counts])
+        query[buckets] = weights / (np.linalg.norm(weights) or 1)
+        buckets, weights, starts = self.flatten(docs)
+        norms = np.sqrt(np.add.reduceat(weights * weights, starts))
+        return np.add.reduceat(weights * query[buckets], starts) / np.maximum(norms, 1e-9)
+
+    def nearest(self, counts: dict, limit: int) -> list:
+        """Ids of the `limit` tickets whose signatures are closest to terms() output `counts`."""
+        signature = self.signatures([counts])[0]
+        with self.lock:
+            ids, sigs = self.ids, self.sigs
+            tail_ids, tail_sigs = list(self.tail_ids), list(self.tail_sigs)
+        found = []
+        distances = hamming(sigs, signature)
+        found += [(int(distances[p]), ids[p]) for p in closest(distances, limit)]
+        if tail_ids:
+            distances = hamming(np.array(tail_sigs).T, signature)
+            found += [(int(distances[p]), tail_ids[p]) for p in closest(distances, limit)]
+        return [key.decode() for _, key in sorted(found)[:limit]]
+
+    def add(self, ticket_id: str, title: str, description: str, tags: str) -> bool:
+        """Indexes one ticket (False if it already is). Its terms count towards later weights."""
+        if ticket_id in self: return False
+        counts = terms(title, description, tags)
+        with self.lock:
+            if ticket_id in self: return False
+            buckets = np.fromiter(counts, np.int64, len(counts))
+            self.df[buckets] += 1
+            self.documents += 1
+            self.tail_buckets.append(buckets)
+            self.tail_sigs.append(self.signatures([counts])[0])
+            self.tail_ids.append(ticket_id.encode())
+            self.tail_keys.add(self.tail_ids[-1])
+        return True
+
+    def load(self) -> bool:
+        """Maps the index file; False (and an empty index) when it is missing or incompatible."""
+        with self.lock:
+            self.clear()
+            return self.map_file()
+
+    def map_file(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+            header = np.fromfile(self.path, np.int64, HEADER_SLOTS)
+        except (FileNotFoundError, ValueError):
+            return False
+        if len(header) < HEADER_SLOTS or tuple(header[:3]) != (FORMAT, SIGNATURE_BITS, FEATURE_BUCKETS): return False
+        count, documents, watermark = (int(v) for v in header[3:6])
+        ids_at = (HEADER_SLOTS + FEATURE_BUCKETS) * 8
+        sigs_at = ids_at + count * np.dtype(ID_DTYPE).itemsize
+        if stat.st_size != sigs_at + count * WORDS * 8: return False
+        self.df = np.fromfile(self.path, np.int64, FEATURE_BUCKETS, offset=HEADER_SLOTS * 8)
+        self.documents, self.watermark = documents, max(self.watermark, watermark)
+        if count:
+            self.ids = np.memmap(self.path, ID_DTYPE, "r", ids_at, (count,))
+            self.sigs = np.memmap(self.path, np.uint64, "r", sigs_at, (WORDS, count))
+        else:
+            self.ids, self.sigs = np.empty(0, ID_DTYPE), np.empty((WORDS, 0), np.uint64)
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+        # A freshly mapped file may already hold tail entries (another process saved them);
+        # the rest are not counted in its df yet
+        keep = [i for i, key in enumerate(self.tail_ids) if not self.snapshot_has(key)]
+        self.tail_ids = [self.tail_ids[i] for i in keep]
+        self.tail_sigs = [self.tail_sigs[i] for i in keep]
+        self.tail_buckets = [self.tail_buckets[i] for i in keep]
+        self.tail_keys = set(self.tail_ids)
+        for buckets in self.tail_buckets:
+            self.df[buckets] += 1
+        self.documents += len(keep)
+        return True
+
+    def snapshot_has(self, key: bytes) -> bool:
+        pos = int(np.searchsorted(self.ids, key))
+        return pos < len(self.ids) and self.ids[pos] == key
+
+    @contextmanager
+    def file_lock(self):
+        """Held around every read-merge-write of the file: save_lock within this process, an flock
+        on a sidecar file across processes (closing it releases the flock)."""
+        with self.save_lock, open(f"{self.path}.lock", "a") as f:
+            if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def save(self):
+        """Merges the tail into a new index file and maps it. Processes take turns (file_lock), and
+        what another one saved in the meantime is merged in rather than lost."""
+        with self.file_lock():
+            with self.lock:
+                try:
+                    stat = os.stat(self.path)
+                    if (stat.st_ino, stat.st_mtime_ns) != self.file_id: self.map_file()
+                except FileNotFoundError:
+                    pass
+                saved = len(self.tail_ids)
+                ids, sigs, df, documents, watermark = self.ids, self.sigs, self.df.copy(), self.documents, self.watermark
+                tail_ids = np.array(self.tail_ids, ID_DTYPE)
+                tail_sigs = np.array(self.tail_sigs, np.uint64).reshape(saved, WORDS).T
+            order = np.argsort(tail_ids)
+            at = np.searchsorted(ids, tail_ids[order])
+            self.write(np.insert(ids, at, tail_ids[order]), np.insert(sigs, at, tail_sigs[:, order], axis=1),
+                       df, documents, watermark)
+            with self.lock:
+                # Entries added while writing stay in the tail
+                self.tail_ids, self.tail_sigs = self.tail_ids[saved:], self.tail_sigs[saved:]
+                self.tail_buckets = self.tail_buckets[saved:]
+                self.tail_keys = set(self.tail_ids)
+                self.map_file()
+
+    def build(self, batches, watermark: int = 0):
+        """Re-indexes everything from scratch, saves and maps the result. `batches` is called twice
+        (once to count document frequencies, once to sign) and must yield lists of
+        (id, title, description, tags)."""
+        self.df, self.documents = np.zeros(FEATURE_BUCKETS, np.int64), 0
+        for batch in batches():
+            buckets = [b for row in batch for b in terms(*row[1:])]
+            self.df += np.bincount(np.asarray(buckets, np.int64), minlength=FEATURE_BUCKETS)
+            self.documents += len(batch)
+        ids, sigs = [], []
+        for batch in batches():
+            for start in range(0, len(batch), BUILD_BATCH):
+                rows = batch[start:start + BUILD_BATCH]
+                ids.append(np.array([row[0] for row in rows], ID_DTYPE))
+                sigs.append(self.signatures([terms(*row[1:]) for row in rows]))
+        ids = np.concatenate(ids) if ids else np.empty(0, ID_DTYPE)
+        sigs = np.concatenate(sigs) if sigs else np.empty((0, WORDS), np.uint64)
+        ids, first = np.unique(ids, return_index=True)
+        with self.file_lock():
+            self.write(ids, np.ascontiguousarray(sigs[first].T), self.df, self.documents, watermark)
+            self.load()
+
+    def write(self, ids: np.ndarray, sigs: np.ndarray, df: np.ndarray, documents: int, watermark: int):
+        # Written aside and renamed over the old file, so readers only ever map a complete one
+        header = np.array([FORMAT, SIGNATURE_BITS, FEATURE_BUCKETS, len(ids), documents, watermark, 0, 0], np.int64)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            for part in (header, df, ids, sigs):
+                part.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,19 @@
+"""The app keeps its database, broker log, attachments and index files at paths relative to the
+working directory, so the tests import it from a fresh temporary one.
+
+Run from backend/: python -m pytest tests"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="devex-tests-")
+
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("DEVEX_RATE_LIMITS", "off")
+# One process: caches are authoritative and serve hits without revalidating
+os.environ["DEVEX_WORKERS"] = "1"
+os.chdir(WORK_DIR)
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
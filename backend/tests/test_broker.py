@@ -0,0 +1,109 @@
+"""Two app processes sharing one database and a DEVEX_BROKER=sqlite log, as under
+uvicorn --workers 2, but each on its own port so the test decides which worker a client talks
+to: what is posted through one must reach WebSocket clients connected to the other."""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+from websockets.sync.client import connect
+
+from conftest import BACKEND_DIR
+
+WORKERS = 2
+RECEIVE_TIMEOUT_SECONDS = 10
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def workers(tmp_path_factory):
+    # Started one after the other: the first creates the schema, the rest find it in place
+    work_dir = tmp_path_factory.mktemp("workers")
+    env = {**os.environ, "DEVEX_BROKER": "sqlite", "DEVEX_RATE_LIMITS": "off"}
+    processes, urls = [], []
+    try:
+        for _ in range(WORKERS):
+            port = free_port()
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(port), "--log-level", "warning"],
+                cwd=work_dir, env=env
+            ))
+            urls.append(f"127.0.0.1:{port}")
+            wait_until_up(urls[-1], processes[-1])
+        yield urls
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(10)
+
+def wait_until_up(url: str, process: subprocess.Popen):
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        assert process.poll() is None, "worker exited during startup"
+        try:
+            httpx.get(f"http://{url}/leaderboard")
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise TimeoutError(f"worker on {url} did not start")
+
+def sign_up(api: httpx.Client, username: str) -> tuple:
+    """(user id, auth headers) of a new user."""
+    user = api.post("/users", json={"username": username, "password": "123", "role": "user"}).json()
+    token = api.post("/login", json={"username": username, "password": "123"}).json()["access_token"]
+    return user["id"], {"Authorization": f"Bearer {token}"}
+
+def receive(ws, kind: str) -> dict:
+    # Skips anything else the socket may be sent first
+    deadline = time.monotonic() + RECEIVE_TIMEOUT_SECONDS
+    while True:
+        message = json.loads(ws.recv(timeout=max(0.0, deadline - time.monotonic())))
+        if message.get("type") == kind: return message
+
+def test_comment_reaches_sockets_on_another_worker(workers):
+    first, second = workers
+    with httpx.Client(base_url=f"http://{first}") as api:
+        owner_id, owner = sign_up(api, "broker-owner")
+        _, commenter = sign_up(api, "broker-commenter")
+        ticket = api.post("/tickets", json={"title": "Cross-worker delivery", "description": "Posted on one worker",
+                                            "priority": "low", "tags": "broker"}, headers=owner).json()
+
+        with connect(f"ws://{second}/ws/ticket/{ticket['id']}") as room, connect(f"ws://{second}/ws/user/{owner_id}") as inbox:
+            # The broker only relays what is published after a socket joined; let both joins land
+            time.sleep(0.5)
+            posted = api.post(f"/tickets/{ticket['id']}/comments", json={"content": "Hello from the first worker"},
+                              headers=commenter)
+            assert posted.status_code == 200, posted.text
+
+            chat = receive(room, "chat")
+            assert chat["id"] == posted.json()["id"] and chat["content"] == "Hello from the first worker"
+            assert chat["author_name"] == "broker-commenter" and chat["seq"] == 1
+            assert "Cross-worker delivery" in receive(inbox, "notification")["content"]
+
+def test_comment_reaches_sockets_on_every_worker(workers):
+    with httpx.Client(base_url=f"http://{workers[0]}") as api:
+        _, user = sign_up(api, "broker-fan-out")
+        ticket = api.post("/tickets", json={"title": "Fan-out", "description": "Watched from every worker",
+                                            "priority": "low", "tags": "broker"}, headers=user).json()
+        rooms = [connect(f"ws://{url}/ws/ticket/{ticket['id']}") for url in workers]
+        try:
+            time.sleep(0.5)
+            for i, url in enumerate(workers):
+                # Posted through each worker in turn; every room sees every comment
+                with httpx.Client(base_url=f"http://{url}") as poster:
+                    assert poster.post(f"/tickets/{ticket['id']}/comments", json={"content": f"From worker {i}"},
+                                       headers=user).status_code == 200
+            for room in rooms:
+                got = sorted((message["seq"], message["content"]) for message in (receive(room, "chat") for _ in workers))
+                assert got == [(i + 1, f"From worker {i}") for i in range(len(workers))]
+        finally:
+            for room in rooms:
+                room.close()
@@ -0,0 +1,86 @@
+"""The ticket list and comment thread are read through a joined projection: what a request costs
+in SQL statements must not grow with the number of rows it returns (no per-row owner/author loads).
+Repeat views of a ticket are answered from the response cache without any."""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session
+
+import main
+from main import Comment, Ticket, User, UserRole
+
+PAGE_SIZES = (5, 50)
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+@pytest.fixture(scope="module")
+def ticket_id(client) -> str:
+    # A different owner/author per row, so a lazy load per row can't hide behind the identity map
+    size = max(PAGE_SIZES)
+    started = datetime(2024, 1, 1)
+    users = [User(username=f"query-count-{i}", password="123", role=UserRole.USER, email=f"query-count-{i}@example.com")
+             for i in range(size)]
+    tickets = [Ticket(title=f"Query count ticket {i}", description="Listed in a page", tags="perf", owner_id=user.id,
+                      created_at=started + timedelta(minutes=i)) for i, user in enumerate(users)]
+    comments = [Comment(content=f"Reply {i}", author_id=user.id, ticket_id=tickets[0].id, seq=i + 1,
+                        created_at=started + timedelta(hours=1, minutes=i)) for i, user in enumerate(users)]
+    with Session(main.write_engine) as session:
+        session.add_all(users + tickets + comments)
+        session.commit()
+        return tickets[0].id
+
+def statements_for(client: TestClient, url: str) -> tuple:
+    """(SQL statements the request ran, its JSON body)."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        # Only the request's own statements (MetricsMiddleware scopes them), not background tasks'
+        if main.current_queries.get() is not None: statements.append(statement)
+
+    engines = (main.engine, main.write_engine, main.async_engine.sync_engine)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get(url)
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", record)
+    assert response.status_code == 200, response.text
+    return len(statements), response.json()
+
+def test_ticket_list_query_count_is_constant(client, ticket_id):
+    counts = []
+    for size in PAGE_SIZES:
+        count, page = statements_for(client, f"/tickets?limit={size}")
+        assert len(page["items"]) == size
+        assert all(item["owner_name"].startswith("query-count-") for item in page["items"])
+        counts.append(count)
+    assert counts[0] == counts[1], counts
+
+def test_comment_thread_query_count_is_constant(client, ticket_id):
+    counts = []
+    for size in PAGE_SIZES:
+        count, page = statements_for(client, f"/tickets/{ticket_id}/comments?limit={size}")
+        assert len(page["items"]) == size
+        assert [item["author_name"] for item in page["items"]] == [f"query-count-{i}" for i in range(size)]
+        counts.append(count)
+    assert counts[0] == counts[1], counts
+
+def test_unpaged_lists_cost_the_same_as_one_row(client, ticket_id):
+    one, _ = statements_for(client, "/tickets?limit=1")
+    everything, tickets = statements_for(client, "/tickets")
+    assert len(tickets) >= max(PAGE_SIZES) and everything == one
+    one, _ = statements_for(client, f"/tickets/{ticket_id}/comments?limit=1")
+    everything, comments = statements_for(client, f"/tickets/{ticket_id}/comments")
+    assert len(comments) == max(PAGE_SIZES) and everything == one
+
+def test_cached_ticket_views_run_no_sql(client, ticket_id):
+    for url in (f"/tickets/{ticket_id}", f"/tickets/{ticket_id}/comments"):
+        statements_for(client, url)
+        count, _ = statements_for(client, url)
+        assert count == 0, url
@@ -0,0 +1,63 @@
+"""A page of search results ranks only the best few documents of each kind (search_page), or just
+the filtered tickets' documents: paging through must list exactly what the unpaged search lists,
+in the same (rank, id) order and with the same snippets, whichever way a page was ranked."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+import main
+from main import Comment, Ticket, User, UserRole
+
+WORD = "zephyrine"
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+@pytest.fixture(scope="module")
+def owner_id(client) -> str:
+    # Hits of every strength, ties included, on tickets and on comments, some tickets hit by both
+    rng = random.Random(7)
+    users = [User(username=f"search-{i}", password="123", role=UserRole.USER, email=f"search-{i}@example.com") for i in range(4)]
+    tags = ["search-even", "search-odd"]
+    tickets, comments = [], []
+    for i in range(120):
+        words = " ".join([WORD] * rng.randint(0, 3) + ["filler"] * rng.randint(1, 6))
+        ticket = Ticket(title=f"Search ticket {i}", description=words, tags=tags[i % 2], owner_id=users[i % 4].id,
+                        status=main.TicketStatus.SOLVED if i % 3 == 0 else main.TicketStatus.OPEN,
+                        created_at=datetime(2024, 1, 1) + timedelta(minutes=i))
+        tickets.append(ticket)
+        for seq in range(1, rng.randint(0, 3) + 1):
+            content = " ".join([WORD] * rng.randint(0, 4) + ["reply"] * rng.randint(1, 8))
+            comments.append(Comment(content=content, author_id=users[seq % 4].id, ticket_id=ticket.id, seq=seq,
+                                    created_at=ticket.created_at + timedelta(seconds=seq)))
+    with Session(main.write_engine) as session:
+        session.add_all(users + tickets + comments)
+        session.flush()
+        for i, tag in enumerate(tags):
+            main.set_ticket_tags(session, [ticket.id for ticket in tickets[i::2]], [tag])
+        session.commit()
+        return users[0].id
+
+@pytest.mark.parametrize("growth, max_candidates", [(4, 5000), (2, 10), (2, 1)])
+@pytest.mark.parametrize("filters", ["", "&status=open", "&owner_id={owner_id}", "&tags=search-odd"])
+def test_paged_search_lists_the_unpaged_results(client, owner_id, monkeypatch, growth, max_candidates, filters):
+    monkeypatch.setattr(main, "SEARCH_GROWTH", growth)
+    monkeypatch.setattr(main, "SEARCH_MAX_CANDIDATES", max_candidates)
+    url = f"/tickets?q={WORD}" + filters.format(owner_id=owner_id)
+    response = client.get(url)
+    assert response.status_code == 200, response.text
+    expected = [(item["id"], item["snippet"]) for item in response.json()]
+    assert expected
+    for limit in (1, 3, 7, 50):
+        listed, cursor = [], None
+        while True:
+            page = client.get(url + f"&limit={limit}" + (f"&cursor={cursor}" if cursor else "")).json()
+            listed += [(item["id"], item["snippet"]) for item in page["items"]]
+            cursor = page["next_cursor"]
+            if not cursor: break
+        assert listed == expected, limit
@@ -6,6 +6,7 @@ import Toast, { ToastType } from '../../../components/Toast';
 import { usePrivateFetch } from '../../../hooks/usePrivateFetch';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || "http://127.0.0.1:8000";
+const PAGE_SIZE = 50;
 
 interface Ticket {
     id: string;
@@ -18,7 +19,10 @@ interface Ticket {
 export default function MyTicketsPage() {
     const authFetch = usePrivateFetch();
     const [tickets, setTickets] = useState<Ticket[]>([]);
+    const [ownerId, setOwnerId] = useState<string | null>(null);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [toast, setToast] = useState<{ message: string, type: ToastType } | null>(null);
 
     const fetchMyTickets = async () => {
@@ -27,11 +31,13 @@ export default function MyTicketsPage() {
             // 1. Get User ID
             const userRes = await authFetch(`${API_BASE_URL}/users/me`);
             const userData = await userRes.json();
+            setOwnerId(userData.id);
 
-            // 2. Fetch Tickets for this User
-            const res = await authFetch(`${API_BASE_URL}/tickets?owner_id=${userData.id}`);
-            const data = await res.json();
-            setTickets(data);
+            // 2. Fetch the first page of this user's tickets
+            const res = await authFetch(`${API_BASE_URL}/tickets?owner_id=${userData.id}&limit=${PAGE_SIZE}`);
+            const page = await res.json();
+            setTickets(page.items);
+            setNextCursor(page.next_cursor);
         } catch (err: any) {
             if (err.message !== "Session expired") console.error(err);
         } finally {
@@ -39,6 +45,22 @@ export default function MyTicketsPage() {
         }
     };
 
+    const loadMore = async () => {
+        if (!nextCursor || !ownerId) return;
+        setLoadingMore(true);
+        try {
+            const params = new URLSearchParams({ owner_id: ownerId, limit: String(PAGE_SIZE), cursor: nextCursor });
+            const res = await authFetch(`${API_BASE_URL}/tickets?${params.toString()}`);
+            const page = await res.json();
+            setTickets(prev => [...prev, ...page.items]);
+            setNextCursor(page.next_cursor);
+        } catch (err: any) {
+            if (err.message !== "Session expired") console.error(err);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     useEffect(() => {
         fetchMyTickets();
     }, []);
@@ -117,6 +139,18 @@ export default function MyTicketsPage() {
                         You haven't posted any tickets yet.
                     </div>
                 )}
+
+                {nextCursor && !loading && (
+                    <div className="flex justify-center pt-4">
+                        <button
+                            onClick={loadMore}
+                            disabled={loadingMore}
+                            className="px-6 py-2.5 rounded-lg font-medium text-sm bg-white dark:bg-gray-900 border border-gray-200 dark:border-gray-800 text-gray-700 dark:text-gray-200 hover:bg-gray-50 dark:hover:bg-gray-800 shadow-sm transition disabled:opacity-50"
+                        >
+                            {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                    </div>
+                )}
             </div>
 
             {toast && <Toast message={toast.message} type={toast.type} onClose={() => setToast(null)} />}
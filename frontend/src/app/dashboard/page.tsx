@@ -36,28 +36,30 @@ export default function DashboardPage() {
                 const userData = await userRes.json();
                 setUser(userData);
 
-                // 2. Fetch All Tickets
-                const ticketRes = await authFetch(`${API_BASE_URL}/tickets`);
-                const ticketData = await ticketRes.json();
-                setTickets(ticketData);
+                // 2. Fetch the latest tickets for the activity list
+                const ticketRes = await authFetch(`${API_BASE_URL}/tickets?limit=5`);
+                const ticketPage = await ticketRes.json();
+                setTickets(ticketPage.items);
 
-                // 3. Calculate Stats
+                // 3. Fetch Stats (precomputed server-side)
                 // Admin sees global stats, Users see their own stats primarily
-                const relevantTickets = userData.role === 'admin' ? ticketData : ticketData.filter((t: any) => t.owner_id === userData.id);
-
-                const open = relevantTickets.filter((t: any) => t.status === 'open').length;
-                const solved = relevantTickets.filter((t: any) => t.status === 'solved').length;
-                const myTickets = ticketData.filter((t: any) => t.owner_id === userData.id).length; // Always count "my tickets" globally
-
-                // Priority Breakdown (Global for Admin, Personal for User)
-                const critical = relevantTickets.filter((t: any) => t.priority === 'critical').length;
-                const high = relevantTickets.filter((t: any) => t.priority === 'high').length;
-                const medium = relevantTickets.filter((t: any) => t.priority === 'medium').length;
-                const low = relevantTickets.filter((t: any) => t.priority === 'low').length;
+                const statsFor = async (ownerId?: string) => {
+                    const query = ownerId ? `?owner_id=${encodeURIComponent(ownerId)}&days=1` : '?days=1';
+                    const res = await authFetch(`${API_BASE_URL}/tickets/stats${query}`);
+                    return res.json();
+                };
+                const mine = await statsFor(userData.id); // Always count "my tickets"
+                const relevant = userData.role === 'admin' ? await statsFor() : mine;
 
                 setStats({
-                    total: relevantTickets.length,
-                    open, solved, critical, high, medium, low, myTotal: myTickets
+                    total: relevant.total,
+                    open: relevant.status.open,
+                    solved: relevant.status.solved,
+                    critical: relevant.priority.critical,
+                    high: relevant.priority.high,
+                    medium: relevant.priority.medium,
+                    low: relevant.priority.low,
+                    myTotal: mine.total
                 });
 
             } catch (err) {
@@ -26,9 +26,12 @@ interface Comment {
     id: string;
     content: string;
     attachment_url?: string;
+    attachment_thumb_url?: string;
+    attachment_preview_url?: string;
     created_at: string;
     author_name: string;
     author_role: string;
+    seq?: number;
 }
 
 export default function TicketDetailPage() {
@@ -48,6 +51,20 @@ export default function TicketDetailPage() {
     const fileInputRef = useRef<HTMLInputElement>(null);
 
     const commentsEndRef = useRef<HTMLDivElement>(null);
+    // Highest stream position seen; a reconnect asks the server for everything after it
+    const lastSeqRef = useRef<number | null>(null);
+
+    const addComments = (incoming: Comment[]) => {
+        for (const c of incoming) {
+            if (c.seq !== undefined) lastSeqRef.current = Math.max(lastSeqRef.current ?? 0, c.seq);
+        }
+        setComments(prev => {
+            const known = new Set(prev.map(c => c.id));
+            const fresh = incoming.filter(c => !known.has(c.id));
+            if (fresh.length === 0) return prev;
+            return [...prev, ...fresh].sort((a, b) => (a.seq ?? 0) - (b.seq ?? 0));
+        });
+    };
 
     const loadData = async () => {
         try {
@@ -61,7 +78,7 @@ export default function TicketDetailPage() {
             if (!ticketRes.ok) throw new Error("Ticket not found");
 
             setTicket(await ticketRes.json());
-            setComments(await commentRes.json());
+            addComments(await commentRes.json());
             setCurrentUser(await userRes.json());
 
         } catch (err) {
@@ -77,18 +94,34 @@ export default function TicketDetailPage() {
 
     useEffect(() => {
         if (!id) return;
-        const ws = new WebSocket(`${WS_BASE_URL}/ws/ticket/${id}`);
-
-        ws.onmessage = (event) => {
-            const newMsg = JSON.parse(event.data);
-            if (newMsg.type === 'chat') {
-                setComments(prev => {
-                    if (prev.some(c => c.id === newMsg.id)) return prev;
-                    return [...prev, newMsg];
-                });
-            }
+        let ws: WebSocket;
+        let retry: ReturnType<typeof setTimeout>;
+        let attempts = 0;
+        let closed = false;
+
+        // On reconnect the server replays only what we missed after last_seq,
+        // so there's no need to re-download the whole thread
+        const connect = () => {
+            const resume = lastSeqRef.current !== null ? `?last_seq=${lastSeqRef.current}` : '';
+            ws = new WebSocket(`${WS_BASE_URL}/ws/ticket/${id}${resume}`);
+            ws.onopen = () => { attempts = 0; };
+            ws.onmessage = (event) => {
+                const newMsg = JSON.parse(event.data);
+                if (newMsg.type === 'chat') addComments([newMsg]);
+            };
+            ws.onclose = () => {
+                if (closed) return;
+                // Jittered backoff, so a restart doesn't bring every viewer back at once
+                const delay = Math.min(30000, 1000 * 2 ** attempts++) * (0.5 + Math.random() / 2);
+                retry = setTimeout(connect, delay);
+            };
+        };
+        connect();
+        return () => {
+            closed = true;
+            clearTimeout(retry);
+            ws.close();
         };
-        return () => ws.close();
     }, [id]);
 
     useEffect(() => {
@@ -134,7 +167,12 @@ export default function TicketDetailPage() {
             if (res.ok) {
                 const savedComment = await res.json();
                 setAttachment(null);
-                setComments(prev => [...prev, savedComment]);
+                addComments([savedComment]);
+            } else if (res.status === 429) {
+                // Rate limited: keep the draft and say when to try again
+                const wait = res.headers.get('Retry-After') || '1';
+                setToast({ message: `Posting too fast, try again in ${wait}s`, type: 'error' });
+                setNewComment(tempContent);
             }
         } catch (err) {
             setToast({ message: "Failed to post comment", type: 'error' });
@@ -255,10 +293,11 @@ export default function TicketDetailPage() {
                                     {comment.attachment_url && (
                                         <div className="mt-3">
                                             <img
-                                                src={comment.attachment_url}
+                                                src={comment.attachment_thumb_url || comment.attachment_url}
                                                 alt="Attachment"
+                                                loading="lazy"
                                                 className="max-w-sm rounded-lg border border-gray-200 dark:border-gray-700 hover:scale-[1.02] transition duration-300 cursor-pointer"
-                                                onClick={() => window.open(comment.attachment_url, '_blank')}
+                                                onClick={() => window.open(comment.attachment_preview_url || comment.attachment_url, '_blank')}
                                             />
                                         </div>
                                     )}
@@ -1,6 +1,6 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useRouter } from 'next/navigation';
 import { Plus, Search, MessageCircle, LayoutGrid, List as ListIcon, CheckCircle2, Pin, X, Filter } from 'lucide-react';
 import Toast, { ToastType } from '../../../components/Toast';
@@ -9,6 +9,7 @@ import { motion, AnimatePresence } from 'framer-motion';
 import { CustomSelect } from '../../../components/CustomSelect';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || "http://127.0.0.1:8000";
+const PAGE_SIZE = 50;
 
 interface Ticket {
     id: string;
@@ -22,6 +23,13 @@ interface Ticket {
     created_at: string;
 }
 
+interface SimilarTicket {
+    id: string;
+    title: string;
+    status: 'open' | 'solved';
+    score: number;
+}
+
 const PRIORITY_OPTIONS = [
     { label: "Critical", value: "critical" },
     { label: "High Priority", value: "high" },
@@ -40,37 +48,74 @@ export default function TicketsPage() {
     const authFetch = usePrivateFetch();
 
     const [tickets, setTickets] = useState<Ticket[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [isCreating, setIsCreating] = useState(false);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
+    // Only the latest request may update the list (filters can change while a page loads)
+    const requestId = useRef(0);
     const [viewMode, setViewMode] = useState<'list' | 'board'>('board');
     const [toast, setToast] = useState<{ message: string, type: ToastType } | null>(null);
 
     const [filters, setFilters] = useState({ q: '', status: '', priority: '' });
     const [newTicket, setNewTicket] = useState({ title: '', description: '', priority: 'medium', tags: '' });
+    const [similar, setSimilar] = useState<SimilarTicket[]>([]);
 
-    const fetchTickets = async () => {
-        setLoading(true);
+    // First page for the current filters, or (with a cursor) the next one appended to the list
+    const fetchTickets = async (cursor?: string) => {
+        const id = ++requestId.current;
+        if (cursor) setLoadingMore(true); else setLoading(true);
         try {
-            const params = new URLSearchParams();
+            const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
             if (filters.q) params.append("q", filters.q);
             if (filters.status) params.append("status", filters.status);
             if (filters.priority) params.append("priority", filters.priority);
+            if (cursor) params.append("cursor", cursor);
 
             const res = await authFetch(`${API_BASE_URL}/tickets?${params.toString()}`);
-            const data = await res.json();
-            setTickets(data);
+            const page = await res.json();
+            if (id !== requestId.current) return;
+            setTickets(prev => cursor ? [...prev, ...page.items] : page.items);
+            setNextCursor(page.next_cursor);
         } catch (err: any) {
             if (err.message !== "Session expired") console.error(err);
         } finally {
-            setLoading(false);
+            if (id === requestId.current) {
+                setLoading(false);
+                setLoadingMore(false);
+            }
         }
     };
 
+    // Column counts cover the loaded tickets; "+" says there are more to load
+    const countLabel = (status: Ticket['status']) => `${tickets.filter(t => t.status === status).length}${nextCursor ? '+' : ''}`;
+
     useEffect(() => {
         const timer = setTimeout(() => { fetchTickets(); }, 300);
         return () => clearTimeout(timer);
     }, [filters]);
 
+    // Suggest existing discussions while the new one is being written
+    useEffect(() => {
+        if (!isCreating || newTicket.title.trim().length + newTicket.description.trim().length < 10) {
+            setSimilar([]);
+            return;
+        }
+        const timer = setTimeout(async () => {
+            try {
+                const { title, description, tags } = newTicket;
+                const res = await authFetch(`${API_BASE_URL}/tickets/similar`, {
+                    method: "POST",
+                    body: JSON.stringify({ title, description, tags })
+                });
+                if (res.ok) setSimilar(await res.json());
+            } catch (err: any) {
+                if (err.message !== "Session expired") console.error(err);
+            }
+        }, 400);
+        return () => clearTimeout(timer);
+    }, [isCreating, newTicket.title, newTicket.description, newTicket.tags]);
+
     const handleSubmit = async (e: React.FormEvent) => {
         e.preventDefault();
         try {
@@ -322,6 +367,19 @@ export default function TicketsPage() {
                                             required
                                         />
                                     </div>
+                                    {similar.length > 0 && (
+                                        <div className="p-4 rounded-lg bg-amber-50 dark:bg-amber-900/20 border border-amber-200 dark:border-amber-800">
+                                            <p className="text-sm font-semibold text-amber-800 dark:text-amber-300 mb-2">Similar discussions already exist</p>
+                                            <ul className="space-y-1">
+                                                {similar.map(t => (
+                                                    <li key={t.id} className="flex items-center justify-between gap-3 text-sm">
+                                                        <a href={`/dashboard/tickets/${t.id}`} target="_blank" rel="noreferrer" className="text-indigo-600 dark:text-indigo-400 hover:underline truncate">{t.title}</a>
+                                                        {t.status === 'solved' && <span className="flex items-center gap-1 text-green-600 dark:text-green-400 text-xs font-bold shrink-0"><CheckCircle2 size={12} /> Solved</span>}
+                                                    </li>
+                                                ))}
+                                            </ul>
+                                        </div>
+                                    )}
                                     <div className="grid grid-cols-2 gap-4">
                                         <div>
                                             <label className="block text-sm font-semibold text-gray-700 dark:text-gray-300 mb-1">Priority</label>
@@ -374,7 +432,7 @@ export default function TicketsPage() {
                                         <div className="w-3 h-3 rounded-full bg-orange-500 ring-4 ring-orange-100 dark:ring-orange-900"></div> Open Issues
                                     </h3>
                                     <span className="bg-white dark:bg-gray-700 px-3 py-1 rounded-full text-sm font-bold text-gray-600 dark:text-gray-200 shadow-sm border border-gray-100 dark:border-gray-600">
-                                        {tickets.filter(t => t.status === 'open').length}
+                                        {countLabel('open')}
                                     </span>
                                 </div>
 
@@ -394,7 +452,7 @@ export default function TicketsPage() {
                                         <div className="w-3 h-3 rounded-full bg-green-500 ring-4 ring-green-100 dark:ring-green-900"></div> Solved
                                     </h3>
                                     <span className="bg-white dark:bg-gray-700 px-3 py-1 rounded-full text-sm font-bold text-gray-600 dark:text-gray-200 shadow-sm border border-gray-100 dark:border-gray-600">
-                                        {tickets.filter(t => t.status === 'solved').length}
+                                        {countLabel('solved')}
                                     </span>
                                 </div>
 
@@ -408,6 +466,17 @@ export default function TicketsPage() {
                             </div>
                         </div>
                     )}
+                    {nextCursor && (
+                        <div className="flex justify-center mt-8">
+                            <button
+                                onClick={() => fetchTickets(nextCursor)}
+                                disabled={loadingMore}
+                                className="px-6 py-2.5 rounded-lg font-medium text-sm bg-white dark:bg-gray-800 border border-gray-200 dark:border-gray-700 text-gray-700 dark:text-gray-200 hover:bg-gray-50 dark:hover:bg-gray-700 shadow-sm transition disabled:opacity-50"
+                            >
+                                {loadingMore ? 'Loading...' : 'Load more'}
+                            </button>
+                        </div>
+                    )}
                 </>
             )}
             {toast && <Toast message={toast.message} type={toast.type} onClose={() => setToast(null)} />}
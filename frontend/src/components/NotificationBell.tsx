@@ -8,6 +8,7 @@ import { AnimatePresence, motion } from 'framer-motion';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || "http://127.0.0.1:8000";
 const WS_BASE_URL = API_BASE_URL.replace('http', 'ws');
+const PAGE_SIZE = 20;
 
 interface Notification {
     id: string;
@@ -21,11 +22,13 @@ export function NotificationBell() {
     const authFetch = usePrivateFetch();
     const router = useRouter();
     const [notifications, setNotifications] = useState<Notification[]>([]);
+    const [unreadCount, setUnreadCount] = useState(0);
     const [isOpen, setIsOpen] = useState(false);
     const [userId, setUserId] = useState<string | null>(null);
     const dropdownRef = useRef<HTMLDivElement>(null);
+    const pushedIds = useRef<Set<string>>(new Set());
 
-    // 1. Fetch initial notifications & user ID
+    // 1. Fetch user ID & unread count (one counter row, not the whole inbox)
     useEffect(() => {
         const init = async () => {
             try {
@@ -33,8 +36,8 @@ export function NotificationBell() {
                 const user = await userRes.json();
                 setUserId(user.id);
 
-                const notifRes = await authFetch(`${API_BASE_URL}/notifications`);
-                setNotifications(await notifRes.json());
+                const countRes = await authFetch(`${API_BASE_URL}/notifications/unread-count`);
+                setUnreadCount((await countRes.json()).unread);
             } catch (e) {
                 console.error(e);
             }
@@ -60,11 +63,15 @@ export function NotificationBell() {
         ws.onmessage = (event) => {
             const msg = JSON.parse(event.data);
             if (msg.type === 'notification') {
-                // Add new notification to top of list
+                // Delivery is at-least-once: a retried push carries the same id, so skip repeats
+                const id = msg.id ?? Date.now().toString();
+                if (pushedIds.current.has(id)) return;
+                pushedIds.current.add(id);
                 setNotifications(prev => [
-                    { id: Date.now().toString(), content: msg.content, link: msg.link, is_read: false, created_at: new Date().toISOString() },
-                    ...prev
+                    { id, content: msg.content, link: msg.link, is_read: false, created_at: new Date().toISOString() },
+                    ...prev.filter(n => n.id !== id)
                 ]);
+                setUnreadCount(prev => prev + 1);
                 // Optional: Play a sound here
             }
         };
@@ -72,7 +79,29 @@ export function NotificationBell() {
         return () => ws.close();
     }, [userId]);
 
-    const unreadCount = notifications.filter(n => !n.is_read).length;
+    // 3. Load the latest page only when the dropdown opens
+    useEffect(() => {
+        if (!isOpen) return;
+        const load = async () => {
+            try {
+                const res = await authFetch(`${API_BASE_URL}/notifications?limit=${PAGE_SIZE}`);
+                setNotifications((await res.json()).items);
+            } catch (e) {
+                console.error(e);
+            }
+        };
+        load();
+    }, [isOpen]);
+
+    const handleMarkAllRead = async () => {
+        await authFetch(`${API_BASE_URL}/notifications/read`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({})
+        });
+        setNotifications(prev => prev.map(item => ({ ...item, is_read: true })));
+        setUnreadCount(0);
+    };
 
     const handleClickNotification = async (n: Notification) => {
         setIsOpen(false);
@@ -82,6 +111,7 @@ export function NotificationBell() {
             // Mark as read in background
             await authFetch(`${API_BASE_URL}/notifications/${n.id}/read`, { method: 'POST' });
             setNotifications(prev => prev.map(item => item.id === n.id ? { ...item, is_read: true } : item));
+            setUnreadCount(prev => Math.max(0, prev - 1));
         }
     };
 
@@ -108,7 +138,12 @@ export function NotificationBell() {
                     >
                         <div className="p-4 border-b border-gray-100 dark:border-gray-800 font-bold text-gray-900 dark:text-white flex justify-between items-center">
                             <span>Notifications</span>
-                            {unreadCount > 0 && <span className="text-xs bg-indigo-100 dark:bg-indigo-900 text-indigo-700 dark:text-indigo-300 px-2 py-0.5 rounded-full">{unreadCount} New</span>}
+                            {unreadCount > 0 && (
+                                <div className="flex items-center gap-2">
+                                    <span className="text-xs bg-indigo-100 dark:bg-indigo-900 text-indigo-700 dark:text-indigo-300 px-2 py-0.5 rounded-full">{unreadCount} New</span>
+                                    <button onClick={handleMarkAllRead} className="text-xs font-normal text-gray-500 hover:text-indigo-600 dark:hover:text-indigo-400">Mark all read</button>
+                                </div>
+                            )}
                         </div>
 
                         <div className="max-h-80 overflow-y-auto">